@@ -0,0 +1,73 @@
+"""Markdownテーブルパーサーのベンチマーク。
+
+旧実装（行ごとの re.match + split("|")）と MarkdownTableParser を比較する。
+
+    python -m benchmarks.markdown_parser [--rows 10000] [--repeat 20]
+"""
+
+import argparse
+import re
+import statistics
+import time
+
+from src.combiner.markdown_combiner import HEADER, SEPARATOR
+from src.export.markdown_table import parse_markdown_table
+
+
+def legacy_parse_markdown_table(markdown: str) -> list[list[str]]:
+    """置き換え前の xlsx_exporter._parse_markdown_table。"""
+    rows = []
+    for line in markdown.strip().splitlines():
+        line = line.strip()
+        if not line.startswith("|"):
+            continue
+        if re.match(r"^\|[\s\-:]+\|", line):
+            continue
+        cells = [cell.strip() for cell in line.split("|")]
+        if cells and cells[0] == "":
+            cells = cells[1:]
+        if cells and cells[-1] == "":
+            cells = cells[:-1]
+        if cells:
+            rows.append(cells)
+    return rows
+
+
+def make_table(rows: int) -> str:
+    lines = [HEADER, SEPARATOR]
+    for i in range(rows):
+        lines.append(f"| 03-{i // 10000:04d}-{i % 10000:04d} | 基本料 {i % 7} | {i * 13 % 9999} | 2025年7月分 |")
+    return "\n".join(lines)
+
+
+def bench(func, markdown: str, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(markdown)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    markdown = make_table(args.rows)
+    results = {
+        "legacy": bench(legacy_parse_markdown_table, markdown, args.repeat),
+        "compiled": bench(parse_markdown_table, markdown, args.repeat),
+    }
+    for name, timings in results.items():
+        print(
+            f"{name:>8}: median={statistics.median(timings) * 1000:.2f}ms "
+            f"min={min(timings) * 1000:.2f}ms ({args.rows} rows x {args.repeat})"
+        )
+    speedup = statistics.median(results["legacy"]) / statistics.median(results["compiled"])
+    print(f" speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""process_bill / /extract のベンチマーク。
+
+Gemini・OpenAI・Google Drive をローカルの疑似バックエンドに差し替え、
+APIを呼ばずにパイプライン全体のスループットとステップごとのレイテンシを測定する。
+疑似バックエンドのレイテンシ・エラー率・応答サイズは引数で変えられる。
+
+    python -m benchmarks.pipeline --requests 100 --concurrency 8 --output bench.json
+    python -m benchmarks.pipeline --target extract --ocr-latency 0.8 --analysis-latency 1.5
+    python -m benchmarks.pipeline --analysis-throttle-rate 0.3 --analysis-retry-after 2
+
+結果のJSONはキーをソートして出力するため、リリース間で diff できる。
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Optional
+
+import httpx
+import openai
+from google.genai import errors as genai_errors
+from pypdf import PdfWriter
+
+from src.config import settings
+from src.drive import uploader
+from src.secrets.manager import secret_manager
+from src.workflow.clients import client_registry
+from src.workflow.pipeline import STEP_NAMES, PipelineEvent, process_bill
+from src.workflow.ratelimit import governor_registry
+
+TARGET_PROCESS_BILL = "process_bill"
+TARGET_EXTRACT = "extract"
+
+
+@dataclass
+class BackendProfile:
+    """疑似バックエンド1種類分の設定。latency は秒、jitter は latency に対する割合。
+
+    throttle_rate は 429 を返す割合で、retry_after 秒の Retry-After を付ける（0 なら付けない）。
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.2
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: float = 0.0
+
+    async def wait(self, rng: random.Random) -> None:
+        await asyncio.sleep(self.delay(rng))
+
+    def delay(self, rng: random.Random) -> float:
+        return max(0.0, self.latency * (1 + rng.uniform(-self.jitter, self.jitter)))
+
+    def maybe_fail(self, rng: random.Random, name: str) -> None:
+        if rng.random() < self.error_rate:
+            raise ConnectionError(f"{name}: injected failure")
+
+    def throttled(self, rng: random.Random) -> bool:
+        return rng.random() < self.throttle_rate
+
+
+@dataclass
+class BenchConfig:
+    target: str = TARGET_PROCESS_BILL
+    requests: int = 20
+    concurrency: int = 4
+    files_per_request: int = 1
+    pages: int = 2
+    ocr: BackendProfile = field(default_factory=lambda: BackendProfile(latency=0.05))
+    analysis: BackendProfile = field(default_factory=lambda: BackendProfile(latency=0.1))
+    drive: BackendProfile = field(default_factory=lambda: BackendProfile(latency=0.02))
+    ocr_chars: int = 4000
+    rows: int = 50
+    cache: bool = False
+    streaming: bool = False
+    seed: int = 0
+    # 再試行の設定（None なら API_RETRY_* の設定値）
+    retry_max_attempts: Optional[int] = None
+    retry_base_delay: Optional[float] = None
+
+
+class FakeGenaiClient:
+    """client.aio.models.generate_content だけを持つ Gemini の代用品。"""
+
+    def __init__(self, profile: BackendProfile, chars: int, rng: random.Random):
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(generate_content=self._generate_content),
+            aclose=self._aclose,
+        )
+        self._profile = profile
+        self._rng = rng
+        line = "NTT東日本 ご利用料金明細 基本料 1,800円\n"
+        self._text = (line * (chars // len(line) + 1))[:chars]
+
+    async def _generate_content(self, model: str, contents: Any, config: Any):
+        await self._profile.wait(self._rng)
+        if self._profile.throttled(self._rng):
+            details = []
+            if self._profile.retry_after:
+                details.append({
+                    "@type": "type.googleapis.com/google.rpc.RetryInfo",
+                    "retryDelay": f"{self._profile.retry_after}s",
+                })
+            raise genai_errors.ClientError(429, {
+                "error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "message": "injected", "details": details},
+            })
+        self._profile.maybe_fail(self._rng, "gemini")
+        return SimpleNamespace(text=self._text)
+
+    async def _aclose(self) -> None:
+        pass
+
+
+class FakeOpenAIClient:
+    """client.chat.completions.create（stream 対応）だけを持つ OpenAI の代用品。"""
+
+    def __init__(self, profile: BackendProfile, rows: int, rng: random.Random):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._profile = profile
+        self._rng = rng
+        self._rows = [f"| 03-0000-{i:04d} | 基本料 | {100 + i} |  |" for i in range(rows)]
+
+    async def _create(self, model: str, messages: list, stream: bool = False, **kwargs):
+        if self._profile.throttled(self._rng):
+            headers = {"retry-after": str(self._profile.retry_after)} if self._profile.retry_after else {}
+            request = httpx.Request("POST", "https://api.openai.invalid/v1/chat/completions")
+            raise openai.RateLimitError(
+                "injected", response=httpx.Response(429, headers=headers, request=request), body=None
+            )
+        if not stream:
+            await self._profile.wait(self._rng)
+            self._profile.maybe_fail(self._rng, "openai")
+            content = "\n".join(self._rows)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        self._profile.maybe_fail(self._rng, "openai")
+        return self._stream()
+
+    async def _stream(self):
+        # レイテンシを行数で割り、1行ずつチャンクとして返す
+        per_row = self._profile.delay(self._rng) / max(1, len(self._rows))
+        for row in self._rows:
+            await asyncio.sleep(per_row)
+            delta = SimpleNamespace(content=row + "\n")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeDriveService:
+    """service.files().create(...).execute() / next_chunk() を持つ Drive API の代用品。
+
+    実際の upload_to_drive と同じくスレッドプール上でブロッキングに待つ。
+    """
+
+    def __init__(self, profile: BackendProfile, rng: random.Random):
+        self._profile = profile
+        self._rng = rng
+        self._count = 0
+
+    def files(self):
+        return self
+
+    def create(self, body: dict, media_body: Any, fields: str):
+        return self
+
+    def execute(self) -> dict:
+        time.sleep(self._profile.delay(self._rng))
+        self._profile.maybe_fail(self._rng, "drive")
+        self._count += 1
+        return {"id": f"fake-{self._count}", "webViewLink": f"https://drive.invalid/fake-{self._count}"}
+
+    def next_chunk(self):
+        return None, self.execute()
+
+
+class _Patcher:
+    """属性を差し替え、終了時に元に戻す。"""
+
+    def __init__(self):
+        self._saved: list[tuple[Any, str, Any, bool]] = []
+
+    def set(self, obj: Any, name: str, value: Any) -> None:
+        had = name in vars(obj) if hasattr(obj, "__dict__") else True
+        self._saved.append((obj, name, getattr(obj, name, None), had))
+        setattr(obj, name, value)
+
+    def restore(self) -> None:
+        for obj, name, value, had in reversed(self._saved):
+            if had:
+                setattr(obj, name, value)
+            else:
+                delattr(obj, name)
+        self._saved.clear()
+
+
+class StepRecorder:
+    """PipelineEvent からステップごとの所要時間を記録する。"""
+
+    def __init__(self):
+        self.steps: dict[str, list[float]] = {name: [] for name in STEP_NAMES.values()}
+
+    def callback(self):
+        started: dict[int, float] = {}
+
+        def on_progress(event: PipelineEvent) -> None:
+            now = time.perf_counter()
+            if event.status == "started":
+                started[event.step] = now
+            elif event.status == "completed" and event.step in started:
+                self.steps[event.name].append(now - started.pop(event.step))
+
+        return on_progress
+
+
+def make_pdf(pages: int) -> bytes:
+    writer = PdfWriter()
+    for _ in range(max(1, pages)):
+        writer.add_blank_page(width=595, height=842)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    """p50/p95/p99（最近傍順位法）・平均・最大をミリ秒で返す。"""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        index = max(0, min(len(ordered) - 1, int(-(-p * len(ordered) // 100)) - 1))
+        return ordered[index]
+
+    return {
+        "count": len(ordered),
+        "p50_ms": round(rank(50) * 1000, 3),
+        "p95_ms": round(rank(95) * 1000, 3),
+        "p99_ms": round(rank(99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _install_fakes(config: BenchConfig, recorder: StepRecorder, patcher: _Patcher) -> None:
+    rng = random.Random(config.seed)
+    genai_client = FakeGenaiClient(config.ocr, config.ocr_chars, rng)
+    openai_client = FakeOpenAIClient(config.analysis, config.rows, rng)
+    drive_service = FakeDriveService(config.drive, rng)
+
+    patcher.set(client_registry, "get_genai_client", lambda api_key: genai_client)
+    patcher.set(client_registry, "get_openai_client", lambda api_key: openai_client)
+    patcher.set(uploader, "_get_drive_service", lambda: drive_service)
+    patcher.set(settings, "ocr_cache_enabled", config.cache)
+    patcher.set(settings, "analysis_cache_enabled", config.cache)
+    patcher.set(settings, "analysis_streaming", config.streaming)
+    if config.retry_max_attempts is not None:
+        patcher.set(settings, "api_retry_max_attempts", config.retry_max_attempts)
+    if config.retry_base_delay is not None:
+        patcher.set(settings, "api_retry_base_delay", config.retry_base_delay)
+    # 前回の実行で調整された同時実行数を持ち越さない
+    governor_registry.clear()
+
+    async def fake_credentials():
+        return "fake-google-key", "fake-openai-key", "fake-folder"
+
+    patcher.set(secret_manager, "get_pipeline_credentials", fake_credentials)
+
+    if config.target == TARGET_EXTRACT:
+        import src.main
+
+        # /extract 経由でもステップごとの時間を取れるよう、main から呼ぶ process_bill を包む
+        async def recorded_process_bill(*args, **kwargs):
+            kwargs.setdefault("on_progress", recorder.callback())
+            return await process_bill(*args, **kwargs)
+
+        patcher.set(src.main, "process_bill", recorded_process_bill)
+
+
+async def _run_process_bill(recorder: StepRecorder, files: list) -> bool:
+    result = await process_bill(
+        files, "fake-google-key", "fake-openai-key", "fake-folder",
+        on_progress=recorder.callback(),
+    )
+    return result.success
+
+
+async def _run_extract(client, files: list) -> bool:
+    response = await client.post(
+        "/extract",
+        files=[("files", (name, data, "application/pdf")) for name, data in files],
+    )
+    return response.status_code == 200 and response.json().get("success") is True
+
+
+async def run_benchmark(config: BenchConfig) -> dict:
+    """ベンチマークを実行して結果の辞書を返す。"""
+    recorder = StepRecorder()
+    patcher = _Patcher()
+    pdf = make_pdf(config.pages)
+    files = [(f"bench_{i}.pdf", pdf) for i in range(config.files_per_request)]
+    totals: list[float] = []
+    outcomes = {"succeeded": 0, "failed": 0}
+
+    _install_fakes(config, recorder, patcher)
+    client = None
+    try:
+        if config.target == TARGET_EXTRACT:
+            import httpx
+
+            from src.main import app
+
+            client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://bench"
+            )
+
+        semaphore = asyncio.Semaphore(max(1, config.concurrency))
+
+        async def one() -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                if client is not None:
+                    ok = await _run_extract(client, files)
+                else:
+                    ok = await _run_process_bill(recorder, files)
+                totals.append(time.perf_counter() - start)
+                outcomes["succeeded" if ok else "failed"] += 1
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(config.requests)))
+        wall = time.perf_counter() - wall_start
+    finally:
+        if client is not None:
+            await client.aclose()
+        patcher.restore()
+        throttled = {provider: g.throttled for provider, g in governor_registry.snapshot()}
+        governor_registry.clear()
+
+    return {
+        "config": asdict(config),
+        "summary": {
+            "requests": config.requests,
+            **outcomes,
+            "wall_seconds": round(wall, 3),
+            "requests_per_second": round(config.requests / wall, 3) if wall > 0 else None,
+            "throttled": throttled,
+        },
+        "latency": {
+            "total": percentiles(totals),
+            "steps": {name: percentiles(values) for name, values in recorder.steps.items()},
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+    }
+
+
+def _parse_args(argv: Optional[list[str]] = None) -> tuple[BenchConfig, Optional[str]]:
+    parser = argparse.ArgumentParser(description="process_bill / /extract のベンチマーク")
+    parser.add_argument("--target", choices=[TARGET_PROCESS_BILL, TARGET_EXTRACT], default=TARGET_PROCESS_BILL)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--files", type=int, default=1, help="1リクエストあたりのファイル数")
+    parser.add_argument("--pages", type=int, default=2, help="1ファイルあたりのPDFページ数")
+    for name, latency in (("ocr", 0.05), ("analysis", 0.1), ("drive", 0.02)):
+        parser.add_argument(f"--{name}-latency", type=float, default=latency, help="秒")
+        parser.add_argument(f"--{name}-jitter", type=float, default=0.2)
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0)
+    for name in ("ocr", "analysis"):
+        parser.add_argument(f"--{name}-throttle-rate", type=float, default=0.0, help="429を返す割合")
+        parser.add_argument(f"--{name}-retry-after", type=float, default=0.0, help="429のRetry-After（秒）")
+    parser.add_argument("--ocr-chars", type=int, default=4000, help="OCR応答の文字数")
+    parser.add_argument("--rows", type=int, default=50, help="明細分析の応答行数")
+    parser.add_argument("--cache", action="store_true", help="OCR/分析キャッシュを有効にする")
+    parser.add_argument("--streaming", action="store_true", help="ANALYSIS_STREAMING=true で実行する")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--retry-max-attempts", type=int, help="初回を含む試行回数")
+    parser.add_argument("--retry-base-delay", type=float, help="再試行のバックオフの基準（秒）")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル（省略時は標準出力）")
+    args = parser.parse_args(argv)
+
+    def profile(name: str) -> BackendProfile:
+        return BackendProfile(
+            latency=getattr(args, f"{name}_latency"),
+            jitter=getattr(args, f"{name}_jitter"),
+            error_rate=getattr(args, f"{name}_error_rate"),
+            throttle_rate=getattr(args, f"{name}_throttle_rate", 0.0),
+            retry_after=getattr(args, f"{name}_retry_after", 0.0),
+        )
+
+    config = BenchConfig(
+        target=args.target,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        files_per_request=args.files,
+        pages=args.pages,
+        ocr=profile("ocr"),
+        analysis=profile("analysis"),
+        drive=profile("drive"),
+        ocr_chars=args.ocr_chars,
+        rows=args.rows,
+        cache=args.cache,
+        streaming=args.streaming,
+        seed=args.seed,
+        retry_max_attempts=args.retry_max_attempts,
+        retry_base_delay=args.retry_base_delay,
+    )
+    return config, args.output
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    config, output = _parse_args(argv)
+    result = asyncio.run(run_benchmark(config))
+    text = json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        summary = result["summary"]
+        print(
+            f"{summary['succeeded']}/{summary['requests']} succeeded, "
+            f"{summary['requests_per_second']} req/s, "
+            f"p95={result['latency']['total'].get('p95_ms')}ms → {output}",
+            file=sys.stderr,
+        )
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
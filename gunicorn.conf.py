@@ -0,0 +1,43 @@
+"""gunicorn の設定（Dockerfile の CMD で使う）。
+
+uvicorn のワーカーをこのプロセスが使える CPU コア数（cpuset・taskset の割り当て）だけ起動する。
+ワーカー数は WEB_CONCURRENCY で変更でき、既定値は WEB_CONCURRENCY_MAX で頭打ちにする。
+アプリはワーカーごとに読み込む（preload しない）。SQLite の接続やスレッドを
+fork 前に作らないため、このファイルでは src を import しない。
+"""
+
+import os
+import shutil
+import time
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+
+def _default_workers() -> int:
+    # cpu_count() はホスト全体のコア数を返すため、コンテナに割り当てられたコア数を使う
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:  # sched_getaffinity のないプラットフォーム (macOS)
+        cores = os.cpu_count() or 1
+    return max(1, min(cores, int(os.environ.get("WEB_CONCURRENCY_MAX", "8"))))
+
+
+workers = int(os.environ.get("WEB_CONCURRENCY") or _default_workers())
+worker_class = "uvicorn.workers.UvicornWorker"
+# ワーカーの応答監視の間隔。リクエスト単位のタイムアウトではない
+timeout = 120
+graceful_timeout = 60
+keepalive = 5
+
+
+def on_starting(server):
+    """マスタープロセスの起動時に1回だけ呼ばれる。設定した環境変数はワーカーに引き継がれる。"""
+    # 再起動したワーカーが、他のワーカーで実行中のジョブを失敗扱いにしないための基準時刻
+    os.environ["SERVER_STARTED_AT"] = str(time.time())
+    # ワーカーをコア数だけ起動するため、画像前処理のプロセスプールはワーカーごとに1プロセスにする
+    os.environ.setdefault("IMAGE_PREPROCESS_WORKERS", "1")
+    # /metrics は各ワーカーがこのディレクトリに書き出した値を合算する。前回起動時の値を消しておく
+    metrics_dir = os.environ.get("METRICS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
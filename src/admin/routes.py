@@ -1,7 +1,7 @@
 import pathlib
 
 from fastapi import APIRouter, Form, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
 from src.admin.auth import (
@@ -10,8 +10,11 @@ from src.admin.auth import (
     create_admin_session,
     clear_admin_session,
 )
+from src.cache.analysis_cache import analysis_cache
+from src.cache.ocr_cache import ocr_cache
 from src.config import settings
 from src.secrets.manager import secret_manager
+from src.workflow.clients import client_registry
 
 TEMPLATES_DIR = pathlib.Path(__file__).resolve().parent.parent / "templates_jinja"
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
@@ -86,6 +89,8 @@ async def update_api_key(
         return RedirectResponse(url="/admin", status_code=303)
 
     success = await secret_manager.set_secret(secret_id, key_value.strip())
+    if success:
+        client_registry.invalidate()
     message = "APIキーを更新しました" if success else "APIキーの更新に失敗しました"
 
     keys_status = await secret_manager.check_keys_configured()
@@ -140,6 +145,16 @@ async def update_drive_folder(
     )
 
 
+@admin_router.get("/api/cache")
+async def cache_stats(request: Request):
+    """キャッシュのヒット/ミス件数を返す。"""
+    if not verify_admin_session(request):
+        return JSONResponse(content={"error": "unauthorized"}, status_code=401)
+    return JSONResponse(
+        content={"ocr": ocr_cache.stats(), "analysis": analysis_cache.stats()}
+    )
+
+
 @admin_router.post("/logout")
 async def admin_logout():
     """管理者セッションをクリアしてログアウトする。"""
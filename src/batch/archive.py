@@ -0,0 +1,200 @@
+import io
+import json
+import logging
+import posixpath
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+from src.config import settings
+from src.workflow.uploads import FileContent
+from src.workflow.validation import validate_upload_filenames
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+ARCHIVE_EXTENSION = ".zip"
+
+ERROR_MESSAGE_NOT_ZIP = "バッチ抽出にはZIPファイルを1つアップロードしてください。"
+ERROR_MESSAGE_BROKEN_ZIP = "ZIPファイルを読み込めませんでした。"
+ERROR_MESSAGE_NO_GROUPS = "ZIPファイルに明細書が含まれていません。"
+
+
+class BatchRejectedError(Exception):
+    """バッチを受け付けられない場合のエラー。メッセージはユーザー向け。"""
+    pass
+
+
+@dataclass
+class BatchGroup:
+    """1回の process_bill で処理するファイルのまとまり（顧客ごとの明細書セットなど）。
+
+    ファイル内容は処理の直前に load() で ZIP から読み出す。
+    """
+
+    name: str
+    members: list[str]
+    archive: zipfile.ZipFile
+
+    def load(self) -> list[tuple[str, FileContent]]:
+        return [(posixpath.basename(m), self.archive.read(m)) for m in self.members]
+
+
+class _MmapReader(io.RawIOBase):
+    """メモリマップを zipfile に渡すための読み取り専用ファイル（内容をコピーしない）。"""
+
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        self._view.release()
+        super().close()
+
+
+class _BatchZipFile(zipfile.ZipFile):
+    """close() で読み込み元のファイルも閉じる ZipFile。
+
+    zipfile は渡されたファイルオブジェクトを閉じないため、メモリマップへの参照が残り
+    アップロードのスプールファイルを閉じられなくなるのを防ぐ。
+    """
+
+    def __init__(self, fileobj: BinaryIO):
+        self._source = fileobj
+        super().__init__(fileobj, metadata_encoding="cp932")
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._source.close()
+
+
+def validate_archive_filenames(filenames: list[str]) -> Optional[str]:
+    """POST /batches のアップロードが ZIP ファイル1つであることを検証する。"""
+    if len(filenames) != 1 or not filenames[0].lower().endswith(ARCHIVE_EXTENSION):
+        return ERROR_MESSAGE_NOT_ZIP
+    return None
+
+
+def _is_ignored(name: str) -> bool:
+    """macOS の __MACOSX/ や .DS_Store などの付随ファイル。"""
+    parts = name.split("/")
+    return parts[0] == "__MACOSX" or any(p.startswith(".") for p in parts)
+
+
+def open_batch_archive(content: FileContent, archive_name: str) -> tuple[zipfile.ZipFile, list[BatchGroup]]:
+    """ZIPを開いてグループに分ける。
+
+    manifest.json がある場合はその定義に従う::
+
+        {"groups": [{"name": "顧客A", "files": ["a/請求書1.pdf", "a/請求書2.pdf"]}, ...]}
+
+    ない場合は最上位のフォルダごとに1グループとし、最上位に直接置かれたファイルは
+    ZIPのファイル名のグループにまとめる。ファイル名が UTF-8 でない ZIP（Windows の
+    エクスプローラーで作成したもの）は CP932 として読む。
+
+    Returns:
+        (ZipFile, グループのリスト)。ZipFile はすべてのグループの処理後に呼び出し側で閉じる
+
+    Raises:
+        BatchRejectedError: ZIPが壊れている、グループ数・ファイル数・展開後サイズが上限を超える場合
+    """
+    fileobj: BinaryIO = io.BytesIO(content) if isinstance(content, bytes) else _MmapReader(content)
+    try:
+        archive = _BatchZipFile(fileobj)
+    except (zipfile.BadZipFile, OSError) as e:
+        fileobj.close()
+        raise BatchRejectedError(ERROR_MESSAGE_BROKEN_ZIP) from e
+    try:
+        groups = _read_groups(archive, archive_name)
+    except BaseException:
+        archive.close()
+        raise
+    return archive, groups
+
+
+def _read_groups(archive: zipfile.ZipFile, archive_name: str) -> list[BatchGroup]:
+    infos = {
+        info.filename: info
+        for info in archive.infolist()
+        if not info.is_dir() and not _is_ignored(info.filename)
+    }
+
+    if MANIFEST_NAME in infos:
+        layout = _read_manifest(archive, infos)
+    else:
+        layout = {}
+        default_name = posixpath.splitext(posixpath.basename(archive_name))[0] or "batch"
+        for name in infos:
+            group = name.split("/", 1)[0] if "/" in name else default_name
+            layout.setdefault(group, []).append(name)
+
+    if not layout:
+        raise BatchRejectedError(ERROR_MESSAGE_NO_GROUPS)
+    if len(layout) > settings.batch_max_groups:
+        raise BatchRejectedError(f"グループは1回のバッチで{settings.batch_max_groups}件までです。")
+
+    total = 0
+    for group, members in layout.items():
+        error_message = validate_upload_filenames(members)
+        if error_message:
+            raise BatchRejectedError(f"{group}: {error_message}")
+        for member in members:
+            size = infos[member].file_size
+            if size > settings.max_upload_file_bytes:
+                max_file_mb = settings.max_upload_file_bytes // (1024 * 1024)
+                raise BatchRejectedError(
+                    f"ファイルサイズは1ファイルあたり{max_file_mb}MBまでです: {member}"
+                )
+            total += size
+    if total > settings.batch_max_uncompressed_bytes:
+        max_mb = settings.batch_max_uncompressed_bytes // (1024 * 1024)
+        raise BatchRejectedError(f"ZIPの展開後の合計サイズは{max_mb}MBまでです。")
+
+    logger.info("バッチZIPを読み込みました: groups=%d, files=%d", len(layout), len(infos))
+    return [BatchGroup(name, members, archive) for name, members in layout.items()]
+
+
+def _read_manifest(archive: zipfile.ZipFile, infos: dict[str, zipfile.ZipInfo]) -> dict[str, list[str]]:
+    try:
+        data = json.loads(archive.read(MANIFEST_NAME).decode("utf-8"))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise BatchRejectedError(f"{MANIFEST_NAME} を読み込めませんでした: {e}") from e
+    groups = data.get("groups") if isinstance(data, dict) else None
+    if not isinstance(groups, list):
+        raise BatchRejectedError(f"{MANIFEST_NAME} に groups のリストがありません。")
+
+    layout: dict[str, list[str]] = {}
+    for i, group in enumerate(groups):
+        name = group.get("name") if isinstance(group, dict) else None
+        files = group.get("files") if isinstance(group, dict) else None
+        if not isinstance(name, str) or not name.strip() or not isinstance(files, list) or not files:
+            raise BatchRejectedError(f"{MANIFEST_NAME}: groups[{i}] には name と files を指定してください。")
+        if name in layout:
+            raise BatchRejectedError(f"{MANIFEST_NAME}: グループ名が重複しています: {name}")
+        for member in files:
+            if member not in infos:
+                raise BatchRejectedError(f"{MANIFEST_NAME}: ZIPにないファイルです: {member}")
+        layout[name] = list(files)
+    return layout
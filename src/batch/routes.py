@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from src.batch.archive import BatchRejectedError, open_batch_archive, validate_archive_filenames
+from src.batch.scheduler import OUTPUT_FILES, OUTPUT_MODES, BatchQueueFullError, batch_scheduler
+from src.config import settings
+from src.jobs.routes import ERROR_MESSAGE_JOB_NOT_FOUND, ERROR_MESSAGE_QUEUE_FULL
+from src.secrets.manager import secret_manager
+from src.workflow.pipeline import ERROR_MESSAGE_KEYS_NOT_CONFIGURED
+from src.workflow.uploads import UploadRejectedError, close_uploads, receive_uploads
+
+ERROR_MESSAGE_INVALID_OUTPUT = "output には files または sheets を指定してください。"
+
+batches_router = APIRouter(prefix="/batches", tags=["batches"])
+
+
+@batches_router.post("")
+async def submit_batch(request: Request, output: str = OUTPUT_FILES):
+    """明細書セットをまとめたZIP (multipart の archive フィールド) を受け取り、バッチとして登録する。
+
+    ZIPの最上位フォルダ（または manifest.json の groups）ごとに process_bill を実行する。
+    output=files はグループごとにXLSXを1ファイル、output=sheets はグループごとのシートを持つ
+    ワークブック1ファイルをDriveに保存する。進捗は GET /batches/{id} と /jobs/{id}/events で取得できる。
+    """
+    if output not in OUTPUT_MODES:
+        return JSONResponse(content={"success": False, "error_message": ERROR_MESSAGE_INVALID_OUTPUT})
+
+    google_key, openai_key, drive_folder_id = await secret_manager.get_pipeline_credentials()
+    if not google_key or not openai_key:
+        return JSONResponse(
+            content={"success": False, "error_message": ERROR_MESSAGE_KEYS_NOT_CONFIGURED}
+        )
+
+    try:
+        uploads = await receive_uploads(
+            request,
+            field_name="archive",
+            validate=validate_archive_filenames,
+            max_file_bytes=settings.batch_max_upload_bytes,
+            max_request_bytes=settings.batch_max_upload_bytes,
+        )
+    except UploadRejectedError as e:
+        return JSONResponse(content={"success": False, "error_message": str(e)})
+
+    archive = None
+    try:
+        archive, groups = open_batch_archive(uploads[0].content(), uploads[0].filename)
+
+        def cleanup() -> None:
+            archive.close()
+            close_uploads(uploads)
+
+        job = batch_scheduler.submit(
+            groups, google_key, openai_key, drive_folder_id, output, cleanup=cleanup
+        )
+    except BatchRejectedError as e:
+        close_uploads(uploads)
+        return JSONResponse(content={"success": False, "error_message": str(e)})
+    except BatchQueueFullError:
+        archive.close()
+        close_uploads(uploads)
+        return JSONResponse(
+            content={"success": False, "error_message": ERROR_MESSAGE_QUEUE_FULL},
+            status_code=503,
+        )
+
+    return JSONResponse(
+        content={
+            "success": True,
+            "job_id": job.id,
+            "status": job.status,
+            "groups": [group.name for group in groups],
+        },
+        status_code=202,
+    )
+
+
+@batches_router.get("/{job_id}")
+async def get_batch(job_id: str):
+    """バッチ全体とグループごとの状態を返す。
+
+    終了したバッチと別のワーカーで実行中のバッチは、保存済みの結果（実行中なら
+    最後にグループが完了した時点の状態）を返す。
+    """
+    job = batch_scheduler.store.get(job_id)
+    if job is None:
+        return JSONResponse(
+            content={"success": False, "error_message": ERROR_MESSAGE_JOB_NOT_FOUND},
+            status_code=404,
+        )
+    detail = job.result if job.finished else (batch_scheduler.status(job_id) or job.result)
+    return JSONResponse(content={"job_id": job.id, "status": job.status, "batch": detail})
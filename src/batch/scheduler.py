@@ -0,0 +1,298 @@
+import asyncio
+import io
+import logging
+import uuid
+import zipfile
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional
+
+from src.batch.archive import ERROR_MESSAGE_BROKEN_ZIP, BatchGroup
+from src.config import settings
+from src.drive.uploader import DriveUploadError, generate_filename, upload_to_drive_async
+from src.export.xlsx_exporter import sheets_to_xlsx_file
+from src.jobs.events import job_events
+from src.jobs.queue import job_queue
+from src.jobs.store import (
+    JOB_STATUS_FAILED,
+    JOB_STATUS_RUNNING,
+    JOB_STATUS_SUCCEEDED,
+    Job,
+    JobStore,
+)
+from src.workflow.pipeline import (
+    ERROR_MESSAGE_DRIVE_UPLOAD,
+    ERROR_MESSAGE_UNKNOWN,
+    PipelineEvent,
+    process_bill,
+)
+
+logger = logging.getLogger(__name__)
+
+# グループごとにXLSXを1ファイルずつ作る / 1つのワークブックにグループごとのシートを作る
+OUTPUT_FILES = "files"
+OUTPUT_SHEETS = "sheets"
+OUTPUT_MODES = (OUTPUT_FILES, OUTPUT_SHEETS)
+
+GROUP_STATUS_QUEUED = "queued"
+GROUP_STATUS_RUNNING = "running"
+GROUP_STATUS_SUCCEEDED = "succeeded"
+GROUP_STATUS_FAILED = "failed"
+
+
+class BatchQueueFullError(Exception):
+    pass
+
+
+@dataclass
+class GroupState:
+    name: str
+    status: str = GROUP_STATUS_QUEUED
+    drive_url: Optional[str] = None
+    filename: Optional[str] = None
+    error_message: Optional[str] = None
+    row_count: Optional[int] = None
+
+
+@dataclass
+class _Batch:
+    job: Job
+    groups: list[BatchGroup]
+    output: str
+    google_api_key: str
+    openai_api_key: str
+    drive_folder_id: str
+    cleanup: Optional[Callable[[], None]] = None
+    states: list[GroupState] = field(default_factory=list)
+    # シート出力用のグループごとの結合済み行
+    rows: dict[int, list[str]] = field(default_factory=dict)
+    next_index: int = 0
+    finished: int = 0
+    drive_url: Optional[str] = None
+    filename: Optional[str] = None
+    error_message: Optional[str] = None
+
+    @property
+    def has_pending(self) -> bool:
+        return self.next_index < len(self.groups)
+
+
+class BatchScheduler:
+    """多数のグループをまとめて処理するバッチの実行器。
+
+    すべてのバッチのグループを batch_concurrency 個のワーカーで並列に処理する。
+    ワーカーは実行中のバッチから1グループずつ順番に取り出すため、大きなバッチが
+    先に登録されていても後から来た小さなバッチが待たされ続けることはない。
+
+    バッチは JobStore のジョブとして保存するため、状態と結果は GET /jobs/{id}、
+    /jobs/{id}/result、/jobs/{id}/events でも参照できる。
+    """
+
+    def __init__(self, store: JobStore, concurrency: int, max_active: int):
+        self.store = store
+        self._concurrency = max(1, concurrency)
+        self._max_active = max_active
+        self._active: deque[_Batch] = deque()
+        self._batches: dict[str, _Batch] = {}
+        self._ready: Optional[asyncio.Semaphore] = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._ready = asyncio.Semaphore(0)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._concurrency)]
+        logger.info("バッチワーカー起動: concurrency=%d", self._concurrency)
+
+    async def stop(self) -> None:
+        """ワーカーを停止し、未完了のバッチを失敗扱いにしてリソースを解放する。"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for batch in list(self._batches.values()):
+            batch.error_message = ERROR_MESSAGE_UNKNOWN
+            self._finish(batch)
+        self._active.clear()
+
+    def submit(
+        self,
+        groups: list[BatchGroup],
+        google_api_key: str,
+        openai_api_key: str,
+        drive_folder_id: str,
+        output: str = OUTPUT_FILES,
+        cleanup: Optional[Callable[[], None]] = None,
+    ) -> Job:
+        """バッチを登録する。
+
+        Raises:
+            BatchQueueFullError: 実行中のバッチ数が上限に達している場合
+        """
+        if self._ready is None:
+            raise RuntimeError("BatchScheduler が起動していません")
+        if output not in OUTPUT_MODES:
+            raise ValueError(f"不明な出力形式です: {output}")
+        if len(self._batches) >= self._max_active:
+            raise BatchQueueFullError("実行中のバッチが多すぎます")
+
+        job = Job(id=uuid.uuid4().hex)
+        self.store.create(job)
+        job_events.open(job.id)
+        batch = _Batch(
+            job, groups, output, google_api_key, openai_api_key, drive_folder_id, cleanup,
+            states=[GroupState(group.name) for group in groups],
+        )
+        self._batches[job.id] = batch
+        self._active.append(batch)
+        for _ in groups:
+            self._ready.release()
+        logger.info("バッチ登録: job_id=%s, groups=%d, output=%s", job.id, len(groups), output)
+        return job
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """実行中のバッチの状態を返す。このプロセスで実行中でない場合は None。"""
+        batch = self._batches.get(job_id)
+        return _batch_result(batch) if batch is not None else None
+
+    def _take(self) -> tuple[_Batch, int]:
+        """次に処理するグループを取り出す。バッチを順に回して1グループずつ取る。"""
+        while True:
+            batch = self._active.popleft()
+            if not batch.has_pending:
+                continue
+            index = batch.next_index
+            batch.next_index += 1
+            if batch.has_pending:
+                self._active.append(batch)
+            return batch, index
+
+    async def _worker(self) -> None:
+        assert self._ready is not None
+        while True:
+            await self._ready.acquire()
+            batch, index = self._take()
+            try:
+                await self._run_group(batch, index)
+            except Exception:
+                logger.exception("バッチのグループ処理中に予期しないエラー: job_id=%s", batch.job.id)
+                state = batch.states[index]
+                state.status = GROUP_STATUS_FAILED
+                state.error_message = ERROR_MESSAGE_UNKNOWN
+            batch.finished += 1
+            batch.job.step = batch.finished
+            # 途中経過も保存し、別のワーカーの GET /batches/{id} からも参照できるようにする
+            batch.job.result = _batch_result(batch)
+            self.store.update(batch.job)
+            job_events.publish(batch.job.id, {"event": "group", "index": index, **asdict(batch.states[index])})
+            if batch.finished == len(batch.groups):
+                await self._complete(batch)
+
+    async def _run_group(self, batch: _Batch, index: int) -> None:
+        group = batch.groups[index]
+        state = batch.states[index]
+        state.status = GROUP_STATUS_RUNNING
+        if batch.job.status != JOB_STATUS_RUNNING:
+            batch.job.status = JOB_STATUS_RUNNING
+            self.store.update(batch.job)
+        job_events.publish(batch.job.id, {"event": "group", "index": index, **asdict(state)})
+
+        def on_progress(event: PipelineEvent) -> None:
+            # 明細行ごとのイベントはバッチでは配信しない
+            if event.status != "row":
+                job_events.publish(
+                    batch.job.id, {"event": "progress", "group": group.name, **event.to_dict()}
+                )
+
+        # ZIPからの読み出しと展開はスレッドで行う
+        try:
+            files = await asyncio.to_thread(group.load)
+        except (zipfile.BadZipFile, OSError, EOFError) as e:
+            logger.warning("バッチのファイルを展開できませんでした: %s: %s", group.name, e)
+            state.status = GROUP_STATUS_FAILED
+            state.error_message = ERROR_MESSAGE_BROKEN_ZIP
+            return
+        result = await process_bill(
+            files,
+            batch.google_api_key,
+            batch.openai_api_key,
+            batch.drive_folder_id,
+            on_progress=on_progress,
+            filename_base=f"{settings.output_filename}_{group.name}",
+            collect_rows=batch.output == OUTPUT_SHEETS,
+        )
+        state.status = GROUP_STATUS_SUCCEEDED if result.success else GROUP_STATUS_FAILED
+        state.drive_url = result.drive_url
+        state.filename = result.filename
+        state.error_message = result.error_message
+        if result.rows is not None:
+            batch.rows[index] = result.rows
+            state.row_count = max(0, len(result.rows) - 2)
+
+    async def _complete(self, batch: _Batch) -> None:
+        if batch.output == OUTPUT_SHEETS and batch.rows:
+            try:
+                await self._upload_sheets(batch)
+            except Exception as e:
+                logger.error("バッチのXLSXアップロードに失敗しました: job_id=%s: %s", batch.job.id, e)
+                batch.error_message = (
+                    ERROR_MESSAGE_DRIVE_UPLOAD if isinstance(e, DriveUploadError) else ERROR_MESSAGE_UNKNOWN
+                )
+        self._finish(batch)
+
+    async def _upload_sheets(self, batch: _Batch) -> None:
+        sheets = [
+            (batch.groups[i].name, batch.rows[i]) for i in range(len(batch.groups)) if i in batch.rows
+        ]
+        xlsx_file = await asyncio.to_thread(sheets_to_xlsx_file, sheets)
+        try:
+            size = xlsx_file.seek(0, io.SEEK_END)
+            xlsx_file.seek(0)
+            filename = generate_filename(f"{settings.output_filename}_バッチ")
+            batch.drive_url = await upload_to_drive_async(xlsx_file, batch.drive_folder_id, filename)
+            batch.filename = filename
+        finally:
+            xlsx_file.close()
+        logger.info("バッチのXLSXをアップロードしました: sheets=%d, size=%d", len(sheets), size)
+
+    def _finish(self, batch: _Batch) -> None:
+        self._batches.pop(batch.job.id, None)
+        result = _batch_result(batch)
+        batch.job.status = JOB_STATUS_SUCCEEDED if result["success"] else JOB_STATUS_FAILED
+        batch.job.result = result
+        self.store.update(batch.job)
+        job_events.publish(batch.job.id, {"event": "result", "status": batch.job.status, "result": result})
+        job_events.close(batch.job.id)
+        batch.rows.clear()
+        if batch.cleanup is not None:
+            try:
+                batch.cleanup()
+            except Exception:
+                logger.warning("バッチのリソース解放に失敗しました: job_id=%s", batch.job.id, exc_info=True)
+        logger.info(
+            "バッチ終了: job_id=%s, succeeded=%d, failed=%d",
+            batch.job.id, result["succeeded"], result["failed"],
+        )
+
+
+def _batch_result(batch: _Batch) -> dict:
+    """バッチの結果。1グループでも成功し、シート出力のアップロードも成功した場合を成功とする。"""
+    succeeded = sum(1 for s in batch.states if s.status == GROUP_STATUS_SUCCEEDED)
+    failed = sum(1 for s in batch.states if s.status == GROUP_STATUS_FAILED)
+    finished = succeeded + failed == len(batch.states)
+    success = succeeded > 0 and batch.error_message is None
+    if batch.output == OUTPUT_SHEETS and finished:
+        success = success and batch.drive_url is not None
+    return {
+        "success": success,
+        "output": batch.output,
+        "total": len(batch.states),
+        "succeeded": succeeded,
+        "failed": failed,
+        "drive_url": batch.drive_url,
+        "filename": batch.filename,
+        "error_message": batch.error_message,
+        "groups": [asdict(s) for s in batch.states],
+    }
+
+
+# シングルトンインスタンス（ジョブと同じストアに保存する）
+batch_scheduler = BatchScheduler(job_queue.store, settings.batch_concurrency, settings.batch_max_active)
@@ -0,0 +1,33 @@
+import hashlib
+from typing import Optional
+
+from src.cache.store import TieredCache
+from src.config import settings
+from src.workflow.analyzer import ANALYSIS_MODEL, PROMPT_MAP
+from src.workflow.router import CompanyType
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_analysis_cache_key(
+    ocr_text: str, company: CompanyType, prompt: Optional[str] = None
+) -> str:
+    """OCRテキストのハッシュ・会社タイプ・その会社のシステムプロンプトのハッシュからキーを作る。
+
+    プロンプトを編集するとその会社のキーだけが変わるため、他社のエントリは有効なまま残る。
+    古いキーのエントリはTTLまたは容量上限で削除される。
+    prompt を省略した場合は PROMPT_MAP の会社別プロンプトを使う。
+    """
+    prompt_hash = _sha256(PROMPT_MAP[company] if prompt is None else prompt)[:12]
+    return f"{company.value}:{ANALYSIS_MODEL}:{prompt_hash}:{_sha256(ocr_text)}"
+
+
+analysis_cache = TieredCache(
+    namespace="analysis",
+    max_entries=settings.analysis_cache_max_entries,
+    disk_path=settings.analysis_cache_path,
+    disk_max_bytes=settings.analysis_cache_max_bytes,
+    ttl_seconds=settings.analysis_cache_ttl_seconds,
+)
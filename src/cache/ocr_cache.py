@@ -0,0 +1,47 @@
+import hashlib
+
+from src.cache.store import TieredCache
+from src.config import settings
+from src.prompts.ocr_prompt import SYSTEM_PROMPT
+from src.workflow.ocr import OCR_MODEL
+from src.workflow.uploads import FileContent
+
+# プロンプトを編集すると自動的に別キーになる
+OCR_PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+def _ocr_settings_fingerprint() -> str:
+    """OCR結果を変える設定（分割モード・画像の前処理）。変更すると別キーになる。"""
+    split = (
+        f"split:{settings.ocr_pdf_pages_per_chunk}" if settings.ocr_split_mode else "whole"
+    )
+    if settings.image_preprocess_enabled:
+        preprocess = (
+            f"pre:{settings.image_max_side}:{settings.image_jpeg_quality}"
+            f":{settings.image_preprocess_min_bytes}"
+        )
+    else:
+        preprocess = "raw"
+    return f"{split}\0{preprocess}"
+
+
+def make_ocr_cache_key(files: list[tuple[str, FileContent]]) -> str:
+    """各ファイルのSHA-256・OCRプロンプトのバージョン・モデル名・OCR関連の設定からキャッシュキーを作る。
+
+    ファイル名はMIMEタイプ判定のため拡張子のみキーに含める。
+    """
+    h = hashlib.sha256()
+    h.update(f"{OCR_MODEL}\0{OCR_PROMPT_VERSION}\0{_ocr_settings_fingerprint()}\0".encode("utf-8"))
+    for filename, content in files:
+        ext = filename.lower().rsplit(".", 1)[-1] if "." in filename else ""
+        h.update(f"{ext}\0".encode("utf-8"))
+        h.update(hashlib.sha256(content).digest())
+    return h.hexdigest()
+
+
+ocr_cache = TieredCache(
+    namespace="ocr",
+    max_entries=settings.ocr_cache_max_entries,
+    disk_path=settings.ocr_cache_path,
+    disk_max_bytes=settings.ocr_cache_max_bytes,
+)
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TieredCache:
+    """インメモリLRU層と任意のSQLiteディスク層を持つ文字列キャッシュ。
+
+    ディスク層は disk_path を指定した場合のみ有効になり、
+    合計サイズが disk_max_bytes を超えると最終アクセスが古い順に削除する。
+    ttl_seconds が正の場合、保存から ttl_seconds 経過したエントリは無効になる。
+
+    ディスク層は WAL モードで開くため、同じファイルを複数のワーカープロセスで共有でき、
+    あるワーカーが保存したエントリを他のワーカーもディスク層から読める。
+    private=True の場合はファイルを所有者だけが読み書きできる権限にする（シークレット用）。
+
+    ディスク層の読み込みは SELECT だけで書き込みトランザクションを発生させない。
+    最終アクセス時刻は読み込み時に記録しておき、次の書き込み時にまとめて更新する。
+    イベントループからは aget / aget_entry / aset を使い、ディスク層の処理をスレッドで行う。
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        max_entries: int,
+        disk_path: str = "",
+        disk_max_bytes: int = 0,
+        ttl_seconds: float = 0,
+        private: bool = False,
+    ):
+        self.namespace = namespace
+        self._max_entries = max(1, max_entries)
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        # メモリ層とディスク層でロックを分け、ディスクの待ちがメモリ層の参照を止めないようにする
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_path = disk_path
+        self._disk_max_bytes = disk_max_bytes
+        self._ttl = ttl_seconds
+        self._private = private
+        self._conn: Optional[sqlite3.Connection] = None
+        # 次の書き込み時に accessed_at を更新するキーと参照時刻
+        self._touched: dict[str, float] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _get_conn(self) -> Optional[sqlite3.Connection]:
+        if not self._disk_path:
+            return None
+        if self._conn is None:
+            if self._private:
+                _create_private_files(self._disk_path)
+            conn = sqlite3.connect(self._disk_path, timeout=10.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # キャッシュなので電源断時に直近の書き込みを失っても構わない
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュ値を取得する。メモリ層→ディスク層の順に探す。"""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str) -> Optional[tuple[str, float]]:
+        """キャッシュ値と保存時刻 (time.time()) を取得する。"""
+        entry = self._memory_get(key)
+        if entry is not None:
+            return entry
+        return self._promote(key, self._disk_get(key))
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get の非同期版。メモリ層にない場合のみディスク層をスレッドで読む。"""
+        entry = await self.aget_entry(key)
+        return entry[0] if entry is not None else None
+
+    async def aget_entry(self, key: str) -> Optional[tuple[str, float]]:
+        """get_entry の非同期版。"""
+        entry = self._memory_get(key)
+        if entry is not None:
+            return entry
+        if not self._disk_path:
+            return self._promote(key, None)
+        return self._promote(key, await asyncio.to_thread(self._disk_get, key))
+
+    def set(self, key: str, value: str) -> None:
+        """キャッシュ値を保存する。"""
+        now = time.time()
+        with self._lock:
+            self._memory_set(key, value, now)
+        self._disk_set(key, value, now)
+
+    async def aset(self, key: str, value: str) -> None:
+        """set の非同期版。ディスク層への書き込みはスレッドで行う。"""
+        now = time.time()
+        with self._lock:
+            self._memory_set(key, value, now)
+        if self._disk_path:
+            await asyncio.to_thread(self._disk_set, key, value, now)
+
+    def clear(self) -> None:
+        """全エントリを削除する。"""
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+        with self._disk_lock:
+            conn = self._get_conn()
+            if conn is not None:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+                conn.commit()
+
+    def stats(self) -> dict[str, int]:
+        """ヒット/ミス件数とエントリ数を返す。"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self._ttl > 0 and time.time() - created_at >= self._ttl
+
+    def _memory_get(self, key: str) -> Optional[tuple[str, float]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if self._is_expired(entry[1]):
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            if self._disk_path:
+                self._touched[key] = time.time()
+            return entry
+
+    def _promote(
+        self, key: str, disk_entry: Optional[tuple[str, float]]
+    ) -> Optional[tuple[str, float]]:
+        """ディスク層の参照結果を集計し、ヒットした場合はメモリ層に載せる。"""
+        with self._lock:
+            if disk_entry is None:
+                self.misses += 1
+                return None
+            self._memory_set(key, disk_entry[0], disk_entry[1])
+            self._touched[key] = time.time()
+            self.hits += 1
+            self.disk_hits += 1
+            return disk_entry
+
+    def _memory_set(self, key: str, value: str, created_at: float) -> None:
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[tuple[str, float]]:
+        """ディスク層を読む（SELECT のみ）。期限切れのエントリは次の書き込み時に削除する。"""
+        with self._disk_lock:
+            conn = self._get_conn()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning("キャッシュ読み込み失敗 (%s): %s", self.namespace, e)
+                return None
+        if row is None or self._is_expired(row[1]):
+            return None
+        return row[0], row[1]
+
+    def _disk_set(self, key: str, value: str, created_at: float) -> None:
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        size = len(value.encode("utf-8"))
+        with self._disk_lock:
+            conn = self._get_conn()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries"
+                    " (namespace, key, value, size, created_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.namespace, key, value, size, created_at, created_at),
+                )
+                if touched:
+                    conn.executemany(
+                        "UPDATE cache_entries SET accessed_at = MAX(accessed_at, ?)"
+                        " WHERE namespace = ? AND key = ?",
+                        [(at, self.namespace, k) for k, at in touched.items()],
+                    )
+                if self._ttl > 0:
+                    conn.execute(
+                        "DELETE FROM cache_entries WHERE namespace = ? AND created_at <= ?",
+                        (self.namespace, time.time() - self._ttl),
+                    )
+                self._evict_disk(conn)
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.warning("キャッシュ書き込み失敗 (%s): %s", self.namespace, e)
+
+    def _evict_disk(self, conn: sqlite3.Connection) -> None:
+        """ディスク層の合計サイズが上限を超えていれば古いエントリから削除する。"""
+        if self._disk_max_bytes <= 0:
+            return
+        (total,) = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchone()
+        if total <= self._disk_max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY accessed_at",
+            (self.namespace,),
+        ).fetchall()
+        for key, size in rows:
+            if total <= self._disk_max_bytes:
+                break
+            conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            )
+            total -= size
+
+
+def _create_private_files(path: str) -> None:
+    """SQLite が開く前に、データベースと WAL・共有メモリファイルを所有者だけが読み書きできる
+    権限 (0600) で作る。umask の既定権限で作られて一瞬でも他のユーザーに読めることがないようにし、
+    既存のファイルの権限も 0600 に揃える。"""
+    for name in (path, f"{path}-wal", f"{path}-shm"):
+        fd = os.open(name, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            os.fchmod(fd, 0o600)
+        finally:
+            os.close(fd)
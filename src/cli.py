@@ -0,0 +1,306 @@
+"""ローカルフォルダの明細書を一括で処理するコマンドラインツール。
+
+フォルダ以下の PDF/画像を OCR・会社判定・明細分析にかけ、XLSX を出力フォルダに書き出す。
+Google Drive にはアップロードしない。処理済みの単位はチェックポイントファイルに記録し、
+途中で止まっても同じコマンドを再実行すれば続きから処理する。
+
+    python -m src.cli ./bills ./out --workers 8
+    python -m src.cli ./bills ./out --group-by dir --checkpoint ./out/checkpoint.jsonl
+
+1ファイルを1つの明細書として処理する（--group-by file、既定）か、
+同じフォルダのファイルをまとめて1つの明細書セットとして処理する（--group-by dir）。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+from src.config import settings
+from src.export.xlsx_exporter import write_xlsx
+from src.secrets.manager import secret_manager
+from src.tracing.tracer import tracer
+from src.workflow.clients import client_registry
+from src.workflow.pipeline import ERROR_MESSAGE_KEYS_NOT_CONFIGURED, process_bill
+from src.workflow.preprocess import shutdown_preprocess_pool
+from src.workflow.validation import ALLOWED_EXTENSIONS, validate_upload_filenames
+
+logger = logging.getLogger(__name__)
+
+GROUP_BY_FILE = "file"
+GROUP_BY_DIR = "dir"
+
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+CHECKPOINT_NAME = ".meisaisyo-checkpoint.jsonl"
+
+
+@dataclass
+class WorkUnit:
+    """1回の process_bill で処理する単位。key は入力フォルダからの相対パス。"""
+
+    key: str
+    paths: list[Path]
+    output: Path
+
+    def fingerprint(self) -> list[list]:
+        """入力ファイルの (名前, サイズ, 更新日時)。変わっていれば処理済みでも再処理する。"""
+        result = []
+        for path in self.paths:
+            stat = path.stat()
+            result.append([path.name, stat.st_size, stat.st_mtime_ns])
+        return result
+
+
+@dataclass
+class CheckpointRecord:
+    key: str
+    status: str
+    fingerprint: list
+    output: Optional[str] = None
+    error_message: Optional[str] = None
+    seconds: Optional[float] = None
+
+
+class Checkpoint:
+    """処理結果を1行1件の JSON で追記するチェックポイントファイル。
+
+    レコードごとに fsync するため、クラッシュしても失われるのは書き込み途中の1行だけで、
+    読み込み時に壊れた行は無視する。同じ key のレコードは後のものが優先される。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.records: dict[str, CheckpointRecord] = {}
+        self._file = None
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = CheckpointRecord(**json.loads(line))
+                except (ValueError, TypeError):
+                    logger.warning("チェックポイントの壊れた行を無視しました: %r", line[:80])
+                    continue
+                self.records[record.key] = record
+
+    def is_done(self, unit: WorkUnit) -> bool:
+        record = self.records.get(unit.key)
+        return (
+            record is not None
+            and record.status == STATUS_SUCCEEDED
+            and record.fingerprint == unit.fingerprint()
+            and unit.output.exists()
+        )
+
+    def append(self, record: CheckpointRecord) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.records[record.key] = record
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _is_supported(path: Path) -> bool:
+    return path.suffix.lower() in ALLOWED_EXTENSIONS and not path.name.startswith(".")
+
+
+def iter_units(input_dir: Path, output_dir: Path, group_by: str) -> Iterator[WorkUnit]:
+    """入力フォルダを走査して処理単位を順に返す（フォルダ全体を先に読み込まない）。
+
+    出力先は入力フォルダと同じ構成で、拡張子を .xlsx にしたパス。
+    --group-by dir の場合はフォルダ名の .xlsx（入力フォルダ直下は入力フォルダ名）。
+    """
+    for dirpath, dirnames, filenames in os.walk(input_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        directory = Path(dirpath)
+        if output_dir.resolve() == directory.resolve():
+            dirnames[:] = []
+            continue
+        files = [directory / name for name in sorted(filenames) if _is_supported(directory / name)]
+        if not files:
+            continue
+        relative = directory.relative_to(input_dir)
+        if group_by == GROUP_BY_DIR:
+            name = relative.as_posix() if relative.parts else input_dir.resolve().name
+            output = output_dir / relative.parent / f"{relative.name or name}.xlsx"
+            yield WorkUnit(name, files, output)
+        else:
+            for path in files:
+                key = (relative / path.name).as_posix()
+                yield WorkUnit(key, [path], output_dir / relative / f"{path.stem}.xlsx")
+
+
+def _write_output(rows: list[str], output: Path) -> None:
+    """一時ファイルに書いてから置き換え、途中で止まっても壊れたXLSXを残さない。"""
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = output.with_name(output.name + ".part")
+    with open(tmp, "wb") as f:
+        write_xlsx(rows, f)
+    os.replace(tmp, output)
+
+
+async def _process_unit(unit: WorkUnit, google_key: str, openai_key: str) -> CheckpointRecord:
+    start = time.perf_counter()
+    fingerprint = unit.fingerprint()
+
+    def failed(message: str) -> CheckpointRecord:
+        return CheckpointRecord(
+            unit.key, STATUS_FAILED, fingerprint,
+            error_message=message, seconds=round(time.perf_counter() - start, 3),
+        )
+
+    error_message = validate_upload_filenames([p.name for p in unit.paths])
+    if error_message:
+        return failed(error_message)
+    for path in unit.paths:
+        if path.stat().st_size > settings.max_upload_file_bytes:
+            return failed(f"ファイルサイズが上限を超えています: {path.name}")
+
+    files = await asyncio.to_thread(lambda: [(p.name, p.read_bytes()) for p in unit.paths])
+    result = await process_bill(files, google_key, openai_key, "", collect_rows=True)
+    if not result.success:
+        return failed(result.error_message or "")
+    try:
+        await asyncio.to_thread(_write_output, result.rows, unit.output)
+    except (OSError, ValueError) as e:
+        return failed(f"XLSXを書き出せませんでした: {e}")
+    return CheckpointRecord(
+        unit.key, STATUS_SUCCEEDED, fingerprint,
+        output=str(unit.output), seconds=round(time.perf_counter() - start, 3),
+    )
+
+
+@dataclass
+class RunSummary:
+    total: int = 0
+    skipped: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+
+async def run(
+    input_dir: Path,
+    output_dir: Path,
+    checkpoint: Checkpoint,
+    workers: int,
+    group_by: str = GROUP_BY_FILE,
+) -> RunSummary:
+    """入力フォルダの処理単位を workers 個のワーカーで並列に処理する。
+
+    走査と処理は並行して進み、キューの長さは workers の2倍までに抑える。
+    失敗した単位はチェックポイントに記録し、次回の実行で再処理する。
+    """
+    google_key, openai_key, _ = await secret_manager.get_pipeline_credentials()
+    if not google_key or not openai_key:
+        raise SystemExit(ERROR_MESSAGE_KEYS_NOT_CONFIGURED)
+
+    summary = RunSummary()
+    started = time.perf_counter()
+    queue: asyncio.Queue[Optional[WorkUnit]] = asyncio.Queue(maxsize=workers * 2)
+
+    async def worker() -> None:
+        while True:
+            unit = await queue.get()
+            if unit is None:
+                return
+            try:
+                record = await _process_unit(unit, google_key, openai_key)
+            except Exception as e:
+                logger.exception("処理中に予期しないエラー: %s", unit.key)
+                record = CheckpointRecord(unit.key, STATUS_FAILED, [], error_message=str(e))
+            checkpoint.append(record)
+            if record.status == STATUS_SUCCEEDED:
+                summary.succeeded += 1
+                logger.info("完了: %s → %s (%.1fs)", unit.key, record.output, record.seconds)
+            else:
+                summary.failed += 1
+                logger.warning("失敗: %s: %s", unit.key, record.error_message)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(max(1, workers))]
+    try:
+        for unit in iter_units(input_dir, output_dir, group_by):
+            summary.total += 1
+            if checkpoint.is_done(unit):
+                summary.skipped += 1
+                continue
+            await queue.put(unit)
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        checkpoint.close()
+    summary.seconds = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def _parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.cli", description="ローカルフォルダの明細書を一括でXLSXに変換する"
+    )
+    parser.add_argument("input_dir", type=Path, help="明細書（PDF/画像）を置いたフォルダ")
+    parser.add_argument("output_dir", type=Path, help="XLSXの出力先フォルダ")
+    parser.add_argument("--workers", type=int, default=4, help="同時に処理する明細書の数")
+    parser.add_argument(
+        "--group-by", choices=[GROUP_BY_FILE, GROUP_BY_DIR], default=GROUP_BY_FILE,
+        help="file: 1ファイルを1明細書として処理 / dir: 同じフォルダのファイルをまとめて処理",
+    )
+    parser.add_argument(
+        "--checkpoint", type=Path,
+        help=f"チェックポイントファイル（省略時は出力フォルダの {CHECKPOINT_NAME}）",
+    )
+    parser.add_argument("--restart", action="store_true", help="チェックポイントを無視して最初から処理する")
+    return parser.parse_args(argv)
+
+
+async def _main(args: argparse.Namespace) -> RunSummary:
+    checkpoint = Checkpoint(args.checkpoint or args.output_dir / CHECKPOINT_NAME)
+    if args.restart and checkpoint.path.exists():
+        checkpoint.path.unlink()
+    checkpoint.load()
+    try:
+        return await run(args.input_dir, args.output_dir, checkpoint, args.workers, args.group_by)
+    finally:
+        await client_registry.aclose()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = _parse_args(argv)
+    if not args.input_dir.is_dir():
+        print(f"入力フォルダが見つかりません: {args.input_dir}", file=sys.stderr)
+        return 2
+    try:
+        summary = asyncio.run(_main(args))
+    finally:
+        shutdown_preprocess_pool()
+        tracer.shutdown()
+    print(
+        f"total={summary.total} succeeded={summary.succeeded} failed={summary.failed} "
+        f"skipped={summary.skipped} seconds={summary.seconds}",
+        file=sys.stderr,
+    )
+    return 1 if summary.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
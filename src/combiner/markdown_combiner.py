@@ -1,9 +1,22 @@
+from typing import Iterator
+
 from src.workflow.router import CompanyType
 
 HEADER = "| 番号 | サービス | 金額(円) | 備考 |"
 SEPARATOR = "| --- | --- | --- | --- |"
 
 
+# DSLと同じ結合順序
+COMPANY_ORDER = [
+    CompanyType.NTT,
+    CompanyType.OTSUKA,
+    CompanyType.NTT_DOCOMO_BIZ,
+    CompanyType.SOFTBANK,
+    CompanyType.FORVAL,
+    CompanyType.OTHER,
+]
+
+
 class EmptyResultError(Exception):
     pass
 
@@ -15,16 +28,7 @@ def combine_markdown_rows(results: dict[CompanyType, str]) -> str:
     空の結果はスキップする。
     """
     rows: list[str] = []
-    # DSLと同じ順序で結合
-    order = [
-        CompanyType.NTT,
-        CompanyType.OTSUKA,
-        CompanyType.NTT_DOCOMO_BIZ,
-        CompanyType.SOFTBANK,
-        CompanyType.FORVAL,
-        CompanyType.OTHER,
-    ]
-    for company in order:
+    for company in COMPANY_ORDER:
         text = results.get(company, "").strip()
         if text:
             rows.append(text)
@@ -33,3 +37,40 @@ def combine_markdown_rows(results: dict[CompanyType, str]) -> str:
         raise EmptyResultError("抽出されたデータ行がありません")
 
     return f"{HEADER}\n{SEPARATOR}\n" + "\n".join(rows) + "\n"
+
+
+class IncrementalCombiner:
+    """ストリーミング分析で届いた明細行を会社ごとに受け取り、DSLの順序で結合する。
+
+    行は到着順（会社をまたいで順不同）に追加できる。
+    """
+
+    def __init__(self):
+        self._rows: dict[CompanyType, list[str]] = {}
+        self.row_count = 0
+
+    def add_row(self, company: CompanyType, row: str) -> None:
+        self._rows.setdefault(company, []).append(row)
+        self.row_count += 1
+
+    def lines(self) -> Iterator[str]:
+        """ヘッダー・セパレータ・データ行をDSLの順序で1行ずつ返す（文字列全体を組み立てない）。
+
+        Raises:
+            EmptyResultError: 行が1つもない場合
+        """
+        if self.row_count == 0:
+            raise EmptyResultError("抽出されたデータ行がありません")
+        return self._iter_lines()
+
+    def _iter_lines(self) -> Iterator[str]:
+        yield HEADER
+        yield SEPARATOR
+        for company in COMPANY_ORDER:
+            yield from self._rows.get(company, [])
+
+    def markdown(self) -> str:
+        """これまでに受け取った行を combine_markdown_rows と同じ形式で結合する。"""
+        return combine_markdown_rows(
+            {company: "\n".join(rows) for company, rows in self._rows.items()}
+        )
@@ -17,16 +17,120 @@ class Settings(BaseSettings):
 
     # App settings
     max_file_count: int = 10
+    xlsx_spool_max_memory: int = 1024 * 1024  # これを超えるXLSXは一時ファイルに書き出す
+    max_upload_file_bytes: int = 50 * 1024 * 1024  # 1ファイルあたりのサイズ上限
+    max_upload_request_bytes: int = 200 * 1024 * 1024  # 1リクエストあたりの合計サイズ上限
+    upload_spool_max_memory: int = 1024 * 1024  # これを超えるファイルは一時ファイルに退避
     output_filename: str = "明細書EXCEL出力"
 
+    # OCR (Gemini)
+    ocr_max_concurrency: int = 4  # ワーカー内で同時に実行するOCR呼び出し数
+    ocr_split_mode: bool = False  # True: ファイル/ページ範囲ごとに分割して並列OCR
+    ocr_fanout: int = 4  # 分割モードで1リクエストあたり同時に実行するチャンク数
+    ocr_pdf_pages_per_chunk: int = 5  # 分割モードでのPDF1チャンクあたりのページ数
+
+    # OCR前の画像前処理（大きなJPEG/PNG/WebPを縮小・再エンコードし、EXIFを除去）
+    image_preprocess_enabled: bool = True
+    image_preprocess_min_bytes: int = 512 * 1024  # これより小さい画像は処理しない
+    image_max_side: int = 3072  # 縮小後の長辺ピクセル数（OCR精度を保てる大きさ）
+    image_jpeg_quality: int = 85  # JPEG/WebP再エンコード時の品質
+    image_preprocess_workers: int = 2  # 画像処理用プロセスプールのプロセス数
+
+    # OCR結果キャッシュ（同一ファイルの再アップロード時にGeminiを呼ばない）
+    ocr_cache_enabled: bool = True
+    ocr_cache_max_entries: int = 128  # メモリ層のエントリ数上限
+    ocr_cache_path: str = ""  # SQLiteファイルのパス（空ならディスク層なし。複数ワーカーで共有できる）
+    ocr_cache_max_bytes: int = 256 * 1024 * 1024  # ディスク層の合計サイズ上限
+
+    # 明細分析 (GPT-4.1) をストリーミングで受信し、完成した行ごとに進捗イベントを出す
+    analysis_streaming: bool = False
+
+    # 明細分析結果キャッシュ（同一OCRテキスト・同一プロンプトならGPT-4.1を呼ばない）
+    analysis_cache_enabled: bool = True
+    analysis_cache_max_entries: int = 256
+    analysis_cache_path: str = ""  # SQLiteファイルのパス（空ならディスク層なし。OCRキャッシュと同じファイルでもよい）
+    analysis_cache_max_bytes: int = 64 * 1024 * 1024
+    analysis_cache_ttl_seconds: int = 7 * 24 * 3600  # 7日
+
+    # 会社判定: "single" はテキスト全体を1社に判定、
+    # "multi" はファイル/ページごとに会社判定して会社ごとに並列で明細分析する
+    router_mode: str = "single"
+    # 会社判定の方式: "dsl" はDSLの順序で最初にマッチした会社、
+    # "score" はキーワードのヒット数が最も多い会社（広告中の "OCN" 等による誤判定を防ぐ）
+    router_strategy: str = "dsl"
+    # 会社判定ルール・明細分析プロンプトの外部ファイル（JSON/YAML、またはそれらを置いたディレクトリ）。
+    # 空の場合はコード内蔵のルールを使う。変更は rules_reload_interval_seconds ごとに検知して再読み込みする
+    rules_path: str = ""
+    rules_reload_interval_seconds: float = 5.0
+
+    # Gemini / OpenAI クライアントのHTTP接続プール
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 60.0  # 秒
+    http_client_close_grace_seconds: float = 600.0  # キー変更後に古いクライアントを閉じるまでの猶予
+
+    # Gemini / OpenAI のレート制御（APIキーごと・ワーカーごと）
+    # 送信レートはトークンバケットで平滑化し、同時実行数は 429 を受けると半減、成功に応じて徐々に戻す
+    gemini_requests_per_minute: float = 1000.0  # 0 で無制限
+    openai_requests_per_minute: float = 500.0  # 0 で無制限
+    api_rate_burst: int = 10  # トークンバケットの容量（連続して送信できるリクエスト数）
+    api_max_concurrency: int = 16  # 同時実行数の上限
+    api_min_concurrency: int = 1  # 429 が続いた場合の同時実行数の下限
+    # 429・5xx・通信エラーの再試行（指数バックオフ + ジッター。Retry-After があればそれ以上待つ）
+    api_retry_max_attempts: int = 5  # 初回を含む試行回数
+    api_retry_base_delay: float = 1.0  # 秒
+    api_retry_max_delay: float = 30.0  # バックオフの上限（秒）
+    api_retry_after_max: float = 120.0  # これより長い Retry-After は待たずに失敗とする
+
+    # 非同期ジョブ (POST /jobs)
+    job_workers: int = 2  # ジョブを並列に処理するワーカー数
+    job_queue_max_size: int = 100
+    job_store_backend: str = "sqlite"  # "sqlite" または "memory"
+    job_store_path: str = "/tmp/meisaisyo-jobs.db"
+    job_event_history_max: int = 5000  # ジョブごとに保持する進捗イベント数の上限（超えたら古い順に捨てる）
+    job_event_retention_seconds: float = 300.0  # ジョブ終了後にイベント履歴を保持する秒数
+    sse_heartbeat_seconds: float = 15.0  # SSEのキープアライブ送信間隔
+    # 別のワーカーで実行中のジョブのSSEは、ジョブストアをこの間隔でポーリングして状態の変化を送る
+    job_status_poll_seconds: float = 1.0
+    # サーバーの起動時刻（gunicorn.conf.py がマスタープロセスの起動時に設定する）。
+    # これより前に登録された未完了ジョブを前回起動時の残りとして失敗扱いにする。0 ならワーカー自身の起動時刻
+    server_started_at: float = 0.0
+
+    # バッチ抽出 (POST /batches): ZIP内のグループごとに明細抽出を実行する
+    batch_concurrency: int = 4  # 全バッチ合計で同時に処理するグループ数
+    batch_max_active: int = 20  # 同時に受け付けるバッチ数
+    batch_max_groups: int = 500  # 1バッチあたりのグループ数の上限
+    batch_max_upload_bytes: int = 1024 * 1024 * 1024  # ZIPファイルのサイズ上限
+    batch_max_uncompressed_bytes: int = 4 * 1024 * 1024 * 1024  # ZIP展開後の合計サイズ上限
+
+    # トレース: "" (無効) / "json" (JSON Linesファイル) / "otlp" (OTLP/HTTPコレクター)
+    tracing_exporter: str = ""
+    tracing_json_path: str = "/tmp/meisaisyo-traces.jsonl"
+    tracing_otlp_endpoint: str = "http://localhost:4318"
+    tracing_sample_rate: float = 1.0  # トレースを記録するリクエストの割合 (0.0〜1.0)
+
+    # /metrics を全ワーカーで合算するための共有ディレクトリ（空ならワーカーごとの値を返す）。
+    # 各ワーカーが metrics_flush_seconds ごとに値を書き出し、/metrics を受けたワーカーが合算する
+    metrics_multiproc_dir: str = ""
+    metrics_flush_seconds: float = 10.0
+
     # Google Drive
     drive_folder_id: str = "1BsdbbCisTpP7mxzOuDSnASxpEqGTdcEL"
+    drive_upload_workers: int = 4  # アップロードを実行するスレッド数
+    drive_resumable_threshold_bytes: int = 5 * 1024 * 1024  # これを超えるとレジューマブルアップロード
+    drive_upload_chunk_size: int = 5 * 1024 * 1024  # レジューマブル時のチャンクサイズ (256KBの倍数)
 
     # Secret Manager secret IDs
     secret_id_google_key: str = "meisaisyo-google-api-key"
     secret_id_openai_key: str = "meisaisyo-openai-api-key"
     secret_id_admin_password: str = "meisaisyo-admin-password"
     secret_id_drive_folder: str = "meisaisyo-drive-folder-id"
+    # 取得したシークレットのキャッシュ（5分）をワーカー間で共有するSQLiteファイル（空ならプロセス内のみ）。
+    # ファイルにはAPIキーがそのまま保存されるため、所有者だけが読める権限で作成する
+    secret_cache_path: str = ""
+    secret_cache_ttl_seconds: float = 300.0  # 取得したシークレットを再取得せずに使う秒数
+    # 期限切れのこの秒数前からは、キャッシュの値を返しつつバックグラウンドで再取得する
+    secret_refresh_ahead_seconds: float = 60.0
 
     # Session
     session_secret_key: str = "change-me-in-production"
@@ -1,6 +1,11 @@
+import asyncio
+import contextvars
 import io
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
+from typing import BinaryIO, Optional
 
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
@@ -8,27 +13,64 @@ from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseUpload
 import google.auth
 
+from src.config import settings
+from src.tracing.tracer import tracer
+
 logger = logging.getLogger(__name__)
 
 JST = timezone(timedelta(hours=9))
 
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_credentials = None
+_credentials_lock = threading.Lock()
+# googleapiclient のサービスオブジェクト (httplib2) はスレッドセーフでないため、スレッドごとに保持する
+_thread_local = threading.local()
+_executor: Optional[ThreadPoolExecutor] = None
+
 
 class DriveUploadError(Exception):
     """Google Drive アップロード固有のエラー"""
     pass
 
 
+def _get_credentials():
+    """Application Default Credentials を取得する（プロセス内でキャッシュする）。"""
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            credentials, project = google.auth.default(
+                scopes=["https://www.googleapis.com/auth/drive.file"]
+            )
+            logger.info("Drive API 認証成功 (project=%s)", project)
+            _credentials = credentials
+        return _credentials
+
+
 def _get_drive_service():
-    """Application Default Credentials で Drive API サービスを取得する。"""
+    """Drive API サービスを取得する。認証情報は共有し、サービスはスレッドごとにキャッシュする。"""
+    service = getattr(_thread_local, "service", None)
+    if service is not None:
+        return service
     try:
-        credentials, project = google.auth.default(
-            scopes=["https://www.googleapis.com/auth/drive.file"]
-        )
-        logger.info("Drive API 認証成功 (project=%s)", project)
-        return build("drive", "v3", credentials=credentials, cache_discovery=False)
+        credentials = _get_credentials()
+        service = build("drive", "v3", credentials=credentials, cache_discovery=False)
     except Exception as e:
         logger.error("Drive API 認証失敗: %s", e)
         raise DriveUploadError(f"Drive API 認証に失敗しました: {e}") from e
+    _thread_local.service = service
+    return service
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Driveアップロード用のスレッドプールを取得する（初回呼び出し時に生成）。"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.drive_upload_workers),
+            thread_name_prefix="drive-upload",
+        )
+    return _executor
 
 
 def generate_filename(base_name: str = "明細書EXCEL出力") -> str:
@@ -39,14 +81,14 @@ def generate_filename(base_name: str = "明細書EXCEL出力") -> str:
 
 
 def upload_to_drive(
-    xlsx_bytes: bytes,
+    xlsx_data: bytes | BinaryIO,
     folder_id: str,
     filename: str | None = None,
 ) -> str:
     """XLSXファイルをGoogle Driveにアップロードし、webViewLinkを返す。
 
     Args:
-        xlsx_bytes: XLSXファイルのバイト列
+        xlsx_data: XLSXファイルのバイト列、または読み込み可能なファイルオブジェクト
         folder_id: アップロード先のGoogle DriveフォルダID
         filename: ファイル名（省略時は自動生成）
 
@@ -64,21 +106,33 @@ def upload_to_drive(
         "name": filename,
         "parents": [folder_id],
     }
+    # 閾値を超えるファイルはチャンク分割のレジューマブルアップロードにする
+    fileobj = io.BytesIO(xlsx_data) if isinstance(xlsx_data, bytes) else xlsx_data
+    fileobj.seek(0, io.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    resumable = size > settings.drive_resumable_threshold_bytes
     media = MediaIoBaseUpload(
-        io.BytesIO(xlsx_bytes),
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        resumable=False,
+        fileobj,
+        mimetype=XLSX_MIMETYPE,
+        chunksize=settings.drive_upload_chunk_size,
+        resumable=resumable,
     )
     try:
-        file = (
-            service.files()
-            .create(
+        with tracer.span("drive.upload", bytes=size, resumable=resumable, filename=filename):
+            request = service.files().create(
                 body=file_metadata,
                 media_body=media,
                 fields="id,webViewLink",
             )
-            .execute()
-        )
+            if resumable:
+                file = None
+                while file is None:
+                    status, file = request.next_chunk()
+                    if status is not None:
+                        logger.info("Drive アップロード進捗: %d%%", int(status.progress() * 100))
+            else:
+                file = request.execute()
         link = file.get("webViewLink", "")
         logger.info("Drive アップロード成功: file_id=%s, link=%s", file.get("id"), link)
         return link
@@ -93,3 +147,19 @@ def upload_to_drive(
     except Exception as e:
         logger.error("Drive アップロード予期せぬエラー: %s", e, exc_info=True)
         raise DriveUploadError(f"Drive アップロードに失敗しました: {e}") from e
+
+
+async def upload_to_drive_async(
+    xlsx_data: bytes | BinaryIO,
+    folder_id: str,
+    filename: str | None = None,
+) -> str:
+    """upload_to_drive をスレッドプールで実行し、イベントループをブロックしない。
+
+    トレースの親子関係を引き継ぐため、呼び出し元のコンテキストでスレッド側の処理を実行する。
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        _get_executor(), context.run, upload_to_drive, xlsx_data, folder_id, filename
+    )
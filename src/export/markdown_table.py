@@ -0,0 +1,133 @@
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional
+
+from src.combiner.markdown_combiner import HEADER
+
+# セル区切り。バックスラッシュでエスケープされた \| は区切りとみなさない
+_CELL_SPLIT_RE = re.compile(r"(?<!\\)\|")
+# セパレータ行 (| --- | :---: | ...)。全角のハイフン・長音・コロンも許容する
+_SEPARATOR_RE = re.compile(r"^\|?(?:\s*[:：]?[-－ー]+[:：]?\s*\|)+\s*(?:[:：]?[-－ー]+[:：]?\s*)?$")
+_SEPARATOR_CHARS = " \t:：-－ー"
+# 全角の縦棒で書かれた行を半角に揃える（行頭が全角のときのみ）
+_FULLWIDTH_PIPE = str.maketrans({"｜": "|"})
+_ESCAPED_PIPE = "\\|"
+
+# 問題のあった行の理由
+ISSUE_NOT_TABLE_ROW = "not_table_row"
+ISSUE_MISSING_COLUMNS = "missing_columns"
+ISSUE_EXTRA_COLUMNS = "extra_columns"
+
+
+def _split_cells(line: str) -> list[str]:
+    """テーブル行（前後の空白除去済み）をセルに分割する。"""
+    if line[-1] == "|" and not line.endswith(_ESCAPED_PIPE):
+        line = line[1:-1]
+    else:
+        # 末尾の | が欠けた行も受け付ける
+        line = line[1:]
+    if "\\" not in line:
+        return list(map(str.strip, line.split("|")))
+    return [cell.strip().replace(_ESCAPED_PIPE, "|") for cell in _CELL_SPLIT_RE.split(line)]
+
+
+# combiner.HEADER の列数（番号・サービス・金額(円)・備考）
+CONTRACT_COLUMNS = len(_split_cells(HEADER))
+
+
+@dataclass
+class LineIssue:
+    line_no: int
+    reason: str
+    line: str
+    dropped: bool
+
+
+@dataclass
+class ParseReport:
+    """パース結果の検証レポート。行番号は1始まり。"""
+
+    rows: int = 0
+    issues: list[LineIssue] = field(default_factory=list)
+
+    @property
+    def dropped(self) -> list[LineIssue]:
+        return [issue for issue in self.issues if issue.dropped]
+
+    @property
+    def malformed(self) -> list[LineIssue]:
+        """列数を補正して残した行。"""
+        return [issue for issue in self.issues if not issue.dropped]
+
+    @property
+    def ok(self) -> bool:
+        return not self.issues
+
+    def summary(self) -> str:
+        return f"rows={self.rows}, dropped={len(self.dropped)}, malformed={len(self.malformed)}"
+
+
+class MarkdownTableParser:
+    """Markdownテーブルを1パスでパースし、列数の揃った行を返すパーサー。
+
+    - セル中の \\| はエスケープされた縦棒として扱う
+    - 全角の縦棒・全角空白・全角ハイフンのセパレータ行に対応する
+    - 列数が足りない行は空セルで補い、多い行は余分なセルが空なら切り詰め、そうでなければ除外する
+    - テーブル外の文字列行は除外する
+    問題のあった行は ParseReport に記録する。
+    """
+
+    def __init__(self, columns: Optional[int] = CONTRACT_COLUMNS):
+        self.columns = columns
+
+    def iter_rows(
+        self, lines: Iterable[str], report: Optional[ParseReport] = None
+    ) -> Iterator[list[str]]:
+        """行をストリーミングでパースする。report を渡すと検証結果を書き込む。"""
+        if report is None:
+            report = ParseReport()
+        columns = self.columns
+        split_cells = _split_cells
+        separator_match = _SEPARATOR_RE.match
+        separator_chars = _SEPARATOR_CHARS
+
+        for line_no, raw in enumerate(lines, start=1):
+            line = raw.strip()
+            if not line:
+                continue
+            if line[0] != "|":
+                if line[0] == "｜":
+                    line = line.translate(_FULLWIDTH_PIPE)
+                else:
+                    report.issues.append(LineIssue(line_no, ISSUE_NOT_TABLE_ROW, line, True))
+                    continue
+            cells = split_cells(line)
+            # 先頭セルがハイフン等だけのときだけ正規表現でセパレータ行か確認する
+            first = cells[0]
+            if first and not first.strip(separator_chars) and separator_match(line):
+                continue
+            if columns is not None and len(cells) != columns:
+                if len(cells) < columns:
+                    cells.extend([""] * (columns - len(cells)))
+                    report.issues.append(LineIssue(line_no, ISSUE_MISSING_COLUMNS, line, False))
+                elif any(cells[columns:]):
+                    report.issues.append(LineIssue(line_no, ISSUE_EXTRA_COLUMNS, line, True))
+                    continue
+                else:
+                    del cells[columns:]
+
+            report.rows += 1
+            yield cells
+
+    def parse(self, markdown: str) -> tuple[list[list[str]], ParseReport]:
+        """Markdown文字列全体をパースし、行のリストと検証レポートを返す。"""
+        report = ParseReport()
+        rows = list(self.iter_rows(markdown.splitlines(), report))
+        return rows, report
+
+
+def parse_markdown_table(
+    markdown: str, columns: Optional[int] = CONTRACT_COLUMNS
+) -> tuple[list[list[str]], ParseReport]:
+    """Markdownテーブルをパースして2次元リストと検証レポートを返す。"""
+    return MarkdownTableParser(columns).parse(markdown)
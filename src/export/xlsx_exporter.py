@@ -1,47 +1,247 @@
 import io
+import logging
 import re
+import tempfile
+import unicodedata
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterable, Optional, Union
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
 
+from src.config import settings
+from src.export.markdown_table import MarkdownTableParser, ParseReport
+from src.tracing.tracer import tracer
 
-def _parse_markdown_table(markdown: str) -> list[list[str]]:
-    """Markdownテーブルをパースして2次元リストに変換する。"""
-    rows: list[list[str]] = []
-    for line in markdown.strip().splitlines():
-        line = line.strip()
-        if not line.startswith("|"):
-            continue
-        # セパレータ行 (| --- | --- | ...) をスキップ
-        if re.match(r"^\|[\s\-:]+\|", line):
-            continue
-        cells = [cell.strip() for cell in line.split("|")]
-        # 先頭と末尾の空文字を除去 (| で split すると先頭末尾が空になる)
-        if cells and cells[0] == "":
-            cells = cells[1:]
-        if cells and cells[-1] == "":
-            cells = cells[:-1]
-        if cells:
-            rows.append(cells)
-    return rows
+logger = logging.getLogger(__name__)
 
 
-def markdown_to_xlsx(markdown: str) -> bytes:
-    """MarkdownテーブルをXLSXバイト列に変換する。
+@dataclass(frozen=True)
+class ColumnSpec:
+    """出力列の定義。numeric=True の列は整数に変換し、合計行で集計する。"""
+
+    header: str
+    width: float
+    numeric: bool = False
+    number_format: str = "General"
+
+
+# combiner の HEADER と同じ4列。ヘッダー名で照合し、未知の列は文字列のまま出力する
+COLUMN_SCHEMA = [
+    ColumnSpec("番号", width=18),
+    ColumnSpec("サービス", width=36),
+    ColumnSpec("金額(円)", width=14, numeric=True, number_format="#,##0;-#,##0"),
+    ColumnSpec("備考", width=30),
+]
+_SCHEMA_BY_HEADER = {spec.header: spec for spec in COLUMN_SCHEMA}
+
+TOTAL_LABEL = "合計"
+
+# 金額セルから除去する記号（NFKC正規化後）
+_AMOUNT_STRIP_RE = re.compile(r"[,\s円¥\\]")
+# 請求書で使われるマイナス表記（△1,234 / ▲1,234 / −1234）
+_NEGATIVE_PREFIXES = ("-", "△", "▲", "\u2212")
+_INTEGER_RE = re.compile(r"^\d+$")
+
+
+def parse_amount(value: str) -> Optional[int]:
+    """金額の文字列を整数に変換する。変換できない場合は None を返す。
+
+    全角数字・桁区切り・円記号・△/▲ や括弧によるマイナス表記に対応する。
+    """
+    text = _AMOUNT_STRIP_RE.sub("", unicodedata.normalize("NFKC", value))
+    negative = False
+    if text.startswith("(") and text.endswith(")"):
+        negative = True
+        text = text[1:-1]
+    elif text.startswith(_NEGATIVE_PREFIXES):
+        negative = True
+        text = text[1:]
+    if not _INTEGER_RE.match(text):
+        return None
+    amount = int(text)
+    return -amount if negative else amount
+
+
+def write_xlsx(
+    lines: Iterable[str],
+    fileobj: BinaryIO,
+    report: Optional[ParseReport] = None,
+) -> int:
+    """Markdownテーブルの行をストリーミングで読み、書き込み専用ワークブックとして保存する。
 
-    DSL の md_to_xlsx ツール (force_text_value=false) と同等。
-    ファイル名は呼び出し側で制御する。
+    行はワークシートに逐次書き出すため、行数に関わらずメモリ使用量はほぼ一定。
+    ヘッダーが COLUMN_SCHEMA の列は列幅を設定し、金額列は整数セルとして書き込んで
+    最終行に合計行を追加する。行は MarkdownTableParser で4列に揃え、
+    除外・補正した行は report に記録してログに出力する。
+
+    Returns:
+        書き込んだ行数（ヘッダー行を含み、合計行は含まない）
+
+    Raises:
+        ValueError: 変換するデータ行がない場合
     """
-    rows = _parse_markdown_table(markdown)
-    if not rows:
+    with tracer.span("xlsx.write") as span:
+        count = _write_xlsx(lines, fileobj, report if report is not None else ParseReport())
+        span.set_attributes(rows=count, bytes=fileobj.tell())
+        return count
+
+
+def _write_xlsx(lines: Iterable[str], fileobj: BinaryIO, report: ParseReport) -> int:
+    wb = Workbook(write_only=True)
+    count = _write_sheet(wb, lines, report)
+    wb.save(fileobj)
+    return count
+
+
+def _write_sheet(
+    wb: Workbook, lines: Iterable[str], report: ParseReport, title: Optional[str] = None
+) -> int:
+    """Markdownテーブルの行を1枚のワークシートに書き出す。"""
+    rows = MarkdownTableParser().iter_rows(lines, report)
+    header = next(rows, None)
+    if header is None:
         raise ValueError("変換するデータがありません")
 
-    wb = Workbook()
-    ws = wb.active
+    specs = [_SCHEMA_BY_HEADER.get(name) for name in header]
+    totals = {i: 0 for i, spec in enumerate(specs) if spec is not None and spec.numeric}
+
+    ws = wb.create_sheet(title)
+    # 書き込み専用モードでは列幅・ウィンドウ枠は行の追加前に設定する
+    for i, spec in enumerate(specs, start=1):
+        if spec is not None:
+            ws.column_dimensions[get_column_letter(i)].width = spec.width
+    ws.freeze_panes = "A2"
 
+    ws.append([_styled_cell(ws, name, bold=True) for name in header])
+    count = 1
     for row_data in rows:
-        ws.append(row_data)
+        ws.append([_typed_value(ws, specs, totals, i, value) for i, value in enumerate(row_data)])
+        count += 1
+
+    if totals:
+        total_row: list[Union[str, WriteOnlyCell, None]] = [None] * len(header)
+        total_row[0] = _styled_cell(ws, TOTAL_LABEL, bold=True)
+        for i, amount in totals.items():
+            total_row[i] = _styled_cell(ws, amount, bold=True, number_format=specs[i].number_format)
+        ws.append(total_row)
+
+    if not report.ok:
+        logger.warning("Markdownテーブルに不正な行がありました: %s", report.summary())
+        for issue in report.issues:
+            logger.debug("  line %d (%s): %s", issue.line_no, issue.reason, issue.line)
+    return count
+
+
+# Excel のシート名に使えない文字と長さの上限
+_SHEET_TITLE_INVALID_RE = re.compile(r"[\\/*?:\[\]]")
+_SHEET_TITLE_MAX = 31
+
+
+def sheet_title(name: str, used: set[str]) -> str:
+    """シート名として使える文字列に変換する。使用済みの名前と重なる場合は連番を付ける。
 
+    Excel はシート名の大文字・小文字を区別しないため、used には小文字で記録する。
+    """
+    base = _SHEET_TITLE_INVALID_RE.sub("_", name).strip("' ") or "Sheet"
+    title = base[:_SHEET_TITLE_MAX]
+    n = 2
+    while title.lower() in used:
+        suffix = f" ({n})"
+        title = base[: _SHEET_TITLE_MAX - len(suffix)] + suffix
+        n += 1
+    used.add(title.lower())
+    return title
+
+
+def write_xlsx_sheets(sheets: Iterable[tuple[str, Iterable[str]]], fileobj: BinaryIO) -> dict[str, int]:
+    """(シート名, Markdownテーブルの行) ごとに1枚のシートを持つワークブックを保存する。
+
+    シート名は sheet_title で整形する。各シートの形式は write_xlsx と同じ。
+
+    Returns:
+        整形後のシート名ごとの書き込んだ行数（ヘッダー行を含み、合計行は含まない）
+
+    Raises:
+        ValueError: データ行のないシートがある場合、またはシートが1枚もない場合
+    """
+    with tracer.span("xlsx.write") as span:
+        wb = Workbook(write_only=True)
+        used: set[str] = set()
+        counts: dict[str, int] = {}
+        for name, lines in sheets:
+            title = sheet_title(name, used)
+            counts[title] = _write_sheet(wb, lines, ParseReport(), title)
+        if not counts:
+            raise ValueError("変換するデータがありません")
+        wb.save(fileobj)
+        span.set_attributes(sheets=len(counts), rows=sum(counts.values()), bytes=fileobj.tell())
+        return counts
+
+
+def _typed_value(
+    ws,
+    specs: list[Optional[ColumnSpec]],
+    totals: dict[int, int],
+    index: int,
+    value: str,
+) -> Union[str, WriteOnlyCell]:
+    """スキーマの数値列なら整数セルに変換して合計に加算する。それ以外は文字列のまま返す。"""
+    spec = specs[index] if index < len(specs) else None
+    if spec is None or not spec.numeric:
+        return value
+    amount = parse_amount(value)
+    if amount is None:
+        return value
+    totals[index] += amount
+    return _styled_cell(ws, amount, number_format=spec.number_format)
+
+
+def _styled_cell(ws, value, bold: bool = False, number_format: str = "General") -> WriteOnlyCell:
+    cell = WriteOnlyCell(ws, value=value)
+    if bold:
+        cell.font = Font(bold=True)
+    cell.number_format = number_format
+    return cell
+
+
+def markdown_to_xlsx_file(
+    lines: Iterable[str] | str, report: Optional[ParseReport] = None
+) -> BinaryIO:
+    """MarkdownテーブルをXLSXに変換し、先頭にシークしたスプールファイルで返す。
+
+    xlsx_spool_max_memory を超えるXLSXは一時ファイルに書き出される。
+    呼び出し側でクローズすること。
+    """
+    if isinstance(lines, str):
+        lines = io.StringIO(lines)
+    return _spool(lambda fileobj: write_xlsx(lines, fileobj, report))
+
+
+def sheets_to_xlsx_file(sheets: Iterable[tuple[str, Iterable[str]]]) -> BinaryIO:
+    """write_xlsx_sheets で複数シートのXLSXを作り、先頭にシークしたスプールファイルで返す。"""
+    return _spool(lambda fileobj: write_xlsx_sheets(sheets, fileobj))
+
+
+def _spool(write: Callable[[BinaryIO], object]) -> BinaryIO:
+    fileobj = tempfile.SpooledTemporaryFile(max_size=settings.xlsx_spool_max_memory)
+    try:
+        write(fileobj)
+    except Exception:
+        fileobj.close()
+        raise
+    fileobj.seek(0)
+    return fileobj
+
+
+def markdown_to_xlsx(markdown: str) -> bytes:
+    """MarkdownテーブルをXLSXバイト列に変換する。
+
+    DSL の md_to_xlsx ツール (force_text_value=false) と同様に数値を数値セルとして書き込み、
+    金額列の合計行を追加する。ファイル名は呼び出し側で制御する。
+    """
     buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
+    write_xlsx(io.StringIO(markdown), buf)
     return buf.getvalue()
@@ -0,0 +1,112 @@
+import asyncio
+import heapq
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# 履歴の上限を超えた時に古いものから捨ててよいイベント。それ以外（グループの状態・結果）は必ず残す
+_EVICTABLE_EVENTS = frozenset({"progress"})
+
+
+@dataclass
+class _JobChannel:
+    # (通し番号, イベント)。progress は上限つき、それ以外は全件を保持する
+    progress: deque[tuple[int, dict]] = field(
+        default_factory=lambda: deque(maxlen=max(1, settings.job_event_history_max))
+    )
+    kept: list[tuple[int, dict]] = field(default_factory=list)
+    seq: int = 0
+    subscribers: set[asyncio.Queue] = field(default_factory=set)
+    closed: bool = False
+
+    def history(self) -> list[dict]:
+        return [event for _, event in heapq.merge(self.progress, self.kept, key=lambda e: e[0])]
+
+
+class JobEventBroker:
+    """ジョブごとの進捗イベントを購読者 (SSE接続) に配信するプロセス内ブローカー。
+
+    途中から購読した接続にも過去のイベントを再送できるよう、ジョブごとに履歴を保持する。
+    進捗イベントは job_event_history_max 件を超えると古いものから捨てるが、
+    結果などの終了を表すイベントは必ず残し、再接続した購読者が終了を受け取れるようにする。
+    ジョブ終了後、履歴は job_event_retention_seconds の経過後に破棄する。
+    """
+
+    def __init__(self):
+        self._channels: dict[str, _JobChannel] = {}
+
+    def open(self, job_id: str) -> None:
+        self._channels.setdefault(job_id, _JobChannel())
+
+    def publish(self, job_id: str, event: dict) -> None:
+        channel = self._channels.get(job_id)
+        if channel is None or channel.closed:
+            return
+        channel.seq += 1
+        if event.get("event") in _EVICTABLE_EVENTS:
+            channel.progress.append((channel.seq, event))
+        else:
+            channel.kept.append((channel.seq, event))
+        for queue in channel.subscribers:
+            queue.put_nowait(event)
+
+    def close(self, job_id: str) -> None:
+        """ジョブ終了時に呼ぶ。購読者のストリームを終了させる。"""
+        channel = self._channels.get(job_id)
+        if channel is None:
+            return
+        channel.closed = True
+        for queue in channel.subscribers:
+            queue.put_nowait(None)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._channels.pop(job_id, None)
+            return
+        loop.call_later(
+            settings.job_event_retention_seconds, self._channels.pop, job_id, None
+        )
+
+    def has_channel(self, job_id: str) -> bool:
+        return job_id in self._channels
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[Optional[dict]]:
+        """過去のイベントを再送した後、新しいイベントを返す。
+
+        settings.sse_heartbeat_seconds の間イベントがなければ None を返す（キープアライブ用）。
+        """
+        channel = self._channels.get(job_id)
+        if channel is None:
+            return
+        queue: asyncio.Queue = asyncio.Queue()
+        history = channel.history()
+        closed = channel.closed
+        channel.subscribers.add(queue)
+        try:
+            for event in history:
+                yield event
+            if closed:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=settings.sse_heartbeat_seconds
+                    )
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is None:
+                    return
+                yield event
+        finally:
+            channel.subscribers.discard(queue)
+
+
+# シングルトンインスタンス
+job_events = JobEventBroker()
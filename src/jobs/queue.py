@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Callable, Optional
+
+from src.config import settings
+from src.jobs.events import job_events
+from src.jobs.store import (
+    JOB_STATUS_FAILED,
+    JOB_STATUS_RUNNING,
+    JOB_STATUS_SUCCEEDED,
+    Job,
+    JobStore,
+    create_job_store,
+)
+from src.workflow.pipeline import (
+    ERROR_MESSAGE_UNKNOWN,
+    PipelineEvent,
+    PipelineResult,
+    process_bill,
+)
+from src.workflow.uploads import FileContent
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+@dataclass
+class _QueuedJob:
+    job_id: str
+    files: list[tuple[str, FileContent]]
+    google_api_key: str
+    openai_api_key: str
+    drive_folder_id: str
+    cleanup: Optional[Callable[[], None]] = None
+
+
+class JobQueue:
+    """process_bill をバックグラウンドで実行するプロセス内ジョブキュー。
+
+    ジョブの状態は JobStore に保存し、ファイル本体とAPIキーはメモリ上のキューにのみ保持する。
+    cleanup を渡した場合はジョブ終了後（停止時に未実行のジョブも含む）に呼び出す。
+    """
+
+    def __init__(self, store: JobStore, workers: int, max_size: int):
+        self.store = store
+        self._worker_count = max(1, workers)
+        self._max_size = max_size
+        self._queue: Optional[asyncio.Queue[_QueuedJob]] = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """ワーカーを起動する。前回起動時の未完了ジョブは失敗扱いにする。
+
+        gunicorn で複数ワーカーを起動する場合、ストアは全ワーカーで共有されるため、
+        サーバーの起動時刻 (server_started_at) より前に登録されたジョブと、
+        プロセスが終了しているワーカーが登録したジョブだけを対象にする
+        （異常終了したワーカーを gunicorn が起動し直した場合の後始末）。
+        """
+        result = asdict(PipelineResult(success=False, error_message=ERROR_MESSAGE_UNKNOWN))
+        stale = self.store.fail_unfinished(
+            result, created_before=settings.server_started_at or time.time()
+        )
+        dead = {pid for pid in self.store.unfinished_owners() if not _process_alive(pid)}
+        if dead:
+            stale += self.store.fail_unfinished(result, owners=dead)
+        if stale:
+            logger.warning("未完了のジョブを失敗扱いにしました: %d件", stale)
+
+        self._queue = asyncio.Queue(maxsize=self._max_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self._worker_count)
+        ]
+        logger.info("ジョブワーカー起動: workers=%d", self._worker_count)
+
+    async def stop(self) -> None:
+        """ワーカーを停止し、未実行のジョブのリソースを解放する。"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._queue is not None and not self._queue.empty():
+            _cleanup(self._queue.get_nowait())
+
+    def submit(
+        self,
+        files: list[tuple[str, FileContent]],
+        google_api_key: str,
+        openai_api_key: str,
+        drive_folder_id: str,
+        cleanup: Optional[Callable[[], None]] = None,
+    ) -> Job:
+        """ジョブを登録してキューに追加する。
+
+        Raises:
+            JobQueueFullError: キューが満杯の場合
+        """
+        if self._queue is None:
+            raise RuntimeError("JobQueue が起動していません")
+        if self._queue.full():
+            raise JobQueueFullError("ジョブキューが満杯です")
+
+        job = Job(id=uuid.uuid4().hex)
+        self.store.create(job)
+        job_events.open(job.id)
+        self._queue.put_nowait(
+            _QueuedJob(job.id, files, google_api_key, openai_api_key, drive_folder_id, cleanup)
+        )
+        return job
+
+    async def _worker(self, index: int) -> None:
+        assert self._queue is not None
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._run(item)
+            except Exception:
+                logger.exception("ジョブ実行中に予期しないエラー: job_id=%s", item.job_id)
+            finally:
+                _cleanup(item)
+                self._queue.task_done()
+
+    async def _run(self, item: _QueuedJob) -> None:
+        job = self.store.get(item.job_id)
+        if job is None:
+            return
+        job.status = JOB_STATUS_RUNNING
+        self.store.update(job)
+        logger.info("ジョブ開始: job_id=%s", job.id)
+
+        def on_progress(event: PipelineEvent) -> None:
+            if event.status == "started":
+                job.step = event.step
+                job.step_name = event.name
+                self.store.update(job)
+            job_events.publish(job.id, {"event": "progress", **event.to_dict()})
+
+        try:
+            result = await process_bill(
+                item.files,
+                item.google_api_key,
+                item.openai_api_key,
+                item.drive_folder_id,
+                on_progress=on_progress,
+            )
+        except Exception:
+            logger.exception("ジョブ失敗: job_id=%s", job.id)
+            result = PipelineResult(success=False, error_message=ERROR_MESSAGE_UNKNOWN)
+
+        job.status = JOB_STATUS_SUCCEEDED if result.success else JOB_STATUS_FAILED
+        job.result = asdict(result)
+        self.store.update(job)
+        job_events.publish(job.id, {"event": "result", "status": job.status, "result": job.result})
+        job_events.close(job.id)
+        logger.info("ジョブ終了: job_id=%s, status=%s", job.id, job.status)
+
+
+def _process_alive(pid: int) -> bool:
+    """pid のプロセスが生きているかを返す。PIDが不明 (0) のジョブは生きているものとみなす。"""
+    if pid <= 0:
+        return True
+    if pid == os.getpid():
+        # 起動直後のこのプロセスはまだジョブを持っていない。同じPIDの旧ワーカーが残したもの
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _cleanup(item: _QueuedJob) -> None:
+    if item.cleanup is None:
+        return
+    try:
+        item.cleanup()
+    except Exception:
+        logger.warning("ジョブのリソース解放に失敗しました: job_id=%s", item.job_id, exc_info=True)
+
+
+# シングルトンインスタンス
+job_queue = JobQueue(create_job_store(), settings.job_workers, settings.job_queue_max_size)
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from src.config import settings
+from src.jobs.events import job_events
+from src.jobs.queue import JobQueueFullError, job_queue
+from src.jobs.store import Job
+from src.secrets.manager import secret_manager
+from src.workflow.pipeline import ERROR_MESSAGE_KEYS_NOT_CONFIGURED, STEP_NAMES
+from src.workflow.uploads import UploadRejectedError, close_uploads, receive_uploads
+
+ERROR_MESSAGE_JOB_NOT_FOUND = "指定されたジョブが見つかりません。"
+
+ERROR_MESSAGE_QUEUE_FULL = """\
+現在混み合っています。
+しばらく待ってから再度お試しください。"""
+
+jobs_router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+def _job_status(job: Job) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "step": job.step,
+        "step_name": job.step_name,
+        "total_steps": len(STEP_NAMES),
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+def _not_found() -> JSONResponse:
+    return JSONResponse(
+        content={"success": False, "error_message": ERROR_MESSAGE_JOB_NOT_FOUND},
+        status_code=404,
+    )
+
+
+@jobs_router.post("")
+async def submit_job(request: Request):
+    """ファイル (multipart の files フィールド) を受け取りジョブを登録して、すぐにジョブIDを返す。"""
+    google_key, openai_key, drive_folder_id = await secret_manager.get_pipeline_credentials()
+    if not google_key or not openai_key:
+        return JSONResponse(
+            content={"success": False, "error_message": ERROR_MESSAGE_KEYS_NOT_CONFIGURED}
+        )
+
+    try:
+        uploads = await receive_uploads(request)
+    except UploadRejectedError as e:
+        return JSONResponse(content={"success": False, "error_message": str(e)})
+
+    file_data = [(u.filename, u.content()) for u in uploads]
+    try:
+        job = job_queue.submit(
+            file_data, google_key, openai_key, drive_folder_id,
+            cleanup=lambda: close_uploads(uploads),
+        )
+    except JobQueueFullError:
+        close_uploads(uploads)
+        return JSONResponse(
+            content={"success": False, "error_message": ERROR_MESSAGE_QUEUE_FULL},
+            status_code=503,
+        )
+
+    return JSONResponse(content={"success": True, **_job_status(job)}, status_code=202)
+
+
+@jobs_router.get("/{job_id}")
+async def get_job(job_id: str):
+    """ジョブの状態と実行中のステップを返す。"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return _not_found()
+    return JSONResponse(content={"success": True, **_job_status(job)})
+
+
+@jobs_router.get("/{job_id}/result")
+async def get_job_result(job_id: str):
+    """完了したジョブの PipelineResult を返す。未完了の場合は 202 と状態を返す。"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return _not_found()
+    if not job.finished:
+        return JSONResponse(content={"success": True, **_job_status(job)}, status_code=202)
+    return JSONResponse(content=job.result)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@jobs_router.get("/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """ジョブの進捗 (ステップ開始/完了、明細行) を Server-Sent Events で配信する。
+
+    progress イベントを順に送り、ジョブ終了時に result イベントを送って終了する。
+    このプロセスにイベント履歴がない場合（別のワーカーで実行中のジョブ、再起動前のジョブ）は
+    ジョブストアをポーリングし、状態が変わるたびに status イベントを送る。
+    """
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return _not_found()
+
+    async def stream():
+        if not job_events.has_channel(job_id):
+            async for chunk in _poll_job_status(job):
+                yield chunk
+            return
+        async for event in job_events.subscribe(job_id):
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield _sse(event["event"], event)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _poll_job_status(job: Job) -> AsyncIterator[str]:
+    """ジョブストアをポーリングして status イベントを送り、終了したら result イベントを送る。"""
+    last = None
+    last_sent = time.monotonic()
+    while True:
+        current = _job_status(job)
+        # updated_at はステップ以外の更新でも変わるため比較しない
+        key = (current["status"], current["step"], current["step_name"])
+        if key != last:
+            last = key
+            last_sent = time.monotonic()
+            yield _sse("status", current)
+        elif time.monotonic() - last_sent >= settings.sse_heartbeat_seconds:
+            last_sent = time.monotonic()
+            yield ": keep-alive\n\n"
+        if job.finished:
+            yield _sse("result", {"event": "result", "status": job.status, "result": job.result})
+            return
+        await asyncio.sleep(settings.job_status_poll_seconds)
+        latest = job_queue.store.get(job.id)
+        if latest is None:
+            return
+        job = latest
@@ -0,0 +1,241 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from src.config import settings
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_SUCCEEDED = "succeeded"
+JOB_STATUS_FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = JOB_STATUS_QUEUED
+    step: int = 0
+    step_name: str = ""
+    result: Optional[dict] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    # ジョブを登録したワーカープロセスのPID（ファイルとAPIキーはこのプロセスのメモリにしかない）
+    owner_pid: int = field(default_factory=os.getpid)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_STATUS_SUCCEEDED, JOB_STATUS_FAILED)
+
+
+class JobStore:
+    """ジョブ状態の保存先インターフェース。"""
+
+    def create(self, job: Job) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    def update(self, job: Job) -> None:
+        raise NotImplementedError
+
+    def fail_unfinished(
+        self,
+        result: dict,
+        created_before: Optional[float] = None,
+        owners: Optional[Iterable[int]] = None,
+    ) -> int:
+        """未完了のジョブを失敗扱いにする（プロセス再起動時の後始末）。件数を返す。
+
+        created_before を指定した場合はその時刻より前に登録されたジョブだけを対象にする
+        （複数ワーカーの場合に、他のワーカーが実行中のジョブを失敗扱いにしないため）。
+        owners を指定した場合はそのPIDのワーカーが登録したジョブだけを対象にする。
+        """
+        raise NotImplementedError
+
+    def unfinished_owners(self) -> set[int]:
+        """未完了のジョブを登録したワーカーのPIDを返す。"""
+        raise NotImplementedError
+
+
+class InMemoryJobStore(JobStore):
+    """プロセス内のdictに保存するジョブストア（テスト・単一プロセス用）。"""
+
+    def __init__(self):
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def update(self, job: Job) -> None:
+        job.updated_at = time.time()
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def fail_unfinished(
+        self,
+        result: dict,
+        created_before: Optional[float] = None,
+        owners: Optional[Iterable[int]] = None,
+    ) -> int:
+        owner_set = set(owners) if owners is not None else None
+        count = 0
+        with self._lock:
+            for job in self._jobs.values():
+                if job.finished:
+                    continue
+                if created_before is not None and job.created_at >= created_before:
+                    continue
+                if owner_set is not None and job.owner_pid not in owner_set:
+                    continue
+                job.status = JOB_STATUS_FAILED
+                job.result = result
+                job.updated_at = time.time()
+                count += 1
+        return count
+
+    def unfinished_owners(self) -> set[int]:
+        with self._lock:
+            return {job.owner_pid for job in self._jobs.values() if not job.finished}
+
+
+class SQLiteJobStore(JobStore):
+    """ローカルSQLiteファイルに保存するジョブストア。
+
+    WAL モードで開くため、同じファイルを複数のワーカープロセスで共有できる。
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self._path, timeout=10.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " step INTEGER NOT NULL,"
+                " step_name TEXT NOT NULL,"
+                " result TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " owner_pid INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "owner_pid" not in columns:
+                # 以前のバージョンで作られたテーブル。既存の行の owner_pid は 0（不明）になる
+                try:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN owner_pid INTEGER NOT NULL DEFAULT 0")
+                except sqlite3.OperationalError:
+                    # 他のワーカーが先に追加した
+                    pass
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def create(self, job: Job) -> None:
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT INTO jobs"
+                " (id, status, step, step_name, result, created_at, updated_at, owner_pid)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id, job.status, job.step, job.step_name,
+                    _dump(job.result), job.created_at, job.updated_at, job.owner_pid,
+                ),
+            )
+            conn.commit()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._get_conn().execute(
+                "SELECT id, status, step, step_name, result, created_at, updated_at, owner_pid"
+                " FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return Job(
+            id=row[0],
+            status=row[1],
+            step=row[2],
+            step_name=row[3],
+            result=json.loads(row[4]) if row[4] else None,
+            created_at=row[5],
+            updated_at=row[6],
+            owner_pid=row[7],
+        )
+
+    def update(self, job: Job) -> None:
+        job.updated_at = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                "UPDATE jobs SET status = ?, step = ?, step_name = ?, result = ?, updated_at = ?"
+                " WHERE id = ?",
+                (job.status, job.step, job.step_name, _dump(job.result), job.updated_at, job.id),
+            )
+            conn.commit()
+
+    def fail_unfinished(
+        self,
+        result: dict,
+        created_before: Optional[float] = None,
+        owners: Optional[Iterable[int]] = None,
+    ) -> int:
+        sql = (
+            "UPDATE jobs SET status = ?, result = ?, updated_at = ?"
+            " WHERE status IN (?, ?) AND created_at < ?"
+        )
+        params: list = [
+            JOB_STATUS_FAILED, _dump(result), time.time(),
+            JOB_STATUS_QUEUED, JOB_STATUS_RUNNING,
+            created_before if created_before is not None else float("inf"),
+        ]
+        if owners is not None:
+            owner_list = list(owners)
+            if not owner_list:
+                return 0
+            sql += f" AND owner_pid IN ({', '.join('?' * len(owner_list))})"
+            params.extend(owner_list)
+        with self._lock:
+            conn = self._get_conn()
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.rowcount
+
+    def unfinished_owners(self) -> set[int]:
+        with self._lock:
+            rows = self._get_conn().execute(
+                "SELECT DISTINCT owner_pid FROM jobs WHERE status IN (?, ?)",
+                (JOB_STATUS_QUEUED, JOB_STATUS_RUNNING),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+
+def _dump(result: Optional[dict]) -> Optional[str]:
+    return json.dumps(result, ensure_ascii=False) if result is not None else None
+
+
+def create_job_store() -> JobStore:
+    """設定に応じたジョブストアを生成する。"""
+    if settings.job_store_backend == "memory":
+        return InMemoryJobStore()
+    if settings.job_store_backend == "sqlite":
+        return SQLiteJobStore(settings.job_store_path)
+    raise ValueError(f"未対応のジョブストアです: {settings.job_store_backend}")
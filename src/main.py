@@ -1,16 +1,32 @@
+import asyncio
 import logging
 import pathlib
-from typing import List
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, File, UploadFile, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from src.admin.routes import admin_router
+from src.batch.routes import batches_router
+from src.batch.scheduler import batch_scheduler
+from src.cache.analysis_cache import analysis_cache
+from src.cache.ocr_cache import ocr_cache
 from src.config import settings
+from src.jobs.queue import job_queue
+from src.jobs.routes import jobs_router
+from src.metrics.multiprocess import flush_periodically, render_all
+from src.metrics.pipeline_metrics import cache_families, governor_families, metrics
+from src.metrics.registry import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from src.rules.registry import rule_registry
 from src.secrets.manager import secret_manager
-from src.workflow.pipeline import process_bill
+from src.tracing.tracer import tracer
+from src.workflow.clients import client_registry
+from src.workflow.pipeline import ERROR_MESSAGE_KEYS_NOT_CONFIGURED, process_bill
+from src.workflow.preprocess import shutdown_preprocess_pool
+from src.workflow.ratelimit import governor_registry
+from src.workflow.uploads import UploadRejectedError, close_uploads, receive_uploads
 
 logger = logging.getLogger(__name__)
 
@@ -18,13 +34,40 @@ BASE_DIR = pathlib.Path(__file__).resolve().parent
 TEMPLATES_DIR = BASE_DIR / "templates_jinja"
 STATIC_DIR = BASE_DIR / "static"
 
-app = FastAPI(title="明細抽出くん Ver2")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ルールファイルの不備は起動時に検出する
+    rule_registry.current()
+    # 最初のリクエストが Secret Manager を待たないよう、APIキーを先に取得しておく
+    prefetch = asyncio.create_task(secret_manager.get_pipeline_credentials())
+    await job_queue.start()
+    await batch_scheduler.start()
+    metrics_flush = None
+    if settings.metrics_multiproc_dir:
+        metrics_flush = asyncio.create_task(
+            flush_periodically(metrics, settings.metrics_multiproc_dir, settings.metrics_flush_seconds)
+        )
+    yield
+    prefetch.cancel()
+    if metrics_flush is not None:
+        metrics_flush.cancel()
+    await batch_scheduler.stop()
+    await job_queue.stop()
+    shutdown_preprocess_pool()
+    await client_registry.aclose()
+    tracer.shutdown()
+
+
+app = FastAPI(title="明細抽出くん Ver2", lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
 app.include_router(admin_router)
+app.include_router(jobs_router)
+app.include_router(batches_router)
 
 
 @app.get("/")
@@ -33,53 +76,32 @@ async def index(request: Request):
 
 
 @app.post("/extract")
-async def extract_bill(files: List[UploadFile] = File(...)):
-    """ファイルを受け取り、明細抽出パイプラインを実行する。"""
-    # バリデーション: ファイル数
-    if len(files) > settings.max_file_count:
-        return JSONResponse(
-            content={
-                "success": False,
-                "error_message": f"ファイルは同時に{settings.max_file_count}枚までです。",
-            }
-        )
-
-    # バリデーション: ファイル形式
-    allowed_ext = {".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg"}
-    for f in files:
-        ext = "." + f.filename.rsplit(".", 1)[-1].lower() if "." in f.filename else ""
-        if ext not in allowed_ext:
-            return JSONResponse(
-                content={
-                    "success": False,
-                    "error_message": f"サポートされていないファイル形式です: {f.filename}",
-                }
-            )
-
-    # APIキー取得
-    google_key = await secret_manager.get_google_api_key()
-    openai_key = await secret_manager.get_openai_api_key()
+async def extract_bill(request: Request):
+    """ファイル (multipart の files フィールド) を受け取り、明細抽出パイプラインを実行する。"""
+    # APIキー・DriveフォルダID取得
+    google_key, openai_key, drive_folder_id = await secret_manager.get_pipeline_credentials()
     if not google_key or not openai_key:
         return JSONResponse(
             content={
                 "success": False,
-                "error_message": "APIキーが設定されていません。管理者に連絡してください。",
+                "error_message": ERROR_MESSAGE_KEYS_NOT_CONFIGURED,
             }
         )
 
-    # DriveフォルダID取得
-    drive_folder_id = await secret_manager.get_drive_folder_id()
-
-    # ファイル読み込み
-    file_data: list[tuple[str, bytes]] = []
-    for f in files:
-        content = await f.read()
-        file_data.append((f.filename, content))
+    # ファイル受信 (チャンク単位でスプールし、サイズ上限を受信中に検証する)
+    try:
+        uploads = await receive_uploads(request)
+    except UploadRejectedError as e:
+        return JSONResponse(content={"success": False, "error_message": str(e)})
 
     # パイプライン実行
-    filenames = [f.filename for f in files]
+    filenames = [u.filename for u in uploads]
     logger.info("パイプライン開始: files=%s, drive_folder_id=%s", filenames, drive_folder_id)
-    result = await process_bill(file_data, google_key, openai_key, drive_folder_id)
+    try:
+        file_data = [(u.filename, u.content()) for u in uploads]
+        result = await process_bill(file_data, google_key, openai_key, drive_folder_id)
+    finally:
+        close_uploads(uploads)
 
     if result.success:
         logger.info("パイプライン成功: filename=%s", result.filename)
@@ -96,6 +118,23 @@ async def extract_bill(files: List[UploadFile] = File(...)):
     )
 
 
+metrics.add_collector(lambda: cache_families([ocr_cache, analysis_cache]))
+metrics.add_collector(lambda: governor_families(governor_registry.snapshot()))
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus テキスト形式でメトリクスを返す。
+
+    metrics_multiproc_dir を設定した場合は、どのワーカーが受けても全ワーカーの合算を返す。
+    """
+    if settings.metrics_multiproc_dir:
+        content = await asyncio.to_thread(render_all, metrics, settings.metrics_multiproc_dir)
+    else:
+        content = metrics.render()
+    return Response(content=content, media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
@@ -0,0 +1,70 @@
+"""gunicorn の複数ワーカーのメトリクスを共有ディレクトリで合算する。
+
+各ワーカーは自分の値を <metrics_multiproc_dir>/<pid>.json に定期的に書き出し、
+/metrics を受けたワーカーが全ワーカーのファイルを読んで合算して返す。
+終了したワーカーのカウンター・ヒストグラムは合算し続けるが（合計が減らないように）、
+ゲージ（実行中の呼び出し数など）は生きているワーカーの分だけを合算する。
+"""
+
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+
+from src.metrics.registry import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def write_snapshot(registry: MetricsRegistry, directory: str) -> None:
+    """このワーカーの値を書き出す。読み込み中のファイルを壊さないよう置き換えで書く。"""
+    path = Path(directory) / f"{os.getpid()}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(registry.snapshot(), ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def read_snapshots(directory: str) -> list[dict]:
+    """全ワーカーの値を読む。終了したワーカーのゲージは除く。"""
+    snapshots: list[dict] = []
+    for path in sorted(Path(directory).glob("*.json")):
+        try:
+            pid = int(path.stem)
+            snapshot = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning("メトリクスのファイルを読めませんでした: %s (%s)", path, e)
+            continue
+        if not _process_alive(pid):
+            snapshot["families"] = [f for f in snapshot["families"] if f[1] != "gauge"]
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def render_all(registry: MetricsRegistry, directory: str) -> str:
+    """このワーカーの最新値を書き出してから、全ワーカーの合算を Prometheus テキスト形式で返す。"""
+    write_snapshot(registry, directory)
+    return registry.render(read_snapshots(directory))
+
+
+async def flush_periodically(registry: MetricsRegistry, directory: str, interval: float) -> None:
+    """interval 秒ごとに write_snapshot する（アプリの lifespan でタスクとして動かす）。"""
+    while True:
+        try:
+            await asyncio.to_thread(write_snapshot, registry, directory)
+        except OSError as e:
+            logger.warning("メトリクスを書き出せませんでした: %s", e)
+        await asyncio.sleep(interval)
+
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
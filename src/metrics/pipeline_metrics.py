@@ -0,0 +1,137 @@
+import time
+from typing import Iterable, Optional
+
+from src.metrics.registry import Family, MetricsRegistry
+
+# アプリ全体で共有するレジストリ
+metrics = MetricsRegistry()
+
+_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+_BYTES_BUCKETS = tuple(2 ** n for n in range(10, 30, 2))  # 1KB 〜 256MB
+
+stage_duration = metrics.histogram(
+    "meisaisyo_stage_duration_seconds",
+    "パイプラインの各ステップの所要時間",
+    _LATENCY_BUCKETS,
+    ("stage",),
+)
+stage_bytes = metrics.histogram(
+    "meisaisyo_stage_bytes",
+    "パイプラインの各ステップの入出力サイズ（バイト）",
+    _BYTES_BUCKETS,
+    ("stage", "direction"),
+)
+pipeline_duration = metrics.histogram(
+    "meisaisyo_pipeline_duration_seconds",
+    "process_bill 全体の所要時間",
+    _LATENCY_BUCKETS,
+    ("outcome",),
+)
+pipeline_failures = metrics.counter(
+    "meisaisyo_pipeline_failures_total",
+    "失敗したステップとエラー種別ごとのパイプライン失敗数",
+    ("stage", "category"),
+)
+llm_tokens = metrics.counter(
+    "meisaisyo_llm_tokens_total",
+    "Gemini / OpenAI の usage に記録されたトークン数",
+    ("provider", "model", "kind"),
+)
+api_retries = metrics.counter(
+    "meisaisyo_api_retries_total",
+    "Gemini / OpenAI 呼び出しの再試行数（rate_limited: 429, transient: 5xx・通信エラー）",
+    ("provider", "reason"),
+)
+
+
+def record_tokens(provider: str, model: str, prompt: Optional[int], completion: Optional[int]) -> None:
+    """APIレスポンスの usage からトークン数を記録する。usage がない場合は何もしない。"""
+    if prompt:
+        llm_tokens.inc(prompt, provider=provider, model=model, kind="prompt")
+    if completion:
+        llm_tokens.inc(completion, provider=provider, model=model, kind="completion")
+
+
+def cache_families(caches: Iterable) -> list[Family]:
+    """TieredCache の stats() をメトリクスとして出力する（/metrics の出力時にだけ呼ばれる）。"""
+    requests: list = []
+    entries: list = []
+    for cache in caches:
+        stats = cache.stats()
+        name = cache.namespace
+        requests.append(({"cache": name, "result": "memory_hit"}, stats["hits"] - stats["disk_hits"]))
+        requests.append(({"cache": name, "result": "disk_hit"}, stats["disk_hits"]))
+        requests.append(({"cache": name, "result": "miss"}, stats["misses"]))
+        entries.append(({"cache": name}, stats["memory_entries"]))
+    return [
+        ("meisaisyo_cache_requests_total", "counter", "キャッシュの参照結果ごとの件数", requests),
+        ("meisaisyo_cache_memory_entries", "gauge", "キャッシュのメモリ層のエントリ数", entries),
+    ]
+
+
+def governor_families(governors: Iterable) -> list[Family]:
+    """RateGovernor の同時実行数の上限と 429 の回数を出力する（/metrics の出力時にだけ呼ばれる）。
+
+    同じプロバイダで複数のAPIキーがある場合（キーのローテーション直後など）は合算する。
+    """
+    limits: dict[str, float] = {}
+    in_flight: dict[str, float] = {}
+    throttled: dict[str, float] = {}
+    for provider, governor in governors:
+        limits[provider] = limits.get(provider, 0) + int(governor.limit)
+        in_flight[provider] = in_flight.get(provider, 0) + governor.in_flight
+        throttled[provider] = throttled.get(provider, 0) + governor.throttled
+    return [
+        (
+            "meisaisyo_api_concurrency_limit",
+            "gauge",
+            "429 に応じて調整された同時実行数の上限",
+            [({"provider": p}, v) for p, v in sorted(limits.items())],
+        ),
+        (
+            "meisaisyo_api_in_flight",
+            "gauge",
+            "実行中の Gemini / OpenAI 呼び出し数",
+            [({"provider": p}, v) for p, v in sorted(in_flight.items())],
+        ),
+        (
+            "meisaisyo_api_throttled_total",
+            "counter",
+            "Gemini / OpenAI から受けた 429 の数",
+            [({"provider": p}, v) for p, v in sorted(throttled.items())],
+        ),
+    ]
+
+
+class StageRecorder:
+    """process_bill 1回分のステップ計測。PipelineEvent を受け取る進捗コールバックとして使う。
+
+    started/completed の間隔をステップの所要時間として記録し、失敗時は
+    その時点で実行中だったステップを失敗ステップとして記録する。
+    """
+
+    def __init__(self):
+        self._started_at = time.perf_counter()
+        self._stage_started: dict[str, float] = {}
+        self.current_stage = "init"
+        self.failure_category: Optional[str] = None
+
+    def __call__(self, event) -> None:
+        if event.status == "started":
+            self._stage_started[event.name] = time.perf_counter()
+            self.current_stage = event.name
+        elif event.status == "completed":
+            started = self._stage_started.pop(event.name, None)
+            if started is not None:
+                stage_duration.observe(time.perf_counter() - started, stage=event.name)
+
+    def bytes(self, stage: str, direction: str, size: int) -> None:
+        stage_bytes.observe(size, stage=stage, direction=direction)
+
+    def succeeded(self) -> None:
+        pipeline_duration.observe(time.perf_counter() - self._started_at, outcome="success")
+
+    def failed(self, category: str) -> None:
+        self.failure_category = category
+        pipeline_failures.inc(stage=self.current_stage, category=category)
+        pipeline_duration.observe(time.perf_counter() - self._started_at, outcome="failure")
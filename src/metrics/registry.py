@@ -0,0 +1,254 @@
+import bisect
+import math
+import threading
+from typing import Callable, Iterable, Optional
+
+# Prometheus テキスト形式 (version 0.0.4)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (ラベル, 値) の組。collector が返すサンプル
+Sample = tuple[dict[str, str], float]
+# (メトリクス名, 種別, 説明, サンプル列)
+Family = tuple[str, str, str, list[Sample]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self, values: Optional[dict] = None) -> list[str]:
+        """values を渡した場合は、このプロセスの値の代わりにそれを出力する（merge の結果）。"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples(self._copy_values() if values is None else values))
+        return lines
+
+    def state(self) -> list:
+        """このプロセスの値を JSON にできる形で返す（ワーカー間の合算用）。"""
+        raise NotImplementedError
+
+    def merge(self, states: Iterable[list]) -> dict:
+        """複数プロセスの state() を合算し、render に渡せる値にする。"""
+        raise NotImplementedError
+
+    def _copy_values(self) -> dict:
+        raise NotImplementedError
+
+    def _render_samples(self, values: dict) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """単調増加するカウンター。"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def state(self) -> list:
+        return [[list(key), value] for key, value in self._copy_values().items()]
+
+    def merge(self, states: Iterable[list]) -> dict:
+        values: dict[tuple[str, ...], float] = {}
+        for state in states:
+            for key, value in state:
+                values[tuple(key)] = values.get(tuple(key), 0.0) + value
+        return values
+
+    def _copy_values(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def _render_samples(self, values: dict) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """累積バケットのヒストグラム。observe はバケットの二分探索と加算のみ。"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        buckets: Iterable[float],
+        labelnames: tuple[str, ...] = (),
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = sorted(buckets)
+        # ラベルごとに [バケットごとの件数..., +Inf の件数], 合計
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def state(self) -> list:
+        return [[list(key), counts, total] for key, (counts, total) in self._copy_values().items()]
+
+    def merge(self, states: Iterable[list]) -> dict:
+        values: dict[tuple[str, ...], tuple[list[int], float]] = {}
+        for state in states:
+            for key, counts, total in state:
+                if len(counts) != len(self.buckets) + 1:
+                    # バケット定義の異なる旧バージョンのワーカーの値は合算しない
+                    continue
+                merged, merged_total = values.get(tuple(key), ([0] * len(counts), 0.0))
+                values[tuple(key)] = ([a + b for a, b in zip(merged, counts)], merged_total + total)
+        return values
+
+    def _copy_values(self) -> dict:
+        with self._lock:
+            return {key: (list(counts), total[0]) for key, (counts, total) in self._values.items()}
+
+    def _render_samples(self, values: dict) -> list[str]:
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip([*self.buckets, math.inf], counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスを保持し、Prometheus テキスト形式で出力するレジストリ。
+
+    collector は出力時にだけ呼ばれる関数で、既存の統計値（キャッシュのヒット数など）を
+    ホットパスに手を入れずに公開するのに使う。
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"メトリクス名が重複しています: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        buckets: Iterable[float],
+        labelnames: tuple[str, ...] = (),
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets, labelnames))
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        self._collectors.append(collector)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def snapshot(self) -> dict:
+        """メトリクスと collector の現在値を JSON にできる形で返す（ワーカー間の合算用）。"""
+        return {
+            "metrics": {name: metric.state() for name, metric in list(self._metrics.items())},
+            "families": [
+                [name, type_name, help_text, [[labels, value] for labels, value in samples]]
+                for collector in self._collectors
+                for name, type_name, help_text, samples in collector()
+            ],
+        }
+
+    def render(self, snapshots: Optional[list[dict]] = None) -> str:
+        """Prometheus テキスト形式で出力する。
+
+        snapshots (snapshot() の結果のリスト) を渡した場合は、それらを合算して出力する。
+        カウンター・ヒストグラム・ゲージのいずれもラベルが同じサンプルの値を足し合わせる。
+        """
+        lines: list[str] = []
+        if snapshots is None:
+            for metric in list(self._metrics.values()):
+                lines.extend(metric.render())
+            families = [family for collector in self._collectors for family in collector()]
+        else:
+            for name, metric in list(self._metrics.items()):
+                lines.extend(metric.render(metric.merge(s["metrics"].get(name, []) for s in snapshots)))
+            families = _merge_families(family for s in snapshots for family in s["families"])
+        for name, type_name, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for labels, value in samples:
+                label_text = _format_labels(tuple(labels), tuple(labels.values()))
+                lines.append(f"{name}{label_text} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge_families(families: Iterable) -> list[Family]:
+    """複数プロセスの collector の出力を、名前とラベルが同じサンプルごとに合算する。"""
+    merged: dict[str, tuple[str, str, dict[tuple, Sample]]] = {}
+    for name, type_name, help_text, samples in families:
+        _, _, by_labels = merged.setdefault(name, (type_name, help_text, {}))
+        for labels, value in samples:
+            key = tuple(labels.items())
+            previous = by_labels.get(key)
+            by_labels[key] = (labels, value + (previous[1] if previous else 0))
+    return [
+        (name, type_name, help_text, list(by_labels.values()))
+        for name, (type_name, help_text, by_labels) in merged.items()
+    ]
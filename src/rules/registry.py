@@ -0,0 +1,288 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from src.config import settings
+from src.workflow.analyzer import PROMPT_MAP
+from src.workflow.router import COMPANY_RULES, CompanyType, RouterEngine, router_engine
+
+logger = logging.getLogger(__name__)
+
+RULE_FILE_SUFFIXES = (".json", ".yaml", ".yml")
+_VENDOR_KEYS = {"name", "company", "keywords", "prompt", "prompt_file"}
+
+
+class RuleLoadError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    """会社判定ルールと明細分析プロンプトのスナップショット。
+
+    パイプラインは開始時に取得したスナップショットを最後まで使うため、
+    実行中にリロードされても処理中のリクエストには影響しない。
+    version は内容から決まる文字列で、同じ内容ならプロセスをまたいでも同じ値になる。
+    generation はこのプロセスでリロードするたびに1ずつ増える。
+    prompts は会社種別ごとの既定のプロンプト、vendor_prompts はベンダー名ごとのプロンプト。
+    """
+
+    version: str
+    generation: int
+    rules: list[tuple[CompanyType, list[str]]]
+    prompts: dict[CompanyType, str]
+    engine: RouterEngine
+    vendors: list[Optional[str]] = field(default_factory=list)
+    vendor_prompts: dict[str, str] = field(default_factory=dict)
+
+    def prompt_for(self, company: CompanyType, vendor: Optional[str] = None) -> str:
+        """ベンダーのプロンプトがあればそれを、なければ会社種別の既定のプロンプトを返す。"""
+        if vendor is not None and vendor in self.vendor_prompts:
+            return self.vendor_prompts[vendor]
+        return self.prompts[company]
+
+
+def _content_hash(
+    rules: list[tuple[CompanyType, list[str]]],
+    prompts: dict[CompanyType, str],
+    vendors: Optional[list[Optional[str]]] = None,
+    vendor_prompts: Optional[dict[str, str]] = None,
+) -> str:
+    h = hashlib.sha256()
+    for company, keywords in rules:
+        h.update("\0".join([company.value, *keywords, ""]).encode("utf-8"))
+    for company, prompt in prompts.items():
+        h.update("\0".join([company.value, prompt, ""]).encode("utf-8"))
+    for vendor in vendors or []:
+        h.update(f"{vendor or ''}\0".encode("utf-8"))
+    for vendor, prompt in (vendor_prompts or {}).items():
+        h.update("\0".join([vendor, prompt, ""]).encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+def _builtin_ruleset(generation: int = 0) -> RuleSet:
+    return RuleSet(
+        version=f"builtin@{_content_hash(COMPANY_RULES, PROMPT_MAP)}",
+        generation=generation,
+        rules=list(COMPANY_RULES),
+        prompts=dict(PROMPT_MAP),
+        engine=router_engine,
+    )
+
+
+def _rule_files(path: Path) -> list[Path]:
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.suffix.lower() in RULE_FILE_SUFFIXES)
+    return [path]
+
+
+def _parse_file(path: Path) -> dict[str, Any]:
+    try:
+        text = path.read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError) as e:
+        raise RuleLoadError(f"ルールファイルを読み込めません: {path}: {e}") from e
+    if path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as e:
+            raise RuleLoadError(f"YAMLのルールファイルには PyYAML が必要です: {path}") from e
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise RuleLoadError(f"YAMLの解析に失敗しました: {path}: {e}") from e
+    else:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise RuleLoadError(f"JSONの解析に失敗しました: {path}: {e}") from e
+    if not isinstance(data, dict) or not isinstance(data.get("vendors"), list):
+        raise RuleLoadError(f"vendors のリストがありません: {path}")
+    return data
+
+
+def load_ruleset(source: str, generation: int = 0) -> tuple[RuleSet, list[Path]]:
+    """ルールファイル（JSON/YAML）またはディレクトリを読み込んで検証し、RuleSet を作る。
+
+    ファイルの形式::
+
+        version: "2025-10-01"
+        vendors:
+          - name: KDDI
+            company: other          # CompanyType の値
+            keywords: [KDDI, ＫＤＤＩ]
+            prompt_file: kddi.md    # 任意。prompt で直接書いてもよい
+
+    vendors の並びがDSLの評価順序になる。ディレクトリの場合はファイル名順に連結する。
+    プロンプトはベンダー (name) ごとに登録し、そのベンダーのキーワードで判定された
+    場合だけ使う。同じ company の他のベンダーや、プロンプトを指定しないベンダーは
+    PROMPT_MAP の組み込みプロンプトを使う。プロンプトを指定する場合は name が必須。
+
+    Returns:
+        (RuleSet, 変更を監視すべきファイルのリスト)
+
+    Raises:
+        RuleLoadError: 読み込みまたは検証に失敗した場合
+    """
+    root = Path(source)
+    if not root.exists():
+        raise RuleLoadError(f"ルールファイルが見つかりません: {source}")
+    files = _rule_files(root)
+    if not files:
+        raise RuleLoadError(f"ルールファイルがありません: {source}")
+
+    watched = list(files)
+    rules: list[tuple[CompanyType, list[str]]] = []
+    vendors: list[Optional[str]] = []
+    vendor_prompts: dict[str, str] = {}
+    declared: list[str] = []
+
+    for path in files:
+        data = _parse_file(path)
+        if data.get("version") is not None:
+            declared.append(str(data["version"]))
+        for i, vendor in enumerate(data["vendors"]):
+            where = f"{path}: vendors[{i}]"
+            if not isinstance(vendor, dict):
+                raise RuleLoadError(f"{where}: オブジェクトではありません")
+            unknown = set(vendor) - _VENDOR_KEYS
+            if unknown:
+                raise RuleLoadError(f"{where}: 不明なキー {sorted(unknown)}")
+            try:
+                company = CompanyType(vendor.get("company"))
+            except ValueError:
+                raise RuleLoadError(f"{where}: 不明な company {vendor.get('company')!r}") from None
+            keywords = vendor.get("keywords")
+            if not isinstance(keywords, list) or not keywords or not all(
+                isinstance(k, str) and k.strip() for k in keywords
+            ):
+                raise RuleLoadError(f"{where}: keywords は空でない文字列のリストにしてください")
+
+            prompt = vendor.get("prompt")
+            if vendor.get("prompt_file") is not None:
+                if prompt is not None:
+                    raise RuleLoadError(f"{where}: prompt と prompt_file は同時に指定できません")
+                prompt_path = path.parent / str(vendor["prompt_file"])
+                try:
+                    prompt = prompt_path.read_text(encoding="utf-8")
+                except (OSError, UnicodeDecodeError) as e:
+                    raise RuleLoadError(f"{where}: プロンプトを読み込めません: {e}") from e
+                watched.append(prompt_path)
+            name = vendor.get("name")
+            if name is not None and (not isinstance(name, str) or not name.strip()):
+                raise RuleLoadError(f"{where}: name は空でない文字列にしてください")
+            if prompt is not None:
+                if not isinstance(prompt, str) or not prompt.strip():
+                    raise RuleLoadError(f"{where}: prompt が空です")
+                if name is None:
+                    raise RuleLoadError(f"{where}: プロンプトを指定する場合は name が必要です")
+                if vendor_prompts.get(name, prompt) != prompt:
+                    raise RuleLoadError(f"{where}: {name} に異なるプロンプトが指定されています")
+                vendor_prompts[name] = prompt
+
+            rules.append((company, keywords))
+            vendors.append(name)
+
+    label = "+".join(declared) or "rules"
+    prompts = dict(PROMPT_MAP)
+    ruleset = RuleSet(
+        version=f"{label}@{_content_hash(rules, prompts, vendors, vendor_prompts)}",
+        generation=generation,
+        rules=rules,
+        prompts=prompts,
+        engine=RouterEngine(rules, vendors),
+        vendors=vendors,
+        vendor_prompts=vendor_prompts,
+    )
+    return ruleset, watched
+
+
+def _fingerprint(paths: list[Path]) -> tuple:
+    result = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            result.append((str(path), stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            result.append((str(path), None, None))
+    return tuple(result)
+
+
+class RuleRegistry:
+    """ルールとプロンプトを保持し、ソースの変更を検知して自動でリロードするレジストリ。
+
+    current() の呼び出し時に、前回の確認から reload_interval 秒以上経っていれば
+    ファイルの更新日時とサイズを確認する（監視スレッドは使わない）。
+    リロードに失敗した場合はエラーをログに出して直前のルールを使い続ける。
+    source が空の場合は COMPANY_RULES と PROMPT_MAP の組み込みルールを使う。
+    """
+
+    def __init__(self, source: str = "", reload_interval: float = 5.0):
+        self.source = source
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._ruleset: Optional[RuleSet] = None
+        self._watched: list[Path] = []
+        self._fingerprint: tuple = ()
+        self._checked_at = 0.0
+        self._generation = 0
+
+    def current(self) -> RuleSet:
+        """現在のルールセットを返す。初回の読み込みに失敗した場合は RuleLoadError を送出する。"""
+        ruleset = self._ruleset
+        if ruleset is None:
+            return self.reload()
+        if self.source and time.monotonic() - self._checked_at >= self.reload_interval:
+            self._check_for_changes()
+        return self._ruleset
+
+    def reload(self) -> RuleSet:
+        """ソースを読み直してルールセットを差し替える。"""
+        with self._lock:
+            return self._reload_locked()
+
+    def _reload_locked(self) -> RuleSet:
+        self._checked_at = time.monotonic()
+        generation = self._generation + 1
+        try:
+            if self.source:
+                ruleset, self._watched = load_ruleset(self.source, generation)
+            else:
+                ruleset = _builtin_ruleset(generation)
+        finally:
+            # 失敗した場合も記録し、ファイルが再び変更されるまでリロードを試みない
+            self._fingerprint = _fingerprint(self._watch_paths())
+        self._generation = generation
+        self._ruleset = ruleset
+        logger.info("ルールを読み込みました: version=%s, generation=%d", ruleset.version, generation)
+        return ruleset
+
+    def _watch_paths(self) -> list[Path]:
+        """監視対象のパス。ディレクトリの場合はファイルの追加・削除も検知する。"""
+        if not self.source:
+            return []
+        root = Path(self.source)
+        paths = set(self._watched)
+        paths.update(_rule_files(root) if root.is_dir() else [root])
+        return sorted(paths)
+
+    def _check_for_changes(self) -> None:
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = time.monotonic()
+            if _fingerprint(self._watch_paths()) == self._fingerprint:
+                return
+            try:
+                self._reload_locked()
+            except RuleLoadError:
+                logger.exception("ルールのリロードに失敗しました。直前のルールを使い続けます")
+
+
+# シングルトンインスタンス
+rule_registry = RuleRegistry(settings.rules_path, settings.rules_reload_interval_seconds)
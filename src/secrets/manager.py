@@ -1,89 +1,143 @@
+import asyncio
+import logging
+import threading
 import time
 from typing import Optional
 
+from src.cache.store import TieredCache
 from src.config import settings
 
+logger = logging.getLogger(__name__)
+
 
 class SecretManagerClient:
-    """Google Cloud Secret Manager のラッパー（5分インメモリキャッシュ付き）。
+    """Google Cloud Secret Manager のラッパー（5分キャッシュ付き）。
 
     USE_LOCAL_ENV=true の場合は環境変数/.envから直接読み込む。
+    SECRET_CACHE_PATH を指定するとキャッシュをワーカー間で共有し、管理画面で
+    更新したキーが他のワーカーにも反映される（各ワーカーのメモリ上のキャッシュが切れた時点で）。
+
+    Secret Manager の呼び出しはスレッドで実行し、イベントループをブロックしない。
+    同じシークレットを同時に取得するリクエストは1回の呼び出しを共有し、
+    期限切れが近いエントリはキャッシュの値を返しながらバックグラウンドで再取得する。
     """
 
     def __init__(self):
-        self._cache: dict[str, tuple[str, float]] = {}
-        self._cache_ttl = 300  # 5 minutes
+        self._cache_ttl = settings.secret_cache_ttl_seconds
+        self._cache = TieredCache(
+            namespace="secrets",
+            max_entries=32,
+            disk_path=settings.secret_cache_path,
+            ttl_seconds=self._cache_ttl,
+            private=True,
+        )
         self._sm_client = None
+        self._sm_client_lock = threading.Lock()
+        # 取得中のシークレット（single-flight）
+        self._inflight: dict[str, asyncio.Task] = {}
+        # set_secret のたびに増やし、それより前に始まった取得結果でキャッシュを上書きしない
+        self._generations: dict[str, int] = {}
 
     def _get_sm_client(self):
-        if self._sm_client is None:
-            from google.cloud import secretmanager
-            self._sm_client = secretmanager.SecretManagerServiceClient()
-        return self._sm_client
+        with self._sm_client_lock:
+            if self._sm_client is None:
+                from google.cloud import secretmanager
+                self._sm_client = secretmanager.SecretManagerServiceClient()
+            return self._sm_client
 
     def _get_from_cache(self, key: str) -> Optional[str]:
-        if key in self._cache:
-            value, ts = self._cache[key]
-            if time.time() - ts < self._cache_ttl:
-                return value
-            del self._cache[key]
-        return None
+        return self._cache.get(key)
 
     def _set_cache(self, key: str, value: str):
-        self._cache[key] = (value, time.time())
+        self._cache.set(key, value)
 
     async def get_secret(self, secret_id: str) -> Optional[str]:
         """シークレット値を取得する。キャッシュがあればキャッシュから返す。"""
         if settings.use_local_env:
             return self._get_local_env(secret_id)
 
-        cached = self._get_from_cache(secret_id)
-        if cached is not None:
-            return cached
+        entry = await self._cache.aget_entry(secret_id)
+        if entry is not None:
+            value, created_at = entry
+            if time.time() - created_at >= self._cache_ttl - settings.secret_refresh_ahead_seconds:
+                self._load(secret_id)
+            return value
 
+        # 呼び出し元がキャンセルされても、共有している取得処理は止めない
+        return await asyncio.shield(self._load(secret_id))
+
+    def _load(self, secret_id: str) -> asyncio.Task:
+        """secret_id の取得タスクを返す。取得中ならそのタスクを共有する。"""
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get(secret_id)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(self._fetch(secret_id))
+            self._inflight[secret_id] = task
+
+            def done(t: asyncio.Task) -> None:
+                if self._inflight.get(secret_id) is t:
+                    del self._inflight[secret_id]
+
+            task.add_done_callback(done)
+        return task
+
+    async def _fetch(self, secret_id: str) -> Optional[str]:
+        generation = self._generations.get(secret_id, 0)
         try:
-            client = self._get_sm_client()
-            name = f"projects/{settings.gcp_project_id}/secrets/{secret_id}/versions/latest"
-            response = client.access_secret_version(request={"name": name})
-            value = response.payload.data.decode("utf-8")
-            self._set_cache(secret_id, value)
-            return value
-        except Exception:
+            value = await asyncio.to_thread(self._access_secret, secret_id)
+        except Exception as e:
+            logger.warning("シークレットを取得できませんでした: %s: %s", secret_id, e)
             return None
+        if self._generations.get(secret_id, 0) != generation:
+            # 取得中に set_secret で更新された
+            return await self._cache.aget(secret_id) or value
+        await self._cache.aset(secret_id, value)
+        return value
+
+    def _access_secret(self, secret_id: str) -> str:
+        client = self._get_sm_client()
+        name = f"projects/{settings.gcp_project_id}/secrets/{secret_id}/versions/latest"
+        response = client.access_secret_version(request={"name": name})
+        return response.payload.data.decode("utf-8")
 
     async def set_secret(self, secret_id: str, value: str) -> bool:
         """シークレットに新しいバージョンを追加する。"""
+        self._generations[secret_id] = self._generations.get(secret_id, 0) + 1
         if settings.use_local_env:
             # ローカルモードでは環境変数を更新できないため、キャッシュのみ更新
             self._set_cache(secret_id, value)
             return True
 
         try:
-            client = self._get_sm_client()
-            parent = f"projects/{settings.gcp_project_id}/secrets/{secret_id}"
-
-            # シークレットが存在しない場合は作成
-            try:
-                client.get_secret(request={"name": parent})
-            except Exception:
-                client.create_secret(
-                    request={
-                        "parent": f"projects/{settings.gcp_project_id}",
-                        "secret_id": secret_id,
-                        "secret": {"replication": {"automatic": {}}},
-                    }
-                )
-
-            client.add_secret_version(
+            await asyncio.to_thread(self._add_secret_version, secret_id, value)
+        except Exception as e:
+            logger.warning("シークレットを更新できませんでした: %s: %s", secret_id, e)
+            return False
+        await self._cache.aset(secret_id, value)
+        return True
+
+    def _add_secret_version(self, secret_id: str, value: str) -> None:
+        client = self._get_sm_client()
+        parent = f"projects/{settings.gcp_project_id}/secrets/{secret_id}"
+
+        # シークレットが存在しない場合は作成
+        try:
+            client.get_secret(request={"name": parent})
+        except Exception:
+            client.create_secret(
                 request={
-                    "parent": parent,
-                    "payload": {"data": value.encode("utf-8")},
+                    "parent": f"projects/{settings.gcp_project_id}",
+                    "secret_id": secret_id,
+                    "secret": {"replication": {"automatic": {}}},
                 }
             )
-            self._set_cache(secret_id, value)
-            return True
-        except Exception:
-            return False
+
+        client.add_secret_version(
+            request={
+                "parent": parent,
+                "payload": {"data": value.encode("utf-8")},
+            }
+        )
 
     async def get_google_api_key(self) -> Optional[str]:
         return await self.get_secret(settings.secret_id_google_key)
@@ -98,10 +152,20 @@ class SecretManagerClient:
         value = await self.get_secret(settings.secret_id_drive_folder)
         return value or settings.drive_folder_id
 
+    async def get_pipeline_credentials(self) -> tuple[Optional[str], Optional[str], str]:
+        """パイプライン実行に必要な (Google APIキー, OpenAI APIキー, DriveフォルダID) を並列に取得して返す。"""
+        google_key, openai_key, drive_folder_id = await asyncio.gather(
+            self.get_google_api_key(),
+            self.get_openai_api_key(),
+            self.get_drive_folder_id(),
+        )
+        return google_key, openai_key, drive_folder_id
+
     async def check_keys_configured(self) -> dict[str, bool]:
         """各APIキーの設定状態を確認する（値は返さない）。"""
-        google_key = await self.get_google_api_key()
-        openai_key = await self.get_openai_api_key()
+        google_key, openai_key = await asyncio.gather(
+            self.get_google_api_key(), self.get_openai_api_key()
+        )
         return {
             "google_api_key": bool(google_key),
             "openai_api_key": bool(openai_key),
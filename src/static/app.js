@@ -75,42 +75,152 @@ function renderFileList() {
 }
 
 // Form submission
+// 処理はジョブとして登録し、進捗は Server-Sent Events (/jobs/{id}/events) で受け取る。
+// ジョブIDを sessionStorage に保存し、ページを再読み込みしても同じジョブの進捗表示に戻る。
+const JOB_STORAGE_KEY = 'meisaisyo.jobId';
+const RESULT_POLL_INTERVAL_MS = 2000;
+const NETWORK_ERROR_MESSAGE = 'ネットワークエラーが発生しました。もう一度お試しください。';
+
+let eventSource = null;
+
 uploadForm.addEventListener('submit', async (e) => {
     e.preventDefault();
     if (selectedFiles.length === 0) return;
 
-    uploadArea.classList.add('hidden');
-    processing.classList.remove('hidden');
-    result.classList.add('hidden');
-    errorDiv.classList.add('hidden');
+    showProcessing();
 
     const formData = new FormData();
     selectedFiles.forEach(file => formData.append('files', file));
 
     try {
-        const response = await fetch('/extract', {
+        const response = await fetch('/jobs', {
             method: 'POST',
             body: formData,
         });
         const data = await response.json();
+        if (!data.success) {
+            showError(data.error_message);
+            return;
+        }
+        sessionStorage.setItem(JOB_STORAGE_KEY, data.job_id);
+        watchJob(data.job_id);
+    } catch (err) {
+        showError(NETWORK_ERROR_MESSAGE);
+    }
+});
+
+function showProcessing() {
+    uploadArea.classList.add('hidden');
+    processing.classList.remove('hidden');
+    result.classList.add('hidden');
+    errorDiv.classList.add('hidden');
+    document.querySelectorAll('#progress-steps li').forEach(li => {
+        li.classList.remove('step-running', 'step-done');
+        li.querySelector('.step-detail').textContent = '';
+    });
+}
+
+function watchJob(jobId) {
+    closeEventSource();
+    eventSource = new EventSource(`/jobs/${encodeURIComponent(jobId)}/events`);
+    eventSource.addEventListener('progress', (e) => applyProgress(JSON.parse(e.data)));
+    eventSource.addEventListener('status', (e) => applyStatus(JSON.parse(e.data)));
+    eventSource.addEventListener('result', (e) => finishJob(JSON.parse(e.data).result));
+    eventSource.onerror = () => {
+        // 接続が切れた場合はブラウザが自動で再接続する。
+        // 再接続できない場合（サーバー再起動でジョブが消えた等）は結果をポーリングする
+        if (eventSource.readyState === EventSource.CLOSED) {
+            closeEventSource();
+            pollResult(jobId);
+        }
+    };
+}
 
-        processing.classList.add('hidden');
+function closeEventSource() {
+    if (eventSource !== null) {
+        eventSource.close();
+        eventSource = null;
+    }
+}
 
-        if (data.success) {
-            document.getElementById('drive-link').href = data.drive_url;
-            document.getElementById('result-filename').textContent = data.filename;
-            result.classList.remove('hidden');
-        } else {
-            document.getElementById('error-message').textContent = data.error_message;
-            errorDiv.classList.remove('hidden');
+async function pollResult(jobId) {
+    try {
+        const response = await fetch(`/jobs/${encodeURIComponent(jobId)}/result`);
+        const data = await response.json();
+        if (response.status === 202) {
+            applyStatus(data);
+            setTimeout(() => pollResult(jobId), RESULT_POLL_INTERVAL_MS);
+            return;
         }
+        finishJob(data);
     } catch (err) {
-        processing.classList.add('hidden');
-        document.getElementById('error-message').textContent =
-            'ネットワークエラーが発生しました。もう一度お試しください。';
-        errorDiv.classList.remove('hidden');
+        setTimeout(() => pollResult(jobId), RESULT_POLL_INTERVAL_MS);
     }
-});
+}
+
+function stepItem(step) {
+    return document.querySelector(`#progress-steps li[data-step="${step}"]`);
+}
+
+function markSteps(step, done) {
+    document.querySelectorAll('#progress-steps li').forEach(li => {
+        const n = Number(li.dataset.step);
+        li.classList.toggle('step-done', n < step || (n === step && done));
+        li.classList.toggle('step-running', n === step && !done);
+    });
+}
+
+function applyProgress(event) {
+    const item = stepItem(event.step);
+    if (item === null) return;
+    markSteps(event.step, event.status === 'completed');
+    const detail = describeStep(event);
+    if (detail) {
+        item.querySelector('.step-detail').textContent = detail;
+    }
+}
+
+function describeStep(event) {
+    const detail = event.detail || {};
+    if (event.step === 1 && event.status === 'started') return `${detail.file_count}ファイル`;
+    if (event.step === 1 && event.status === 'completed') return `${detail.text_length}文字`;
+    if (event.step === 2 && detail.companies) return detail.companies.join(', ');
+    if (detail.row_count !== undefined) return `${detail.row_count}行`;
+    return '';
+}
+
+// 別のワーカーで実行中のジョブは、ステップ単位の状態だけが届く
+function applyStatus(status) {
+    if (status.step > 0) {
+        markSteps(status.step, false);
+    }
+}
+
+function finishJob(data) {
+    closeEventSource();
+    sessionStorage.removeItem(JOB_STORAGE_KEY);
+    processing.classList.add('hidden');
+    if (data && data.success) {
+        document.getElementById('drive-link').href = data.drive_url;
+        document.getElementById('result-filename').textContent = data.filename;
+        result.classList.remove('hidden');
+    } else {
+        showError(data && data.error_message);
+    }
+}
+
+function showError(message) {
+    processing.classList.add('hidden');
+    document.getElementById('error-message').textContent = message || NETWORK_ERROR_MESSAGE;
+    errorDiv.classList.remove('hidden');
+}
+
+// 再読み込み前に実行中だったジョブの進捗表示に戻る
+const pendingJobId = sessionStorage.getItem(JOB_STORAGE_KEY);
+if (pendingJobId) {
+    showProcessing();
+    watchJob(pendingJobId);
+}
 
 function resetForm() {
     selectedFiles = [];
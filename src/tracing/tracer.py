@@ -0,0 +1,310 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "meisaisyo"
+
+EXPORTER_NONE = ""
+EXPORTER_JSON = "json"
+EXPORTER_OTLP = "otlp"
+
+STATUS_UNSET = "unset"
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+
+@dataclass
+class Span:
+    """1つの処理区間。ID は OpenTelemetry と同じ形式（trace 32桁 / span 16桁の16進数）。"""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    sampled: bool
+    start_ns: int = 0
+    end_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    status: str = STATUS_UNSET
+    status_message: str = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.sampled and value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": self.status,
+            "status_message": self.status_message,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class SpanExporter:
+    def export(self, spans: list[Span]) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+
+class JsonFileExporter(SpanExporter):
+    """スパンを1行1件のJSON (JSON Lines) としてファイルに追記する。"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: list[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: list[Span]) -> dict:
+    """スパンを OTLP/HTTP の JSON 形式 (ExportTraceServiceRequest) に変換する。"""
+    status_codes = {STATUS_UNSET: 0, STATUS_OK: 1, STATUS_ERROR: 2}
+    return {
+        "resourceSpans": [{
+            "resource": {
+                "attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}],
+            },
+            "scopeSpans": [{
+                "scope": {"name": SERVICE_NAME},
+                "spans": [
+                    {
+                        "traceId": span.trace_id,
+                        "spanId": span.span_id,
+                        "parentSpanId": span.parent_id or "",
+                        "name": span.name,
+                        "kind": 1,
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.end_ns),
+                        "attributes": [
+                            {"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()
+                        ],
+                        "status": {
+                            "code": status_codes[span.status],
+                            "message": span.status_message,
+                        },
+                    }
+                    for span in spans
+                ],
+            }],
+        }],
+    }
+
+
+class OTLPHttpExporter(SpanExporter):
+    """OTLP/HTTP (JSON) でローカルのコレクターに送信する。"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+        self._client = None
+
+    def export(self, spans: list[Span]) -> None:
+        import httpx
+
+        if self._client is None:
+            self._client = httpx.Client(timeout=self.timeout)
+        response = self._client.post(self.url, json=to_otlp(spans))
+        response.raise_for_status()
+
+    def shutdown(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class BatchSpanProcessor:
+    """終了したスパンをキューに溜め、バックグラウンドスレッドでまとめてエクスポートする。
+
+    リクエスト処理のスレッドではキューへの追加しか行わない。キューが満杯の場合は破棄する。
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_batch: int = 256,
+        interval: float = 2.0,
+        max_queue: int = 10000,
+    ):
+        self.exporter = exporter
+        self.max_batch = max_batch
+        self.interval = interval
+        self._queue: queue.Queue[Optional[Span]] = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def on_end(self, span: Span) -> None:
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-export", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch: list[Span] = []
+            stop = False
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch:
+                try:
+                    span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stop = True
+                    break
+                batch.append(span)
+            if batch:
+                self._export(batch)
+            if stop:
+                return
+
+    def _export(self, batch: list[Span]) -> None:
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.warning("トレースのエクスポートに失敗しました (%d件): %s", len(batch), e)
+
+    def shutdown(self) -> None:
+        """キューに残ったスパンを出力してスレッドを止める。"""
+        thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout=10)
+            self._thread = None
+        self.exporter.shutdown()
+
+
+class Tracer:
+    """コンテキスト変数で親子関係を伝播する軽量トレーサー。
+
+    トレースの開始（親のないスパン）時に sample_rate でサンプリングを決め、
+    子スパンは親の判定を引き継ぐ。サンプリングされなかったスパンは属性を保持せず出力もしない。
+    """
+
+    def __init__(self, processor: Optional[BatchSpanProcessor], sample_rate: float = 1.0):
+        self.processor = processor
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.processor is not None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """スパンを開始し、with ブロックの間は現在のスパンにする。例外はスパンに記録して再送出する。"""
+        parent = _current_span.get()
+        if parent is None:
+            sampled = self.enabled and random.random() < self.sample_rate
+            trace_id = os.urandom(16).hex() if sampled else ""
+        else:
+            sampled = parent.sampled
+            trace_id = parent.trace_id
+        span = Span(
+            name=name,
+            trace_id=trace_id,
+            span_id=os.urandom(8).hex() if sampled else "",
+            parent_id=parent.span_id if parent is not None else None,
+            sampled=sampled,
+        )
+        if sampled:
+            span.attributes.update({k: v for k, v in attributes.items() if v is not None})
+            span.start_ns = time.time_ns()
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # 非同期ジェネレータが別のコンテキストで閉じられた場合
+                pass
+            if sampled:
+                span.end_ns = time.time_ns()
+                if span.status == STATUS_UNSET:
+                    span.status = STATUS_OK
+                self.processor.on_end(span)
+
+    def shutdown(self) -> None:
+        if self.processor is not None:
+            self.processor.shutdown()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def create_tracer() -> Tracer:
+    """設定 (TRACING_EXPORTER) に応じたトレーサーを作る。未設定の場合は何も出力しない。"""
+    exporter: Optional[SpanExporter] = None
+    if settings.tracing_exporter == EXPORTER_JSON:
+        exporter = JsonFileExporter(settings.tracing_json_path)
+    elif settings.tracing_exporter == EXPORTER_OTLP:
+        exporter = OTLPHttpExporter(settings.tracing_otlp_endpoint)
+    elif settings.tracing_exporter != EXPORTER_NONE:
+        logger.warning("不明な TRACING_EXPORTER のためトレースを無効にします: %s", settings.tracing_exporter)
+    processor = BatchSpanProcessor(exporter) if exporter is not None else None
+    return Tracer(processor, settings.tracing_sample_rate)
+
+
+# シングルトンインスタンス
+tracer = create_tracer()
@@ -1,5 +1,9 @@
-from openai import AsyncOpenAI
+from typing import AsyncIterator, Optional
 
+from src.metrics.pipeline_metrics import record_tokens
+from src.tracing.tracer import Span, tracer
+from src.workflow.clients import client_registry
+from src.workflow.ratelimit import PROVIDER_OPENAI, governed_call, governed_stream
 from src.workflow.router import CompanyType
 from src.prompts.ntt_prompt import SYSTEM_PROMPT as NTT_PROMPT
 from src.prompts.otsuka_prompt import SYSTEM_PROMPT as OTSUKA_PROMPT
@@ -9,6 +13,9 @@ from src.prompts.forval_prompt import SYSTEM_PROMPT as FORVAL_PROMPT
 from src.prompts.other_prompt import SYSTEM_PROMPT as OTHER_PROMPT
 
 
+ANALYSIS_MODEL = "gpt-4.1"
+
+
 class AnalysisError(Exception):
     pass
 
@@ -27,6 +34,7 @@ async def analyze_bill(
     ocr_text: str,
     company: CompanyType,
     api_key: str,
+    prompt: Optional[str] = None,
 ) -> str:
     """GPT-4.1 で会社別のプロンプトを使い明細を構造化Markdown行に変換する。
 
@@ -34,6 +42,7 @@ async def analyze_bill(
         ocr_text: OCRで抽出されたテキスト
         company: 判定された会社タイプ
         api_key: OpenAI API Key
+        prompt: システムプロンプト（省略時は PROMPT_MAP の会社別プロンプト）
 
     Returns:
         Markdownテーブルのデータ行（ヘッダーなし）
@@ -41,17 +50,119 @@ async def analyze_bill(
     Raises:
         AnalysisError: 分析処理に失敗した場合
     """
-    prompt = PROMPT_MAP[company]
+    if prompt is None:
+        prompt = PROMPT_MAP[company]
 
     try:
-        client = AsyncOpenAI(api_key=api_key)
-        response = await client.chat.completions.create(
-            model="gpt-4.1",
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": ocr_text},
-            ],
-        )
-        return response.choices[0].message.content or ""
+        with tracer.span(
+            "openai.chat.completions",
+            model=ANALYSIS_MODEL,
+            company=company.value,
+            streaming=False,
+            input_chars=len(ocr_text),
+        ) as span:
+            client = client_registry.get_openai_client(api_key)
+            response = await governed_call(
+                PROVIDER_OPENAI,
+                api_key,
+                lambda: client.chat.completions.create(
+                    model=ANALYSIS_MODEL,
+                    messages=[
+                        {"role": "system", "content": prompt},
+                        {"role": "user", "content": ocr_text},
+                    ],
+                ),
+            )
+            _record_usage(response, span)
+            content = response.choices[0].message.content or ""
+            span.set_attribute("output_chars", len(content))
+            return content
     except Exception as e:
         raise AnalysisError(f"明細分析に失敗しました ({company.value}): {e}") from e
+
+
+async def analyze_bill_stream(
+    ocr_text: str,
+    company: CompanyType,
+    api_key: str,
+    prompt: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """analyze_bill のストリーミング版。完成したMarkdownテーブル行を受信しながら1行ずつ返す。
+
+    テーブル行（"|" で始まる行）以外は返さない。
+
+    Raises:
+        AnalysisError: 分析処理に失敗した場合
+    """
+    if prompt is None:
+        prompt = PROMPT_MAP[company]
+    lines = MarkdownLineBuffer()
+
+    try:
+        with tracer.span(
+            "openai.chat.completions",
+            model=ANALYSIS_MODEL,
+            company=company.value,
+            streaming=True,
+            input_chars=len(ocr_text),
+        ) as span:
+            client = client_registry.get_openai_client(api_key)
+            # 再試行するのはストリームの開始まで（行を返し始めた後は重複するため再試行しない）。
+            # 同時実行数の枠はストリームを読み終えるまで保持する
+            async with governed_stream(
+                PROVIDER_OPENAI,
+                api_key,
+                lambda: client.chat.completions.create(
+                    model=ANALYSIS_MODEL,
+                    messages=[
+                        {"role": "system", "content": prompt},
+                        {"role": "user", "content": ocr_text},
+                    ],
+                    stream=True,
+                    # 最後のチャンクでトークン数 (usage) を受け取る
+                    stream_options={"include_usage": True},
+                ),
+            ) as stream:
+                row_count = 0
+                async for chunk in stream:
+                    _record_usage(chunk, span)
+                    if not chunk.choices:
+                        continue
+                    for row in lines.feed(chunk.choices[0].delta.content or ""):
+                        row_count += 1
+                        yield row
+                for row in lines.flush():
+                    row_count += 1
+                    yield row
+            span.set_attribute("row_count", row_count)
+    except Exception as e:
+        raise AnalysisError(f"明細分析に失敗しました ({company.value}): {e}") from e
+
+
+def _record_usage(response, span: Span) -> None:
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        record_tokens("openai", ANALYSIS_MODEL, usage.prompt_tokens, usage.completion_tokens)
+        span.set_attributes(
+            prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens
+        )
+
+
+class MarkdownLineBuffer:
+    """ストリームで届くテキスト断片を行単位に区切り、完成したテーブル行を返す。"""
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, text: str) -> list[str]:
+        """断片を追加し、改行で完成した行のうちテーブル行を返す。"""
+        self._pending += text
+        if "\n" not in self._pending:
+            return []
+        *complete, self._pending = self._pending.split("\n")
+        return [line.strip() for line in complete if line.strip().startswith("|")]
+
+    def flush(self) -> list[str]:
+        """末尾の改行のない行を返す。"""
+        line, self._pending = self._pending.strip(), ""
+        return [line] if line.startswith("|") else []
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from google import genai
+from google.genai import types
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """APIキーごとに長寿命の Gemini / OpenAI クライアントを保持するレジストリ。
+
+    クライアントを使い回すことで、リクエストごとのTLSハンドシェイクと
+    コネクションプール生成を省く。プロバイダごとに最新のAPIキーのクライアントだけを保持し、
+    キーが変わった場合（管理画面でのローテーション等）は新しいクライアントを作り、
+    古いクライアントは猶予時間の後に閉じる。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._genai: Optional[tuple[str, genai.Client]] = None
+        self._openai: Optional[tuple[str, AsyncOpenAI]] = None
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        )
+
+    def get_genai_client(self, api_key: str) -> genai.Client:
+        with self._lock:
+            if self._genai is not None and self._genai[0] == api_key:
+                return self._genai[1]
+            stale = self._genai
+            client = genai.Client(
+                api_key=api_key,
+                http_options=types.HttpOptions(
+                    async_client_args={"limits": self._limits()},
+                ),
+            )
+            self._genai = (api_key, client)
+        logger.info("Gemini クライアントを生成しました")
+        if stale is not None:
+            _schedule_close(stale[1].aio.aclose)
+        return client
+
+    def get_openai_client(self, api_key: str) -> AsyncOpenAI:
+        with self._lock:
+            if self._openai is not None and self._openai[0] == api_key:
+                return self._openai[1]
+            stale = self._openai
+            client = AsyncOpenAI(
+                api_key=api_key,
+                http_client=DefaultAsyncHttpxClient(limits=self._limits()),
+                # 再試行は ratelimit.call_with_retry で行う（SDK の再試行はレート制御を通らない）
+                max_retries=0,
+            )
+            self._openai = (api_key, client)
+        logger.info("OpenAI クライアントを生成しました")
+        if stale is not None:
+            _schedule_close(stale[1].close)
+        return client
+
+    def _take_all(self) -> list[Callable[[], Awaitable[None]]]:
+        with self._lock:
+            closers = []
+            if self._genai is not None:
+                closers.append(self._genai[1].aio.aclose)
+            if self._openai is not None:
+                closers.append(self._openai[1].close)
+            self._genai = None
+            self._openai = None
+        return closers
+
+    def invalidate(self) -> None:
+        """保持しているクライアントを破棄し、次回取得時に作り直す。"""
+        for close in self._take_all():
+            _schedule_close(close)
+
+    async def aclose(self) -> None:
+        """すべてのクライアントの接続を閉じる（アプリ終了時に呼ぶ）。"""
+        for close in self._take_all():
+            await close()
+
+
+_close_tasks: set[asyncio.Task] = set()
+
+
+def _schedule_close(close: Callable[[], Awaitable[None]]) -> None:
+    """古いクライアントを猶予時間の経過後に閉じる。
+
+    キー切り替え時点で実行中のリクエストは古いクライアントを使い続けるため、
+    すぐには閉じない。イベントループ外では閉じずに破棄する（GCに任せる）。
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    task = loop.create_task(_close_later(close))
+    _close_tasks.add(task)
+    task.add_done_callback(_close_tasks.discard)
+
+
+async def _close_later(close: Callable[[], Awaitable[None]]) -> None:
+    await asyncio.sleep(settings.http_client_close_grace_seconds)
+    try:
+        await close()
+    except Exception:
+        logger.warning("古いAPIクライアントのクローズに失敗しました", exc_info=True)
+
+
+# シングルトンインスタンス
+client_registry = ClientRegistry()
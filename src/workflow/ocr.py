@@ -1,24 +1,72 @@
-import base64
+import asyncio
+import io
+import logging
 import mimetypes
+from dataclasses import dataclass
+from typing import Optional
 
 from google import genai
 from google.genai import types
+from pypdf import PdfReader, PdfWriter
 
+from src.config import settings
+from src.metrics.pipeline_metrics import record_tokens
 from src.prompts.ocr_prompt import SYSTEM_PROMPT
+from src.tracing.tracer import tracer
+from src.workflow.clients import client_registry
+from src.workflow.ratelimit import PROVIDER_GEMINI, governed_call
+from src.workflow.uploads import FileContent
+
+logger = logging.getLogger(__name__)
+
+OCR_MODEL = "gemini-2.5-flash"
+
+# 分割モードでの結合区切り。同一ファイル内のチャンク間は PAGE_BREAK、
+# ファイル間は FILE_BREAK で結合し、会社ごとのセグメント分割 (router) で利用する。
+PAGE_BREAK = "\n\f\n"
+FILE_BREAK = "\n\f\f\n"
 
 
 class OCRError(Exception):
-    pass
+    """OCRの失敗。分割モードでは読み取れなかったチャンクのラベルを failed_chunks に持つ。"""
+
+    def __init__(self, message: str, failed_chunks: Optional[list[str]] = None):
+        super().__init__(message)
+        self.failed_chunks = failed_chunks or []
+
+
+@dataclass
+class OCRChunk:
+    """分割モードでのOCR単位（1ファイル、またはPDFのページ範囲）。"""
+    file_index: int
+    filename: str
+    content: FileContent
+    mime_type: str
+    label: str
+
+
+_ocr_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_ocr_semaphore() -> asyncio.Semaphore:
+    """同時実行中のGemini OCR呼び出し数を制限するセマフォを取得する。"""
+    global _ocr_semaphore
+    if _ocr_semaphore is None:
+        _ocr_semaphore = asyncio.Semaphore(max(1, settings.ocr_max_concurrency))
+    return _ocr_semaphore
 
 
 async def ocr_extract(
-    files: list[tuple[str, bytes]],
+    files: list[tuple[str, FileContent]],
     api_key: str,
 ) -> str:
     """Gemini 2.5 Flash で PDF/画像からテキストを抽出する。
 
+    OCR_SPLIT_MODE=true の場合はファイル/ページ範囲ごとに分割して並列にOCRし、
+    アップロード順に結合する。
+
     Args:
-        files: (filename, content_bytes) のリスト
+        files: (filename, content) のリスト。content は bytes またはメモリマップ
         api_key: Google API Key
 
     Returns:
@@ -27,34 +75,191 @@ async def ocr_extract(
     Raises:
         OCRError: OCR処理に失敗した場合
     """
+    with tracer.span(
+        "ocr_extract",
+        file_count=len(files),
+        bytes=sum(len(content) for _, content in files),
+        split_mode=settings.ocr_split_mode,
+    ) as span:
+        text = await _ocr_extract(files, api_key)
+        span.set_attribute("text_length", len(text))
+        return text
+
+
+async def _ocr_extract(
+    files: list[tuple[str, FileContent]],
+    api_key: str,
+) -> str:
+    if settings.ocr_split_mode:
+        return await _ocr_extract_split(files, api_key)
+
     try:
-        client = genai.Client(api_key=api_key)
+        client = client_registry.get_genai_client(api_key)
 
         parts: list[types.Part] = []
         for filename, content in files:
             mime_type = _guess_mime_type(filename)
             parts.append(
-                types.Part.from_bytes(data=content, mime_type=mime_type)
+                types.Part.from_bytes(data=bytes(content), mime_type=mime_type)
             )
 
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=parts,
-                ),
-            ],
-            config=types.GenerateContentConfig(
-                system_instruction=SYSTEM_PROMPT,
-                temperature=0.7,
-            ),
-        )
-        return response.text or ""
+        return await _generate_text(client, parts, api_key)
     except Exception as e:
         raise OCRError(f"OCR処理に失敗しました: {e}") from e
 
 
+async def _ocr_extract_split(
+    files: list[tuple[str, FileContent]],
+    api_key: str,
+) -> str:
+    """チャンクごとに並列でOCRし、アップロード順に結合する。
+
+    1チャンクでも失敗した場合（レート制御の再試行後）は、ページが欠けた明細書を
+    分析しないよう OCRError を送出する。failed_chunks には失敗したチャンクのラベルを入れる。
+    同一ファイルのチャンクは PAGE_BREAK、ファイル間は FILE_BREAK で区切る。
+    """
+    # PDF分割はCPU処理のためスレッドで実行する
+    chunks = await asyncio.to_thread(
+        split_into_chunks, files, settings.ocr_pdf_pages_per_chunk
+    )
+    if not chunks:
+        raise OCRError("OCR処理に失敗しました: 対象ファイルがありません")
+
+    client = client_registry.get_genai_client(api_key)
+    fanout = asyncio.Semaphore(max(1, settings.ocr_fanout))
+
+    async def run(chunk: OCRChunk) -> str:
+        async with fanout:
+            # Gemini SDK は bytes のみ受け付けるため、送信直前にチャンク単位でコピーする
+            part = types.Part.from_bytes(data=bytes(chunk.content), mime_type=chunk.mime_type)
+            return await _generate_text(client, [part], api_key)
+
+    results = await asyncio.gather(
+        *(run(chunk) for chunk in chunks), return_exceptions=True
+    )
+
+    failures = [
+        (chunk.label, result)
+        for chunk, result in zip(chunks, results)
+        if isinstance(result, BaseException)
+    ]
+    if failures:
+        for label, error in failures:
+            logger.warning("OCRチャンク失敗: %s (%s)", label, error)
+        labels = [label for label, _ in failures]
+        first = failures[0][1]
+        raise OCRError(
+            f"OCR処理に失敗しました ({len(failures)}/{len(chunks)}チャンク: {', '.join(labels)}): {first}",
+            failed_chunks=labels,
+        ) from first
+
+    file_texts: list[list[str]] = []
+    previous_index = -1
+    for chunk, result in zip(chunks, results):
+        if chunk.file_index != previous_index:
+            file_texts.append([])
+            previous_index = chunk.file_index
+        if result:
+            file_texts[-1].append(result)
+
+    logger.info("分割OCR完了: チャンク数=%d", len(chunks))
+    return FILE_BREAK.join(
+        PAGE_BREAK.join(texts) for texts in file_texts if texts
+    )
+
+
+async def _generate_text(client: genai.Client, parts: list[types.Part], api_key: str) -> str:
+    """Gemini にパーツを送信してテキストを返す。429・一時的なエラーはレート制御の下で再試行する。
+
+    OCR_MAX_CONCURRENCY の枠は1回の送信の間だけ確保し、再試行までの待ち時間には保持しない。
+    """
+
+    async def attempt():
+        # 非同期クライアントで呼び出し、イベントループをブロックしない
+        async with _get_ocr_semaphore():
+            return await client.aio.models.generate_content(
+                model=OCR_MODEL,
+                contents=[
+                    types.Content(
+                        role="user",
+                        parts=parts,
+                    ),
+                ],
+                config=types.GenerateContentConfig(
+                    system_instruction=SYSTEM_PROMPT,
+                    temperature=0.7,
+                ),
+            )
+
+    with tracer.span(
+        "gemini.generate_content",
+        model=OCR_MODEL,
+        part_count=len(parts),
+        bytes=sum(len(p.inline_data.data or b"") for p in parts if p.inline_data),
+    ) as span:
+        response = await governed_call(PROVIDER_GEMINI, api_key, attempt)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            record_tokens(
+                "gemini", OCR_MODEL, usage.prompt_token_count, usage.candidates_token_count
+            )
+            span.set_attributes(
+                prompt_tokens=usage.prompt_token_count,
+                completion_tokens=usage.candidates_token_count,
+            )
+    return response.text or ""
+
+
+def split_into_chunks(
+    files: list[tuple[str, FileContent]],
+    pages_per_chunk: int,
+) -> list[OCRChunk]:
+    """ファイルをOCRチャンクに分割する。PDFはページ範囲ごとに分割する。"""
+    chunks: list[OCRChunk] = []
+    for file_index, (filename, content) in enumerate(files):
+        mime_type = _guess_mime_type(filename)
+        page_ranges: list[tuple[int, int, bytes]] = []
+        if mime_type == "application/pdf":
+            page_ranges = _split_pdf(content, pages_per_chunk)
+        if not page_ranges:
+            chunks.append(OCRChunk(file_index, filename, content, mime_type, filename))
+            continue
+        for start, end, pdf_bytes in page_ranges:
+            label = f"{filename} p.{start}-{end}"
+            chunks.append(OCRChunk(file_index, filename, pdf_bytes, mime_type, label))
+    return chunks
+
+
+def _split_pdf(content: FileContent, pages_per_chunk: int) -> list[tuple[int, int, bytes]]:
+    """PDFをページ範囲ごとに分割し、(開始ページ, 終了ページ, PDFバイト列) のリストを返す。
+
+    ページ数が閾値以下、または読み込めないPDFの場合は空リストを返す（分割しない）。
+    """
+    try:
+        # メモリマップはファイルライクなのでそのまま読ませる（コピーしない）
+        stream = io.BytesIO(content) if isinstance(content, bytes) else content
+        reader = PdfReader(stream)
+        page_count = len(reader.pages)
+    except Exception as e:
+        logger.warning("PDFを分割できないため一括でOCRします: %s", e)
+        return []
+
+    pages_per_chunk = max(1, pages_per_chunk)
+    if page_count <= pages_per_chunk:
+        return []
+
+    result: list[tuple[int, int, bytes]] = []
+    for start in range(0, page_count, pages_per_chunk):
+        end = min(start + pages_per_chunk, page_count)
+        writer = PdfWriter()
+        for i in range(start, end):
+            writer.add_page(reader.pages[i])
+        buf = io.BytesIO()
+        writer.write(buf)
+        result.append((start + 1, end, buf.getvalue()))
+    return result
+
+
 def _guess_mime_type(filename: str) -> str:
     """ファイル名からMIMEタイプを推測する。"""
     mime, _ = mimetypes.guess_type(filename)
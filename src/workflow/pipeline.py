@@ -1,5 +1,8 @@
+import asyncio
+import io
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Callable, Optional
 
 from openai import AuthenticationError as OpenAIAuthError
 from openai import APIConnectionError as OpenAIConnectionError
@@ -8,12 +11,26 @@ from openai import RateLimitError as OpenAIRateLimitError
 from google.genai.errors import ClientError as GenaiClientError
 from google.genai.errors import ServerError as GenaiServerError
 
+from src.cache.analysis_cache import analysis_cache, make_analysis_cache_key
+from src.cache.ocr_cache import ocr_cache, make_ocr_cache_key
+from src.config import settings
+from src.metrics.pipeline_metrics import StageRecorder
+from src.rules.registry import rule_registry
+from src.tracing.tracer import STATUS_ERROR, current_span, tracer
 from src.workflow.ocr import ocr_extract, OCRError
-from src.workflow.router import detect_company, CompanyType
-from src.workflow.analyzer import analyze_bill, AnalysisError
-from src.combiner.markdown_combiner import combine_markdown_rows, EmptyResultError
-from src.export.xlsx_exporter import markdown_to_xlsx
-from src.drive.uploader import upload_to_drive, generate_filename, DriveUploadError
+from src.workflow.preprocess import preprocess_images
+from src.workflow.ratelimit import is_insufficient_quota
+from src.workflow.uploads import FileContent
+from src.workflow.router import detect_company, match_vendor, segment_by_company, CompanyType
+from src.workflow.analyzer import analyze_bill, analyze_bill_stream, AnalysisError
+from src.combiner.markdown_combiner import (
+    combine_markdown_rows,
+    EmptyResultError,
+    IncrementalCombiner,
+)
+from src.export.xlsx_exporter import markdown_to_xlsx_file
+from src.export.markdown_table import ParseReport
+from src.drive.uploader import upload_to_drive_async, generate_filename, DriveUploadError
 
 logger = logging.getLogger(__name__)
 
@@ -35,11 +52,17 @@ ERROR_MESSAGE_API_KEY = """\
 APIキーが無効または期限切れです。
 管理者に連絡してAPIキーを確認してください。"""
 
+ERROR_MESSAGE_KEYS_NOT_CONFIGURED = "APIキーが設定されていません。管理者に連絡してください。"
+
 ERROR_MESSAGE_QUOTA = """\
 APIの利用枠（クォータ）を超過しました。
 OpenAIのクレジット残高を確認し、必要に応じて追加してください。
 https://platform.openai.com/account/billing"""
 
+ERROR_MESSAGE_RATE_LIMIT = """\
+APIの利用が集中しているため処理できませんでした。
+数分待ってから再度お試しください。"""
+
 ERROR_MESSAGE_NETWORK = """\
 外部サービスへの通信に失敗しました。
 しばらく待ってから再度お試しください。"""
@@ -66,11 +89,10 @@ def _classify_cause(cause: BaseException | None) -> str:
     if isinstance(cause, OpenAIAuthError):
         return "api_key"
     if isinstance(cause, OpenAIRateLimitError):
-        body = getattr(cause, "body", None) or {}
-        error = body.get("error", {}) if isinstance(body, dict) else {}
-        if error.get("code") == "insufficient_quota" or error.get("type") == "insufficient_quota":
+        if is_insufficient_quota(cause):
             return "quota"
-        return "network"
+        # 再試行しても 429 が続いた場合
+        return "rate_limit"
     if isinstance(cause, (OpenAIConnectionError, OpenAITimeoutError)):
         return "network"
 
@@ -82,7 +104,7 @@ def _classify_cause(cause: BaseException | None) -> str:
         if code in (401, 403) or "API_KEY_INVALID" in status or "API_KEY_INVALID" in message:
             return "api_key"
         if code == 429:
-            return "network"
+            return "rate_limit"
         return "file_too_large"
     if isinstance(cause, GenaiServerError):
         return "network"
@@ -94,67 +116,355 @@ def _classify_cause(cause: BaseException | None) -> str:
     return "unknown"
 
 
+def _mark_cache_hit(attribute: str, hit: bool) -> None:
+    """キャッシュのヒット/ミスを現在のトレーススパンに記録する。"""
+    span = current_span()
+    if span is not None:
+        span.set_attribute(attribute, hit)
+
+
+async def _ocr_with_cache(files: list[tuple[str, FileContent]], google_api_key: str) -> str:
+    """OCRキャッシュを確認し、ミスした場合のみ画像の前処理と ocr_extract を実行して結果を保存する。
+
+    キャッシュキーは前処理前のファイル内容から作るため、ヒット時は前処理も行わない。
+    分割モードで失敗したチャンクがある場合は ocr_extract が OCRError を送出するため、
+    ページが欠けたテキストは保存されない。
+    """
+    if not settings.ocr_cache_enabled:
+        return await ocr_extract(await preprocess_images(files), google_api_key)
+
+    # 大きなファイルのハッシュ計算でイベントループを止めない（hashlib は GIL を解放する）
+    key = await asyncio.to_thread(make_ocr_cache_key, files)
+    cached = await ocr_cache.aget(key)
+    _mark_cache_hit("ocr_cache_hit", cached is not None)
+    if cached is not None:
+        logger.info("Step 1: OCRキャッシュヒット")
+        return cached
+
+    ocr_text = await ocr_extract(await preprocess_images(files), google_api_key)
+    if ocr_text.strip():
+        await ocr_cache.aset(key, ocr_text)
+    return ocr_text
+
+
+async def _analyze_with_cache(
+    ocr_text: str, company: CompanyType, openai_api_key: str, prompt: str
+) -> str:
+    """分析キャッシュを確認し、ミスした場合のみ analyze_bill を実行して結果を保存する。"""
+    if not settings.analysis_cache_enabled:
+        return await analyze_bill(ocr_text, company, openai_api_key, prompt)
+
+    key = make_analysis_cache_key(ocr_text, company, prompt)
+    cached = await analysis_cache.aget(key)
+    _mark_cache_hit(f"analysis_cache_hit.{company.value}", cached is not None)
+    if cached is not None:
+        logger.info("Step 3: 明細分析キャッシュヒット (%s)", company.value)
+        return cached
+
+    analysis_result = await analyze_bill(ocr_text, company, openai_api_key, prompt)
+    if analysis_result.strip():
+        await analysis_cache.aset(key, analysis_result)
+    return analysis_result
+
+
+async def _analyze_streaming(
+    ocr_text: str,
+    company: CompanyType,
+    openai_api_key: str,
+    prompt: str,
+    on_row: Callable[[str], None],
+) -> None:
+    """ストリーミングで明細分析し、完成した行ごとに on_row を呼ぶ。
+
+    分析キャッシュにヒットした場合はキャッシュの行を順に渡す。
+    """
+    key = None
+    if settings.analysis_cache_enabled:
+        key = make_analysis_cache_key(ocr_text, company, prompt)
+        cached = await analysis_cache.aget(key)
+        _mark_cache_hit(f"analysis_cache_hit.{company.value}", cached is not None)
+        if cached is not None:
+            logger.info("Step 3: 明細分析キャッシュヒット (%s)", company.value)
+            for line in cached.splitlines():
+                if line.strip().startswith("|"):
+                    on_row(line.strip())
+            return
+
+    rows: list[str] = []
+    async for row in analyze_bill_stream(ocr_text, company, openai_api_key, prompt):
+        rows.append(row)
+        on_row(row)
+    if key is not None and rows:
+        await analysis_cache.aset(key, "\n".join(rows))
+
+
 @dataclass
 class PipelineResult:
     success: bool
     drive_url: str | None = None
     filename: str | None = None
     error_message: str | None = None
+    # collect_rows=True の場合の結合済みMarkdownテーブル行（ヘッダー・区切り行を含む）
+    rows: list[str] | None = None
+
+
+STEP_NAMES: dict[int, str] = {
+    1: "ocr",
+    2: "route",
+    3: "analysis",
+    4: "combine",
+    5: "xlsx",
+    6: "upload",
+}
+
+
+@dataclass
+class PipelineEvent:
+    """パイプラインの進捗イベント。
+
+    status は "started"、"completed"、またはストリーミング分析で明細行が完成した際の "row"。
+    """
+    step: int
+    status: str
+    detail: dict = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return STEP_NAMES[self.step]
+
+    def to_dict(self) -> dict:
+        return {
+            "step": self.step,
+            "step_name": self.name,
+            "status": self.status,
+            "detail": self.detail,
+        }
+
+
+ProgressCallback = Callable[[PipelineEvent], None]
+
+
+def _emit(
+    on_progress: Optional[ProgressCallback],
+    step: int,
+    status: str,
+    **detail,
+) -> None:
+    """進捗コールバックを呼び出す。コールバックの失敗でパイプラインは止めない。"""
+    if on_progress is None:
+        return
+    try:
+        on_progress(PipelineEvent(step=step, status=status, detail=detail))
+    except Exception:
+        logger.warning("進捗コールバックでエラーが発生しました", exc_info=True)
+
+
+def _with_recorder(
+    recorder: StageRecorder, on_progress: Optional[ProgressCallback]
+) -> ProgressCallback:
+    """計測用の recorder と呼び出し側のコールバックの両方に進捗イベントを渡す。"""
+    if on_progress is None:
+        return recorder
+
+    def callback(event: PipelineEvent) -> None:
+        recorder(event)
+        on_progress(event)
+
+    return callback
 
 
 async def process_bill(
-    files: list[tuple[str, bytes]],
+    files: list[tuple[str, FileContent]],
     google_api_key: str,
     openai_api_key: str,
     drive_folder_id: str,
+    on_progress: Optional[ProgressCallback] = None,
+    filename_base: Optional[str] = None,
+    collect_rows: bool = False,
 ) -> PipelineResult:
     """明細抽出パイプライン全体を実行する。
 
     1. OCR (Gemini 2.5 Flash)
-    2. 会社判定 (IF/ELSE)
-    3. 明細分析 (GPT-4.1)
+    2. 会社判定 (IF/ELSE、ROUTER_MODE=multi の場合は会社ごとにセグメント分割)
+    3. 明細分析 (GPT-4.1、複数社の場合は会社ごとに並列実行)
     4. Markdown結合
     5. XLSX変換
     6. Google Driveアップロード
 
     Args:
-        files: (filename, content_bytes) のリスト
+        files: (filename, content) のリスト。content は bytes またはメモリマップ
         google_api_key: Google API Key (Gemini用)
         openai_api_key: OpenAI API Key (GPT-4.1用)
         drive_folder_id: Google DriveフォルダID
+        on_progress: 各ステップの開始/完了時に呼ばれるコールバック
+        filename_base: Driveに保存するファイル名（日時の前の部分）。省略時は既定の名前
+        collect_rows: True の場合は Step 4 までを実行し、結合済みの行を PipelineResult.rows で返す
+            （XLSX変換とアップロードは呼び出し側で行う）
 
     Returns:
         PipelineResult with drive_url on success, error_message on failure
     """
+    # ステップごとの所要時間・サイズ・失敗種別を /metrics 用に記録する
+    recorder = StageRecorder()
+    progress = _with_recorder(recorder, on_progress)
+    with tracer.span(
+        "process_bill",
+        file_count=len(files),
+        bytes=sum(len(content) for _, content in files),
+        router_mode=settings.router_mode,
+        analysis_streaming=settings.analysis_streaming,
+    ) as span:
+        result = await _run_pipeline(
+            files, google_api_key, openai_api_key, drive_folder_id, recorder, progress,
+            filename_base, collect_rows,
+        )
+        if not result.success:
+            span.status = STATUS_ERROR
+            span.status_message = recorder.failure_category or ""
+            span.set_attributes(
+                failed_stage=recorder.current_stage, error_category=recorder.failure_category
+            )
+        return result
+
+
+async def _run_pipeline(
+    files: list[tuple[str, FileContent]],
+    google_api_key: str,
+    openai_api_key: str,
+    drive_folder_id: str,
+    recorder: StageRecorder,
+    progress: ProgressCallback,
+    filename_base: Optional[str],
+    collect_rows: bool,
+) -> PipelineResult:
     try:
-        # Step 1: OCR
+        # 会社判定ルールとプロンプトは開始時点のものを最後まで使う（途中でリロードされても変わらない）
+        ruleset = rule_registry.current()
+
+        # Step 1: OCR (同一ファイルの結果がキャッシュにあればGeminiを呼ばない)
         logger.info("Step 1: OCR開始 (ファイル数=%d)", len(files))
-        ocr_text = await ocr_extract(files, google_api_key)
+        _emit(progress, 1, "started", file_count=len(files))
+        recorder.bytes("ocr", "input", sum(len(content) for _, content in files))
+        ocr_text = await _ocr_with_cache(files, google_api_key)
         logger.info("Step 1: OCR完了 (テキスト長=%d)", len(ocr_text))
+        recorder.bytes("ocr", "output", len(ocr_text.encode("utf-8")))
+        _emit(progress, 1, "completed", text_length=len(ocr_text))
 
         # Step 2: 会社判定
-        company = detect_company(ocr_text)
-        logger.info("Step 2: 会社判定完了 → %s", company)
+        _emit(progress, 2, "started")
+        with tracer.span(
+            "route", mode=settings.router_mode, rules_version=ruleset.version
+        ) as route_span:
+            if settings.router_mode == "multi":
+                sections = segment_by_company(ocr_text, engine=ruleset.engine)
+            else:
+                sections = {detect_company(ocr_text, engine=ruleset.engine): ocr_text}
+            companies = list(sections)
+            # ベンダー別のプロンプトを選ぶため、セクションごとに判定されたベンダーを引く
+            prompts = {
+                company: ruleset.prompt_for(
+                    company, match_vendor(sections[company], company, engine=ruleset.engine)
+                )
+                for company in companies
+            }
+            route_span.set_attribute("companies", [c.value for c in companies])
+        logger.info(
+            "Step 2: 会社判定完了 → %s (rules=%s)", [c.value for c in companies], ruleset.version
+        )
+        _emit(
+            progress, 2, "completed",
+            companies=[c.value for c in companies], rules_version=ruleset.version,
+        )
 
-        # Step 3: 明細分析
+        # Step 3: 明細分析 (会社ごとに並列実行)
         logger.info("Step 3: 明細分析開始")
-        analysis_result = await analyze_bill(ocr_text, company, openai_api_key)
-        logger.info("Step 3: 明細分析完了")
+        _emit(progress, 3, "started")
+        if settings.analysis_streaming:
+            # 完成した行から順に結合器へ送り、行ごとに進捗イベントを出す
+            combiner = IncrementalCombiner()
+
+            analysis_bytes = 0
+
+            def row_handler(company: CompanyType) -> Callable[[str], None]:
+                def on_row(row: str) -> None:
+                    nonlocal analysis_bytes
+                    analysis_bytes += len(row.encode("utf-8")) + 1
+                    combiner.add_row(company, row)
+                    _emit(
+                        progress, 3, "row",
+                        company=company.value, row=row, row_count=combiner.row_count,
+                    )
+                return on_row
+
+            await asyncio.gather(
+                *(
+                    _analyze_streaming(
+                        sections[company],
+                        company,
+                        openai_api_key,
+                        prompts[company],
+                        row_handler(company),
+                    )
+                    for company in companies
+                )
+            )
+            recorder.bytes("analysis", "output", analysis_bytes)
+            logger.info("Step 3: 明細分析完了 (行数=%d)", combiner.row_count)
+            _emit(progress, 3, "completed", row_count=combiner.row_count)
+        else:
+            analysis_results = await asyncio.gather(
+                *(
+                    _analyze_with_cache(
+                        sections[company], company, openai_api_key, prompts[company]
+                    )
+                    for company in companies
+                )
+            )
+            recorder.bytes(
+                "analysis", "output", sum(len(r.encode("utf-8")) for r in analysis_results)
+            )
+            logger.info("Step 3: 明細分析完了")
+            _emit(progress, 3, "completed")
 
         # Step 4: Markdown結合
-        results = {company: analysis_result}
-        markdown = combine_markdown_rows(results)
+        _emit(progress, 4, "started")
+        if settings.analysis_streaming:
+            # 結合済み文字列を作らず、行のイテレータをそのままXLSX変換に渡す
+            markdown_lines = combiner.lines()
+        else:
+            results = dict(zip(companies, analysis_results))
+            markdown_lines = combine_markdown_rows(results).splitlines()
+        if collect_rows:
+            markdown_lines = list(markdown_lines)
         logger.info("Step 4: Markdown結合完了")
-
-        # Step 5: XLSX変換
-        xlsx_bytes = markdown_to_xlsx(markdown)
-        logger.info("Step 5: XLSX変換完了 (サイズ=%d bytes)", len(xlsx_bytes))
-
-        # Step 6: Google Driveアップロード
-        filename = generate_filename()
-        drive_url = upload_to_drive(xlsx_bytes, drive_folder_id, filename)
-        logger.info("Step 6: Driveアップロード完了 → %s", drive_url)
-
+        _emit(progress, 4, "completed")
+
+        if collect_rows:
+            recorder.succeeded()
+            return PipelineResult(success=True, rows=markdown_lines)
+
+        # Step 5: XLSX変換 (書き込み専用ワークブックでスプールファイルに書き出す)
+        _emit(progress, 5, "started")
+        report = ParseReport()
+        xlsx_file = markdown_to_xlsx_file(markdown_lines, report)
+        try:
+            xlsx_size = xlsx_file.seek(0, io.SEEK_END)
+            xlsx_file.seek(0)
+            recorder.bytes("xlsx", "output", xlsx_size)
+            logger.info("Step 5: XLSX変換完了 (サイズ=%d bytes)", xlsx_size)
+            # report.rows はヘッダー行を含む
+            _emit(progress, 5, "completed", size=xlsx_size, row_count=max(0, report.rows - 1))
+
+            # Step 6: Google Driveアップロード
+            _emit(progress, 6, "started")
+            filename = generate_filename(filename_base) if filename_base else generate_filename()
+            drive_url = await upload_to_drive_async(xlsx_file, drive_folder_id, filename)
+            logger.info("Step 6: Driveアップロード完了 → %s", drive_url)
+            _emit(progress, 6, "completed", drive_url=drive_url)
+        finally:
+            xlsx_file.close()
+
+        recorder.succeeded()
         return PipelineResult(
             success=True,
             drive_url=drive_url,
@@ -163,6 +473,7 @@ async def process_bill(
 
     except EmptyResultError as e:
         logger.warning("Pipeline failed: empty result. %s", e)
+        recorder.failed("empty_result")
         return PipelineResult(success=False, error_message=ERROR_MESSAGE_EMPTY_RESULT)
 
     except (OCRError, AnalysisError) as e:
@@ -171,22 +482,29 @@ async def process_bill(
             "Pipeline failed at %s: %s (cause: %s, category: %s)",
             type(e).__name__, e, e.__cause__, category,
         )
+        recorder.failed(category)
         message = {
             "api_key": ERROR_MESSAGE_API_KEY,
             "quota": ERROR_MESSAGE_QUOTA,
+            "rate_limit": ERROR_MESSAGE_RATE_LIMIT,
             "network": ERROR_MESSAGE_NETWORK,
             "file_too_large": ERROR_MESSAGE_FILE_TOO_LARGE,
         }.get(category, ERROR_MESSAGE_FILE_TOO_LARGE)
+        if isinstance(e, OCRError) and e.failed_chunks:
+            message += "\n\n読み取れなかった範囲: " + ", ".join(e.failed_chunks)
         return PipelineResult(success=False, error_message=message)
 
     except ValueError as e:
         logger.warning("Pipeline failed: xlsx conversion error. %s", e)
+        recorder.failed("xlsx")
         return PipelineResult(success=False, error_message=ERROR_MESSAGE_EMPTY_RESULT)
 
     except DriveUploadError as e:
         logger.error("Pipeline failed: Drive upload error. %s", e, exc_info=True)
+        recorder.failed("drive_upload")
         return PipelineResult(success=False, error_message=ERROR_MESSAGE_DRIVE_UPLOAD)
 
     except Exception as e:
         logger.exception("Pipeline failed: unexpected error.")
+        recorder.failed("unknown")
         return PipelineResult(success=False, error_message=ERROR_MESSAGE_UNKNOWN)
@@ -0,0 +1,146 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from src.config import settings
+from src.workflow.uploads import FileContent
+
+logger = logging.getLogger(__name__)
+
+# 縮小・再エンコードの対象 (拡張子 → Pillow のフォーマット名)
+_TARGET_FORMATS = {
+    "jpg": "JPEG",
+    "jpeg": "JPEG",
+    "png": "PNG",
+    "webp": "WEBP",
+}
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """画像処理用のプロセスプールを取得する（初回呼び出し時に生成）。"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=max(1, settings.image_preprocess_workers),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """壊れたプロセスプールを破棄し、次回の _get_pool() で作り直させる。"""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_in_pool(*args) -> tuple[bytes, bool]:
+    """プロセスプールで downscale_image を実行する。
+
+    ワーカーの異常終了でプールが壊れていた場合は作り直して一度だけ再試行する。
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    try:
+        return await loop.run_in_executor(pool, downscale_image, *args)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        logger.warning("画像処理のプロセスプールが壊れていたため作り直します")
+    pool = _get_pool()
+    try:
+        return await loop.run_in_executor(pool, downscale_image, *args)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+
+
+def shutdown_preprocess_pool() -> None:
+    """プロセスプールを停止する（アプリ終了時に呼ぶ）。"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def preprocess_images(
+    files: list[tuple[str, FileContent]],
+) -> list[tuple[str, FileContent]]:
+    """OCR前に大きなJPEG/PNG/WebP画像を縮小・再エンコードし、EXIFを除去する。
+
+    画像処理はプロセスプールで並列に実行し、イベントループをブロックしない。
+    処理に失敗した画像、またはEXIFがなく小さくもならなかった画像は元のまま返す。
+    EXIFを含む画像はサイズが減らなくても除去済みの再エンコード結果を使う。
+    image_preprocess_min_bytes 未満の画像はEXIFを含む場合だけ再エンコードする。
+    """
+    if not settings.image_preprocess_enabled:
+        return files
+
+    async def process(filename: str, content: FileContent) -> FileContent:
+        image_format = _TARGET_FORMATS.get(_extension(filename))
+        if image_format is None:
+            return content
+        try:
+            result, had_exif = await _run_in_pool(
+                bytes(content),
+                image_format,
+                settings.image_max_side,
+                settings.image_jpeg_quality,
+                len(content) < settings.image_preprocess_min_bytes,
+            )
+        except Exception as e:
+            logger.warning("画像の前処理に失敗したため元のファイルを使います: %s (%s)", filename, e)
+            return content
+        if len(result) >= len(content):
+            if not had_exif:
+                return content
+            logger.info("画像のEXIFを除去しました: %s", filename)
+            return result
+        logger.info("画像を縮小しました: %s (%d → %d bytes)", filename, len(content), len(result))
+        return result
+
+    processed = await asyncio.gather(
+        *(process(filename, content) for filename, content in files)
+    )
+    return [(filename, content) for (filename, _), content in zip(files, processed)]
+
+
+def downscale_image(
+    data: bytes, image_format: str, max_side: int, quality: int, only_if_exif: bool = False
+) -> tuple[bytes, bool]:
+    """画像を長辺 max_side 以下に縮小し、EXIFを除去して同じ形式で再エンコードする。
+
+    (再エンコード結果, 元画像にEXIFが含まれていたか) を返す。only_if_exif=True の場合、
+    EXIFのない画像は再エンコードせず data をそのまま返す。EXIFの回転情報は除去前に
+    画素へ反映する。プロセスプールから呼ばれるためモジュールレベルの関数にしている。
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        had_exif = bool(image.getexif())
+        if only_if_exif and not had_exif:
+            return data, False
+        image = ImageOps.exif_transpose(image)
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        buf = io.BytesIO()
+        if image_format == "JPEG":
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.save(buf, format="JPEG", quality=quality, optimize=True)
+        elif image_format == "WEBP":
+            image.save(buf, format="WEBP", quality=quality)
+        else:
+            image.save(buf, format="PNG", optimize=True)
+        return buf.getvalue(), had_exif
+
+
+def _extension(filename: str) -> str:
+    return filename.lower().rsplit(".", 1)[-1] if "." in filename else ""
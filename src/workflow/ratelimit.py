@@ -0,0 +1,360 @@
+import asyncio
+import email.utils
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+import httpx
+from google.genai.errors import ClientError as GenaiClientError
+from google.genai.errors import ServerError as GenaiServerError
+from openai import APIConnectionError as OpenAIConnectionError
+from openai import InternalServerError as OpenAIServerError
+from openai import RateLimitError as OpenAIRateLimitError
+
+from src.config import settings
+from src.metrics.pipeline_metrics import api_retries
+from src.tracing.tracer import current_span
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_GEMINI = "gemini"
+PROVIDER_OPENAI = "openai"
+
+REASON_RATE_LIMITED = "rate_limited"
+REASON_TRANSIENT = "transient"
+
+T = TypeVar("T")
+
+_DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s*$")
+
+
+@dataclass(frozen=True)
+class Throttle:
+    """再試行すべきエラーの情報。"""
+
+    reason: str  # REASON_RATE_LIMITED / REASON_TRANSIENT
+    retry_after: Optional[float] = None  # サーバーが指定した待ち時間（秒）
+
+
+def _header_retry_after(response) -> Optional[float]:
+    """Retry-After / retry-after-ms ヘッダーを秒に変換する。"""
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # HTTP-date 形式
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+def _gemini_retry_delay(details) -> Optional[float]:
+    """Gemini のエラー本文の RetryInfo (retryDelay: "12s") を秒に変換する。"""
+    error = details.get("error", {}) if isinstance(details, dict) else {}
+    for detail in error.get("details") or []:
+        if isinstance(detail, dict) and "retryDelay" in detail:
+            match = _DURATION_RE.match(str(detail["retryDelay"]))
+            if match:
+                return float(match.group(1))
+    return None
+
+
+def is_insufficient_quota(error: OpenAIRateLimitError) -> bool:
+    """OpenAI の 429 のうち、残高不足（再試行しても回復しない）かどうか。"""
+    body = getattr(error, "body", None) or {}
+    detail = body.get("error", body) if isinstance(body, dict) else {}
+    if not isinstance(detail, dict):
+        return False
+    return "insufficient_quota" in (detail.get("code"), detail.get("type"))
+
+
+def classify_retry(error: BaseException) -> Optional[Throttle]:
+    """例外が再試行で回復しうるかを判定する。再試行しない場合は None。"""
+    if isinstance(error, OpenAIRateLimitError):
+        if is_insufficient_quota(error):
+            return None
+        return Throttle(REASON_RATE_LIMITED, _header_retry_after(error.response))
+    if isinstance(error, OpenAIServerError):
+        return Throttle(REASON_TRANSIENT, _header_retry_after(error.response))
+    if isinstance(error, OpenAIConnectionError):
+        return Throttle(REASON_TRANSIENT)
+
+    if isinstance(error, GenaiClientError):
+        if error.code != 429:
+            return None
+        retry_after = _header_retry_after(error.response)
+        if retry_after is None:
+            retry_after = _gemini_retry_delay(error.details)
+        return Throttle(REASON_RATE_LIMITED, retry_after)
+    if isinstance(error, GenaiServerError):
+        return Throttle(REASON_TRANSIENT, _header_retry_after(error.response))
+
+    if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return Throttle(REASON_TRANSIENT)
+    return None
+
+
+class RateGovernor:
+    """1つのプロバイダ・APIキーに対する送信レートと同時実行数の制御。
+
+    送信はトークンバケット（requests_per_minute / burst）で平滑化する。
+    同時実行数の上限は AIMD で調整し、429 を受けたら半減、成功するごとに
+    おおよそ上限1回分の成功で +1 ずつ戻す。Retry-After を受けた場合は
+    その時刻まで同じキーの送信をすべて止める。
+
+    イベントループをまたいで共有できるよう、状態は threading.Lock で守り、
+    待機にはループごとの Future を使う。
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        burst: int,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._waiters: deque[asyncio.Future] = deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> Optional[float]:
+        """枠を確保できたら 0、トークン待ちなら待つ秒数、同時実行数の空き待ちなら None。"""
+        with self._lock:
+            now = self._clock()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.in_flight >= int(self.limit):
+                return None
+            if self.rate > 0:
+                self._tokens = min(self.burst, self._tokens + max(0.0, now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens < 1:
+                    return (1 - self._tokens) / self.rate
+                self._tokens -= 1
+            self.in_flight += 1
+            return 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            delay = self._try_acquire()
+            if delay == 0:
+                return
+            if delay is not None:
+                await asyncio.sleep(delay)
+                continue
+            waiter = asyncio.get_running_loop().create_future()
+            with self._lock:
+                if self.in_flight < int(self.limit):
+                    continue
+                self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # 起こされた直後にキャンセルされた場合、空いた枠を次の待機者に渡す
+                with self._lock:
+                    self._wake_locked()
+                raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._wake_locked()
+
+    def _wake_locked(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            try:
+                waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                # 終了済みのイベントループの待機者
+                continue
+            free -= 1
+
+    def on_success(self) -> None:
+        with self._lock:
+            if self.limit < self.max_concurrency:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self._wake_locked()
+
+    def on_throttled(self, retry_after: Optional[float] = None) -> None:
+        """429 を受けた時に呼ぶ。同時に実行中だったリクエストの 429 で重ねて減らさないよう、
+        減少は1秒に1回までにする。"""
+        with self._lock:
+            now = self._clock()
+            self.throttled += 1
+            if now - self._last_decrease >= 1.0:
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                self._last_decrease = now
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+                self._tokens = 0.0
+                self._updated = self._paused_until
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def backoff_delay(attempt: int, throttle: Throttle, rng: random.Random = random) -> float:
+    """attempt 回目（0始まり）の失敗後の待ち時間。
+
+    指数バックオフに full jitter をかけ、Retry-After がある場合はそれより短くしない。
+    """
+    cap = min(settings.api_retry_max_delay, settings.api_retry_base_delay * (2 ** attempt))
+    delay = rng.uniform(0, cap)
+    if throttle.retry_after is not None:
+        delay = max(delay, throttle.retry_after)
+    return delay
+
+
+async def call_with_retry(
+    governor: RateGovernor,
+    provider: str,
+    call: Callable[[], Awaitable[T]],
+    hold: bool = False,
+) -> T:
+    """governor の枠を確保して call を実行し、429・一時的なエラーは再試行する。
+
+    再試行しないエラー、試行回数の上限、API_RETRY_AFTER_MAX を超える Retry-After の場合は
+    最後の例外をそのまま送出する。hold=True の場合は成功時に枠を解放せずに返すため、
+    呼び出し側が使い終わった後に governor.release() を呼ぶ。
+    """
+    attempt = 0
+    while True:
+        await governor.acquire()
+        held = False
+        try:
+            result = await call()
+        except Exception as e:
+            throttle = classify_retry(e)
+            if throttle is not None and throttle.reason == REASON_RATE_LIMITED:
+                governor.on_throttled(throttle.retry_after)
+            attempt += 1
+            if (
+                throttle is None
+                or attempt >= settings.api_retry_max_attempts
+                or (throttle.retry_after or 0) > settings.api_retry_after_max
+            ):
+                raise
+            delay = backoff_delay(attempt - 1, throttle)
+            api_retries.inc(provider=provider, reason=throttle.reason)
+            span = current_span()
+            if span is not None:
+                span.set_attribute("retries", attempt)
+            logger.warning(
+                "%s API呼び出しを %.1f 秒後に再試行します (%d/%d): %s",
+                provider, delay, attempt, settings.api_retry_max_attempts - 1, e,
+            )
+        else:
+            governor.on_success()
+            held = hold
+            return result
+        finally:
+            if not held:
+                governor.release()
+        await asyncio.sleep(delay)
+
+
+class GovernorRegistry:
+    """プロバイダとAPIキーごとの RateGovernor を保持する。
+
+    同じキーを使うリクエストはワーカー内ですべて同じ governor を共有する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._governors: dict[tuple[str, str], RateGovernor] = {}
+
+    def get(self, provider: str, api_key: str) -> RateGovernor:
+        key = (provider, api_key)
+        with self._lock:
+            governor = self._governors.get(key)
+            if governor is None:
+                rpm = (
+                    settings.gemini_requests_per_minute
+                    if provider == PROVIDER_GEMINI
+                    else settings.openai_requests_per_minute
+                )
+                governor = RateGovernor(
+                    rpm,
+                    settings.api_rate_burst,
+                    settings.api_max_concurrency,
+                    settings.api_min_concurrency,
+                )
+                self._governors[key] = governor
+            return governor
+
+    def snapshot(self) -> list[tuple[str, RateGovernor]]:
+        with self._lock:
+            return [(provider, g) for (provider, _), g in self._governors.items()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._governors.clear()
+
+
+async def governed_call(provider: str, api_key: str, call: Callable[[], Awaitable[T]]) -> T:
+    """APIキーに対応する governor の下で call を実行する（再試行つき）。"""
+    return await call_with_retry(governor_registry.get(provider, api_key), provider, call)
+
+
+@asynccontextmanager
+async def governed_stream(
+    provider: str, api_key: str, call: Callable[[], Awaitable[T]]
+) -> AsyncIterator[T]:
+    """governed_call のストリーミング版。call が返すストリームを開くまで再試行し、
+    ストリームを読み終えるか途中で抜けるまで governor の枠を保持する。
+
+    抜ける時にストリームが close() を持っていれば呼び、接続を解放する。
+    """
+    governor = governor_registry.get(provider, api_key)
+    stream = await call_with_retry(governor, provider, call, hold=True)
+    try:
+        yield stream
+    finally:
+        try:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                await close()
+        finally:
+            governor.release()
+
+
+# シングルトンインスタンス
+governor_registry = GovernorRegistry()
@@ -1,4 +1,10 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
 from enum import Enum
+from typing import Optional
+
+from src.config import settings
 
 
 class CompanyType(Enum):
@@ -21,13 +27,207 @@ COMPANY_RULES: list[tuple[CompanyType, list[str]]] = [
 ]
 
 
-def detect_company(ocr_text: str) -> CompanyType:
+# 会社判定の方式
+STRATEGY_DSL = "dsl"  # DSLの順序で最初にマッチした会社
+STRATEGY_SCORE = "score"  # キーワードのヒット数が最も多い会社（同数はDSLの順序）
+
+
+def normalize_text(text: str) -> str:
+    """全角英数字・半角カナなどをNFKCで正規化する（ＯＣＮ → OCN）。"""
+    return unicodedata.normalize("NFKC", text)
+
+
+@dataclass
+class VendorHits:
+    """1社分のキーワードヒット。positions は正規化後テキスト上の (位置, キーワード)。
+
+    vendor はヒットしたルールのうちDSLの順序が最も先のもののベンダー名（名前のないルールは None）。
+    """
+
+    company: CompanyType
+    count: int = 0
+    positions: list[tuple[int, str]] = field(default_factory=list)
+    vendor: Optional[str] = None
+
+
+@dataclass
+class RouteResult:
+    """テキスト全体の走査結果。hits はヒットのあった会社をルールの順序で保持する。"""
+
+    hits: dict[CompanyType, VendorHits]
+
+    def by_dsl_order(self) -> CompanyType:
+        return next(iter(self.hits), CompanyType.OTHER)
+
+    def by_score(self) -> CompanyType:
+        if not self.hits:
+            return CompanyType.OTHER
+        # max は同点のとき最初の要素を返すので、同数ならDSLの順序が優先される
+        return max(self.hits.values(), key=lambda h: h.count).company
+
+    def pick(self, strategy: str) -> CompanyType:
+        if strategy == STRATEGY_SCORE:
+            return self.by_score()
+        return self.by_dsl_order()
+
+    def vendor_for(self, company: CompanyType) -> Optional[str]:
+        hits = self.hits.get(company)
+        return hits.vendor if hits is not None else None
+
+
+@dataclass(frozen=True)
+class _CompiledRules:
+    pattern: Optional[re.Pattern]
+    # キーワード → 最初にそのキーワードを持つルールの番号
+    keyword_rule: dict[str, int]
+    rule_company: list[CompanyType]
+    rule_vendor: list[Optional[str]]
+    order: dict[CompanyType, int]
+    # キーワード → そのキーワードの先頭部分に一致する他のキーワード（長い順）
+    prefixes: dict[str, tuple[str, ...]]
+
+
+class RouterEngine:
+    """全社のキーワードを1つの正規表現にまとめ、テキストを1回の走査で判定するエンジン。
+
+    キーワードとテキストはNFKCで正規化してから照合する。ルールは rebuild で
+    実行中に差し替えられる（コンパイル済みのルールを1回の代入で切り替える）。
+    DSLの「含む」条件と同じく、長いキーワードの中に含まれる短いキーワード
+    （"NTTドコモビジネス" の中の "ドコモ" など）も別のヒットとして数える。
+    vendors を渡すとルールごとのベンダー名を記録し、scan の結果から引けるようにする。
+    """
+
+    def __init__(
+        self,
+        rules: list[tuple[CompanyType, list[str]]],
+        vendors: Optional[list[Optional[str]]] = None,
+    ):
+        self._compiled = self._compile(rules, vendors)
+
+    def rebuild(
+        self,
+        rules: list[tuple[CompanyType, list[str]]],
+        vendors: Optional[list[Optional[str]]] = None,
+    ) -> None:
+        self._compiled = self._compile(rules, vendors)
+
+    @staticmethod
+    def _compile(
+        rules: list[tuple[CompanyType, list[str]]],
+        vendors: Optional[list[Optional[str]]],
+    ) -> _CompiledRules:
+        if vendors is None:
+            vendors = [None] * len(rules)
+        if len(vendors) != len(rules):
+            raise ValueError("vendors の数がルールの数と一致しません")
+        keyword_rule: dict[str, int] = {}
+        order: dict[CompanyType, int] = {}
+        for index, (company, keywords) in enumerate(rules):
+            order.setdefault(company, len(order))
+            for keyword in keywords:
+                normalized = normalize_text(keyword)
+                if normalized:
+                    # 同じキーワードが複数のルールにある場合はDSLの順序が先のルール
+                    keyword_rule.setdefault(normalized, index)
+        pattern = None
+        prefixes: dict[str, tuple[str, ...]] = {}
+        if keyword_rule:
+            # 各位置で先読みし、その位置から始まる最長のキーワードを取る。
+            # 同じ位置から始まる短いキーワードは最長キーワードの先頭部分なので prefixes で補う
+            keywords = sorted(keyword_rule, key=len, reverse=True)
+            pattern = re.compile("(?=(" + "|".join(re.escape(k) for k in keywords) + "))")
+            prefixes = {
+                k: tuple(p for p in keywords if len(p) < len(k) and k.startswith(p))
+                for k in keywords
+            }
+        return _CompiledRules(
+            pattern,
+            keyword_rule,
+            [company for company, _ in rules],
+            list(vendors),
+            order,
+            prefixes,
+        )
+
+    def scan(self, text: str) -> RouteResult:
+        """テキストを走査し、会社ごとのヒット数と位置を返す。"""
+        compiled = self._compiled
+        found: dict[CompanyType, VendorHits] = {}
+        first_rule: dict[CompanyType, int] = {}
+        if compiled.pattern is not None:
+            for match in compiled.pattern.finditer(normalize_text(text)):
+                longest = match.group(1)
+                for keyword in (longest, *compiled.prefixes[longest]):
+                    rule = compiled.keyword_rule[keyword]
+                    company = compiled.rule_company[rule]
+                    hits = found.get(company)
+                    if hits is None:
+                        hits = found[company] = VendorHits(company)
+                    hits.count += 1
+                    hits.positions.append((match.start(), keyword))
+                    if rule < first_rule.get(company, len(compiled.rule_company)):
+                        first_rule[company] = rule
+                        hits.vendor = compiled.rule_vendor[rule]
+        ordered = sorted(found.values(), key=lambda h: compiled.order[h.company])
+        return RouteResult({h.company: h for h in ordered})
+
+    def detect(self, text: str, strategy: str = STRATEGY_DSL) -> CompanyType:
+        return self.scan(text).pick(strategy)
+
+
+router_engine = RouterEngine(COMPANY_RULES)
+
+
+def detect_company(
+    ocr_text: str,
+    strategy: Optional[str] = None,
+    engine: Optional[RouterEngine] = None,
+) -> CompanyType:
     """OCRテキストからキーワードマッチで会社を判定する。
 
-    DSL IF/ELSE ノードと同じ順序で評価し、最初にマッチした会社を返す。
+    既定 (router_strategy=dsl) では DSL IF/ELSE ノードと同じ順序で評価し、
+    最初にマッチした会社を返す。score ではヒット数の最も多い会社を返す。
     どの条件にもマッチしない場合は OTHER を返す。
+    engine を省略した場合は COMPANY_RULES のエンジンを使う。
+    """
+    return (engine or router_engine).detect(ocr_text, strategy or settings.router_strategy)
+
+
+def match_vendor(
+    text: str, company: CompanyType, engine: Optional[RouterEngine] = None
+) -> Optional[str]:
+    """text の中で company に判定されたルールのうち、DSLの順序が最も先のベンダー名を返す。
+
+    ヒットがない場合や名前のないルールの場合は None を返す。
+    """
+    return (engine or router_engine).scan(text).vendor_for(company)
+
+
+# 分割OCR (ocr.PAGE_BREAK / ocr.FILE_BREAK) の区切り文字
+_PAGE_MARK = "\f"
+_FILE_MARK = "\f\f"
+
+
+def segment_by_company(
+    ocr_text: str, engine: Optional[RouterEngine] = None
+) -> dict[CompanyType, str]:
+    """OCRテキストをファイル/ページ単位のセグメントに分け、会社ごとにまとめる。
+
+    各セグメントを detect_company で判定する。どの会社にもマッチしないページは
+    同じファイル内の直前のページの続きとみなし、直前と同じ会社に割り当てる。
+    区切りのないテキストは全体で1セグメントとして扱う。
+    会社の並びは最初に出現した順になる。
     """
-    for company_type, keywords in COMPANY_RULES:
-        if any(keyword in ocr_text for keyword in keywords):
-            return company_type
-    return CompanyType.OTHER
+    grouped: dict[CompanyType, list[str]] = {}
+    for file_text in ocr_text.split(_FILE_MARK):
+        current: CompanyType | None = None
+        for page in file_text.split(_PAGE_MARK):
+            page = page.strip()
+            if not page:
+                continue
+            company = detect_company(page, engine=engine)
+            if company == CompanyType.OTHER and current is not None:
+                company = current
+            grouped.setdefault(company, []).append(page)
+            current = company
+    return {company: "\n\n".join(pages) for company, pages in grouped.items()}
@@ -0,0 +1,184 @@
+import io
+import logging
+import mmap
+import tempfile
+from typing import BinaryIO, Callable, Optional, Union
+
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from src.config import settings
+from src.workflow.validation import validate_upload_filenames
+
+logger = logging.getLogger(__name__)
+
+# パイプラインに渡すファイル内容。小さいファイルは bytes、
+# ディスクに退避したファイルは読み取り専用のメモリマップ
+FileContent = Union[bytes, mmap.mmap]
+
+ERROR_MESSAGE_NO_FILES = "ファイルが選択されていません。"
+
+ERROR_MESSAGE_INVALID_UPLOAD = "アップロードされたデータを読み込めませんでした。"
+
+
+class UploadRejectedError(Exception):
+    """アップロードを受け付けられない場合のエラー。メッセージはユーザー向け。"""
+    pass
+
+
+class SpooledUpload:
+    """チャンク単位で受信したアップロードファイル。
+
+    upload_spool_max_memory まではメモリに保持し、超えた時点で一時ファイルに退避する。
+    受信中にサイズを数える。
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.size = 0
+        self._buffer: Optional[io.BytesIO] = io.BytesIO()
+        self._file: Optional[BinaryIO] = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    def write(self, data: bytes) -> None:
+        if self._file is None and self.size + len(data) > settings.upload_spool_max_memory:
+            self._file = tempfile.TemporaryFile()
+            self._file.write(self._buffer.getvalue())
+            self._buffer = None
+        (self._file or self._buffer).write(data)
+        self.size += len(data)
+
+    def content(self) -> FileContent:
+        """ファイル内容を返す。ディスク上のファイルはコピーせずメモリマップで返す。"""
+        if self._file is None:
+            return self._buffer.getvalue()
+        if self._mmap is None:
+            self._file.flush()
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def close(self) -> None:
+        """メモリマップと一時ファイルを閉じる（一時ファイルは削除される）。"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._buffer = None
+
+
+def close_uploads(uploads: list[SpooledUpload]) -> None:
+    """アップロードファイルをすべて閉じる。"""
+    for upload in uploads:
+        try:
+            upload.close()
+        except Exception:
+            logger.warning("スプールファイルのクローズに失敗しました: %s", upload.filename, exc_info=True)
+
+
+async def receive_uploads(
+    request: Request,
+    field_name: str = "files",
+    validate: Callable[[list[str]], Optional[str]] = validate_upload_filenames,
+    max_file_bytes: Optional[int] = None,
+    max_request_bytes: Optional[int] = None,
+) -> list[SpooledUpload]:
+    """multipart/form-data のリクエストボディをストリームで受信し、ファイルをスプールする。
+
+    受信しながらファイル数・拡張子・1ファイルあたり/リクエスト全体のサイズ上限を検証し、
+    上限を超えた時点で受信を打ち切る。ファイル名の検証とサイズ上限は引数で差し替えられる
+    （省略時は validate_upload_filenames と max_upload_file_bytes / max_upload_request_bytes）。
+
+    Raises:
+        UploadRejectedError: 検証に失敗した場合（呼び出し側でユーザーに表示する）
+    """
+    if max_file_bytes is None:
+        max_file_bytes = settings.max_upload_file_bytes
+    if max_request_bytes is None:
+        max_request_bytes = settings.max_upload_request_bytes
+    max_file_mb = max_file_bytes // (1024 * 1024)
+    max_request_mb = max_request_bytes // (1024 * 1024)
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > max_request_bytes:
+            raise UploadRejectedError(f"アップロードの合計サイズは{max_request_mb}MBまでです。")
+
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadRejectedError(ERROR_MESSAGE_INVALID_UPLOAD)
+
+    uploads: list[SpooledUpload] = []
+    state: dict = {"header_field": b"", "headers": {}, "current": None, "total": 0}
+
+    def on_part_begin() -> None:
+        state["headers"] = {}
+        state["current"] = None
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        name = state["header_field"].lower()
+        state["headers"][name] = state["headers"].get(name, b"") + data[start:end]
+
+    def on_header_end() -> None:
+        state["header_field"] = b""
+
+    def on_headers_finished() -> None:
+        _, options = parse_options_header(state["headers"].get(b"content-disposition"))
+        if options.get(b"name", b"").decode("utf-8", "replace") != field_name:
+            return
+        if b"filename" not in options:
+            return
+        filename = options[b"filename"].decode("utf-8", "replace")
+        error_message = validate([u.filename for u in uploads] + [filename])
+        if error_message:
+            raise UploadRejectedError(error_message)
+        upload = SpooledUpload(filename)
+        uploads.append(upload)
+        state["current"] = upload
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        upload: Optional[SpooledUpload] = state["current"]
+        if upload is None:
+            return
+        length = end - start
+        state["total"] += length
+        if upload.size + length > max_file_bytes:
+            raise UploadRejectedError(
+                f"ファイルサイズは1ファイルあたり{max_file_mb}MBまでです: {upload.filename}"
+            )
+        if state["total"] > max_request_bytes:
+            raise UploadRejectedError(f"アップロードの合計サイズは{max_request_mb}MBまでです。")
+        upload.write(data[start:end])
+
+    parser = MultipartParser(
+        boundary,
+        callbacks={
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+        },
+    )
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except UploadRejectedError:
+        close_uploads(uploads)
+        raise
+    except Exception as e:
+        close_uploads(uploads)
+        logger.warning("multipartの解析に失敗しました: %s", e)
+        raise UploadRejectedError(ERROR_MESSAGE_INVALID_UPLOAD) from e
+
+    if not uploads:
+        raise UploadRejectedError(ERROR_MESSAGE_NO_FILES)
+    return uploads
@@ -0,0 +1,24 @@
+from typing import Optional
+
+from src.config import settings
+
+ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg"}
+
+
+def validate_upload_filenames(filenames: list[str]) -> Optional[str]:
+    """アップロードされたファイル数と拡張子を検証する。
+
+    Returns:
+        エラー時はユーザー向けエラーメッセージ、問題なければ None
+    """
+    # バリデーション: ファイル数
+    if len(filenames) > settings.max_file_count:
+        return f"ファイルは同時に{settings.max_file_count}枚までです。"
+
+    # バリデーション: ファイル形式
+    for filename in filenames:
+        ext = "." + filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+        if ext not in ALLOWED_EXTENSIONS:
+            return f"サポートされていないファイル形式です: {filename}"
+
+    return None
@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.workflow import analyzer, ratelimit
+from src.workflow.analyzer import AnalysisError, MarkdownLineBuffer, analyze_bill_stream
+from src.workflow.router import CompanyType
+
+
+class TestMarkdownLineBuffer:
+    def test_rows_split_across_fragments(self):
+        buffer = MarkdownLineBuffer()
+        assert buffer.feed("| 03-1234 | 基本") == []
+        assert buffer.feed("料 | 1800 |  |\n| 03-12") == ["| 03-1234 | 基本料 | 1800 |  |"]
+        assert buffer.feed("34 | 通話料 | 10 |  |") == []
+        assert buffer.flush() == ["| 03-1234 | 通話料 | 10 |  |"]
+
+    def test_non_table_lines_dropped(self):
+        buffer = MarkdownLineBuffer()
+        assert buffer.feed("以下が明細です。\n\n| a | b | 1 |  |\n") == ["| a | b | 1 |  |"]
+        assert buffer.flush() == []
+
+
+def _fake_client(fragments=None, error=None):
+    async def stream():
+        for fragment in fragments:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=fragment))])
+
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        if error is not None:
+            raise error
+        return stream()
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+class TestAnalyzeBillStream:
+    def _collect(self, company=CompanyType.NTT):
+        async def run():
+            return [row async for row in analyze_bill_stream("text", company, "key")]
+        return asyncio.run(run())
+
+    def test_yields_completed_rows(self, monkeypatch):
+        client = _fake_client(["| a | b |", " 1 |  |\n| c", " | d | 2 |  |"])
+        monkeypatch.setattr(analyzer.client_registry, "get_openai_client", lambda key: client)
+        assert self._collect() == ["| a | b | 1 |  |", "| c | d | 2 |  |"]
+
+    def test_error_wrapped(self, monkeypatch):
+        client = _fake_client(error=RuntimeError("boom"))
+        monkeypatch.setattr(analyzer.client_registry, "get_openai_client", lambda key: client)
+        with pytest.raises(AnalysisError) as exc_info:
+            self._collect()
+        assert isinstance(exc_info.value.__cause__, RuntimeError)
+
+    def test_slot_is_held_until_stream_is_consumed(self, monkeypatch):
+        client = _fake_client(["| a | b | 1 |  |\n", "| c | d | 2 |  |\n"])
+        monkeypatch.setattr(analyzer.client_registry, "get_openai_client", lambda key: client)
+        ratelimit.governor_registry.clear()
+        governor = ratelimit.governor_registry.get(ratelimit.PROVIDER_OPENAI, "key")
+        in_flight: list[int] = []
+
+        async def run():
+            stream = analyze_bill_stream("text", CompanyType.NTT, "key")
+            in_flight.append(governor.in_flight)
+            async for _ in stream:
+                in_flight.append(governor.in_flight)
+            in_flight.append(governor.in_flight)
+
+            # 途中で読むのをやめた場合も枠を返す
+            stream = analyze_bill_stream("text", CompanyType.NTT, "key")
+            await stream.__anext__()
+            in_flight.append(governor.in_flight)
+            await stream.aclose()
+            in_flight.append(governor.in_flight)
+
+        try:
+            asyncio.run(run())
+        finally:
+            ratelimit.governor_registry.clear()
+        assert in_flight == [0, 1, 1, 0, 1, 0]
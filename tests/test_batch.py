@@ -0,0 +1,256 @@
+import asyncio
+import io
+import json
+import time
+import zipfile
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from openpyxl import load_workbook
+
+from src.batch import routes as routes_module
+from src.batch import scheduler as scheduler_module
+from src.batch.archive import BatchRejectedError, open_batch_archive, validate_archive_filenames
+from src.batch.scheduler import (
+    GROUP_STATUS_FAILED,
+    GROUP_STATUS_SUCCEEDED,
+    OUTPUT_FILES,
+    OUTPUT_SHEETS,
+    BatchQueueFullError,
+    BatchScheduler,
+)
+from src.config import settings
+from src.jobs.store import JOB_STATUS_SUCCEEDED, InMemoryJobStore
+from src.secrets.manager import secret_manager
+from src.workflow.pipeline import PipelineResult
+
+
+def _zip(entries: dict[str, bytes]) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in entries.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+class TestBatchArchive:
+    def test_groups_by_top_level_folder(self):
+        content = _zip({
+            "顧客A/1.pdf": b"a1",
+            "顧客A/2.png": b"a2",
+            "顧客B/1.pdf": b"b1",
+            "root.pdf": b"r",
+            "__MACOSX/顧客A/._1.pdf": b"",
+            "顧客B/.DS_Store": b"",
+        })
+        archive, groups = open_batch_archive(content, "2025-09.zip")
+        layout = {g.name: g.members for g in groups}
+        assert layout == {
+            "顧客A": ["顧客A/1.pdf", "顧客A/2.png"],
+            "顧客B": ["顧客B/1.pdf"],
+            "2025-09": ["root.pdf"],
+        }
+        assert groups[0].load() == [("1.pdf", b"a1"), ("2.png", b"a2")]
+        archive.close()
+
+    def test_manifest(self):
+        manifest = {"groups": [{"name": "X社", "files": ["scan/1.pdf", "scan/3.pdf"]}]}
+        content = _zip({
+            "manifest.json": json.dumps(manifest).encode(),
+            "scan/1.pdf": b"1",
+            "scan/2.pdf": b"2",
+            "scan/3.pdf": b"3",
+        })
+        archive, groups = open_batch_archive(content, "batch.zip")
+        assert [(g.name, g.members) for g in groups] == [("X社", ["scan/1.pdf", "scan/3.pdf"])]
+        archive.close()
+
+    def test_manifest_unknown_file(self):
+        manifest = {"groups": [{"name": "X社", "files": ["missing.pdf"]}]}
+        content = _zip({"manifest.json": json.dumps(manifest).encode(), "a.pdf": b"1"})
+        with pytest.raises(BatchRejectedError):
+            open_batch_archive(content, "batch.zip")
+
+    def test_rejects_unsupported_files_and_too_many_groups(self, monkeypatch):
+        with pytest.raises(BatchRejectedError):
+            open_batch_archive(_zip({"A/a.exe": b"1"}), "batch.zip")
+        monkeypatch.setattr(settings, "batch_max_groups", 1)
+        with pytest.raises(BatchRejectedError):
+            open_batch_archive(_zip({"A/a.pdf": b"1", "B/b.pdf": b"2"}), "batch.zip")
+
+    def test_rejects_broken_zip(self):
+        with pytest.raises(BatchRejectedError):
+            open_batch_archive(b"not a zip", "batch.zip")
+
+    def test_validate_archive_filenames(self):
+        assert validate_archive_filenames(["a.zip"]) is None
+        assert validate_archive_filenames(["a.pdf"]) is not None
+        assert validate_archive_filenames(["a.zip", "b.zip"]) is not None
+
+
+def _groups(name: str, count: int):
+    content = _zip({f"{name}{i}/a.pdf": f"{name}{i}".encode() for i in range(count)})
+    return open_batch_archive(content, f"{name}.zip")[1]
+
+
+async def _wait_finished(scheduler: BatchScheduler, job_id: str) -> None:
+    while not scheduler.store.get(job_id).finished:
+        await asyncio.sleep(0.005)
+
+
+class TestBatchScheduler:
+    def test_groups_are_scheduled_round_robin(self, monkeypatch):
+        order: list[bytes] = []
+
+        async def fake_process_bill(files, google, openai, drive, **kwargs):
+            order.append(files[0][1])
+            await asyncio.sleep(0)
+            return PipelineResult(success=True, drive_url="https://drive", filename=kwargs["filename_base"])
+
+        monkeypatch.setattr(scheduler_module, "process_bill", fake_process_bill)
+        scheduler = BatchScheduler(InMemoryJobStore(), concurrency=1, max_active=10)
+
+        async def run():
+            await scheduler.start()
+            big = scheduler.submit(_groups("A", 4), "g", "o", "folder")
+            small = scheduler.submit(_groups("B", 2), "g", "o", "folder")
+            await _wait_finished(scheduler, big.id)
+            await _wait_finished(scheduler, small.id)
+            await scheduler.stop()
+            return scheduler.store.get(big.id)
+
+        job = asyncio.run(run())
+        assert order == [b"A0", b"B0", b"A1", b"B1", b"A2", b"A3"]
+        assert job.status == JOB_STATUS_SUCCEEDED
+        assert job.result["succeeded"] == 4
+        assert job.result["groups"][0]["filename"] == f"{settings.output_filename}_A0"
+
+    def test_concurrency_is_bounded(self, monkeypatch):
+        running = 0
+        peak = 0
+
+        async def fake_process_bill(files, google, openai, drive, **kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return PipelineResult(success=True)
+
+        monkeypatch.setattr(scheduler_module, "process_bill", fake_process_bill)
+        scheduler = BatchScheduler(InMemoryJobStore(), concurrency=3, max_active=10)
+
+        async def run():
+            await scheduler.start()
+            job = scheduler.submit(_groups("A", 10), "g", "o", "folder")
+            await _wait_finished(scheduler, job.id)
+            await scheduler.stop()
+
+        asyncio.run(run())
+        assert peak == 3
+
+    def test_sheets_output_uploads_one_workbook(self, monkeypatch):
+        uploaded: dict = {}
+
+        async def fake_process_bill(files, google, openai, drive, **kwargs):
+            assert kwargs["collect_rows"] is True
+            name = files[0][1].decode()
+            if name == "A1":
+                return PipelineResult(success=False, error_message="empty")
+            return PipelineResult(success=True, rows=[
+                "| 番号 | サービス | 金額(円) | 備考 |",
+                "| --- | --- | --- | --- |",
+                f"| {name} | 基本料 | 100 |  |",
+            ])
+
+        async def fake_upload(xlsx_file, folder_id, filename):
+            uploaded["workbook"] = load_workbook(io.BytesIO(xlsx_file.read()))
+            uploaded["filename"] = filename
+            return "https://drive/batch"
+
+        monkeypatch.setattr(scheduler_module, "process_bill", fake_process_bill)
+        monkeypatch.setattr(scheduler_module, "upload_to_drive_async", fake_upload)
+        scheduler = BatchScheduler(InMemoryJobStore(), concurrency=2, max_active=10)
+
+        async def run():
+            await scheduler.start()
+            job = scheduler.submit(_groups("A", 3), "g", "o", "folder", output=OUTPUT_SHEETS)
+            await _wait_finished(scheduler, job.id)
+            await scheduler.stop()
+            return scheduler.store.get(job.id)
+
+        job = asyncio.run(run())
+        assert uploaded["workbook"].sheetnames == ["A0", "A2"]
+        assert list(uploaded["workbook"]["A2"].values)[1] == ("A2", "基本料", 100, None)
+        assert job.result["drive_url"] == "https://drive/batch"
+        assert [g["status"] for g in job.result["groups"]] == [
+            GROUP_STATUS_SUCCEEDED, GROUP_STATUS_FAILED, GROUP_STATUS_SUCCEEDED,
+        ]
+        assert job.result["groups"][0]["row_count"] == 1
+
+    def test_max_active_batches(self):
+        scheduler = BatchScheduler(InMemoryJobStore(), concurrency=1, max_active=1)
+
+        async def run():
+            await scheduler.start()
+            scheduler._tasks[0].cancel()
+            scheduler.submit(_groups("A", 1), "g", "o", "folder", output=OUTPUT_FILES)
+            with pytest.raises(BatchQueueFullError):
+                scheduler.submit(_groups("B", 1), "g", "o", "folder")
+            await scheduler.stop()
+
+        asyncio.run(run())
+
+
+class TestBatchRoutes:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        scheduler = BatchScheduler(InMemoryJobStore(), concurrency=2, max_active=10)
+
+        async def fake_process_bill(files, google, openai, drive, **kwargs):
+            return PipelineResult(success=True, drive_url=f"https://drive/{files[0][0]}")
+
+        async def fake_credentials():
+            return "g", "o", "folder"
+
+        @asynccontextmanager
+        async def lifespan(app):
+            await scheduler.start()
+            yield
+            await scheduler.stop()
+
+        monkeypatch.setattr(scheduler_module, "process_bill", fake_process_bill)
+        monkeypatch.setattr(routes_module, "batch_scheduler", scheduler)
+        monkeypatch.setattr(secret_manager, "get_pipeline_credentials", fake_credentials)
+        # ZIPがメモリマップで渡される経路を通す
+        monkeypatch.setattr(settings, "upload_spool_max_memory", 10)
+        app = FastAPI(lifespan=lifespan)
+        app.include_router(routes_module.batches_router)
+        with TestClient(app) as client:
+            yield client
+
+    def test_submit_and_poll(self, client):
+        archive = _zip({"A/a.pdf": b"1", "B/b.pdf": b"2"})
+        response = client.post(
+            "/batches?output=files", files=[("archive", ("batch.zip", archive, "application/zip"))]
+        )
+        assert response.status_code == 202
+        body = response.json()
+        assert body["groups"] == ["A", "B"]
+
+        for _ in range(100):
+            status = client.get(f"/batches/{body['job_id']}").json()
+            if status["status"] == JOB_STATUS_SUCCEEDED:
+                break
+            time.sleep(0.01)
+        assert [g["drive_url"] for g in status["batch"]["groups"]] == [
+            "https://drive/a.pdf", "https://drive/b.pdf",
+        ]
+
+    def test_rejects_non_zip_and_bad_output(self, client):
+        pdf = [("archive", ("a.pdf", b"%PDF", "application/pdf"))]
+        assert client.post("/batches", files=pdf).json()["success"] is False
+        archive = [("archive", ("batch.zip", _zip({"A/a.pdf": b"1"}), "application/zip"))]
+        assert client.post("/batches?output=csv", files=archive).json()["success"] is False
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from benchmarks.pipeline import (
+    TARGET_EXTRACT,
+    TARGET_PROCESS_BILL,
+    BackendProfile,
+    BenchConfig,
+    percentiles,
+    run_benchmark,
+)
+from src.workflow.clients import ClientRegistry, client_registry
+
+
+def _config(target: str, **kwargs) -> BenchConfig:
+    return BenchConfig(
+        target=target,
+        requests=4,
+        concurrency=2,
+        ocr=BackendProfile(),
+        analysis=BackendProfile(),
+        drive=BackendProfile(),
+        rows=3,
+        **kwargs,
+    )
+
+
+class TestPipelineBenchmark:
+    @pytest.mark.parametrize("target", [TARGET_PROCESS_BILL, TARGET_EXTRACT])
+    def test_reports_steps_and_restores_backends(self, target):
+        result = asyncio.run(run_benchmark(_config(target)))
+        assert result["summary"]["succeeded"] == 4
+        assert result["latency"]["total"]["count"] == 4
+        assert result["latency"]["steps"]["upload"]["count"] == 4
+        assert "get_genai_client" not in vars(client_registry)
+        assert client_registry.get_genai_client.__func__ is ClientRegistry.get_genai_client
+
+    def test_injected_errors_are_counted(self):
+        config = _config(TARGET_PROCESS_BILL)
+        config.analysis = BackendProfile(error_rate=1.0)
+        config.retry_base_delay = 0.001
+        result = asyncio.run(run_benchmark(config))
+        assert result["summary"]["failed"] == 4
+        assert result["latency"]["steps"]["analysis"]["count"] == 0
+
+    def test_throttled_calls_are_retried(self):
+        config = _config(TARGET_PROCESS_BILL)
+        config.analysis = BackendProfile(throttle_rate=0.5)
+        config.ocr = BackendProfile(throttle_rate=0.5)
+        config.retry_base_delay = 0.001
+        config.retry_max_attempts = 20
+        result = asyncio.run(run_benchmark(config))
+        assert result["summary"]["succeeded"] == 4
+        assert result["summary"]["throttled"]["openai"] > 0
+        assert result["summary"]["throttled"]["gemini"] > 0
+
+
+class TestPercentiles:
+    def test_nearest_rank(self):
+        stats = percentiles([i / 1000 for i in range(1, 101)])
+        assert stats["p50_ms"] == 50
+        assert stats["p95_ms"] == 95
+        assert stats["p99_ms"] == 99
+        assert stats["max_ms"] == 100
+
+    def test_empty(self):
+        assert percentiles([]) == {"count": 0}
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import sqlite3
+
+import pytest
+
+from src.cache import store
+from src.cache.analysis_cache import make_analysis_cache_key
+from src.cache.ocr_cache import make_ocr_cache_key
+from src.cache.store import TieredCache
+from src.config import settings
+from src.workflow.analyzer import PROMPT_MAP
+from src.workflow.router import CompanyType
+
+
+class TestTieredCache:
+    def test_miss_then_hit(self):
+        cache = TieredCache("test", max_entries=2)
+        assert cache.get("a") is None
+        cache.set("a", "text")
+        assert cache.get("a") == "text"
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_memory_lru_eviction(self):
+        cache = TieredCache("test", max_entries=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")  # a を最近使用済みにする
+        cache.set("c", "3")
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        assert cache.get("c") == "3"
+
+    def test_disk_tier_survives_new_instance(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        TieredCache("test", max_entries=1, disk_path=path).set("a", "text")
+        cache = TieredCache("test", max_entries=1, disk_path=path)
+        assert cache.get("a") == "text"
+        assert cache.stats()["disk_hits"] == 1
+
+    def test_disk_size_eviction(self, tmp_path):
+        cache = TieredCache("test", max_entries=1, disk_path=str(tmp_path / "c.db"), disk_max_bytes=10)
+        cache.set("a", "x" * 6)
+        cache.set("b", "y" * 6)
+        fresh = TieredCache("test", max_entries=1, disk_path=str(tmp_path / "c.db"))
+        assert fresh.get("a") is None
+        assert fresh.get("b") == "y" * 6
+
+    def test_namespaces_are_isolated(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        TieredCache("ocr", max_entries=1, disk_path=path).set("a", "text")
+        assert TieredCache("other", max_entries=1, disk_path=path).get("a") is None
+
+    def test_disk_read_does_not_write(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        TieredCache("ocr", max_entries=1, disk_path=path).set("a", "text")
+        reader = TieredCache("ocr", max_entries=1, disk_path=path)
+        assert reader.get("a") == "text"
+        assert reader._get_conn().total_changes == 0
+
+    def test_access_time_is_flushed_on_next_write(self, tmp_path):
+        cache = TieredCache("test", max_entries=1, disk_path=str(tmp_path / "c.db"), disk_max_bytes=12)
+        cache.set("a", "x" * 6)
+        cache.set("b", "y" * 6)  # a はメモリ層から追い出される
+        assert cache.get("a") == "x" * 6  # ディスク層から読む。accessed_at は次の書き込みで更新
+        cache.set("c", "z" * 6)
+        fresh = TieredCache("test", max_entries=1, disk_path=str(tmp_path / "c.db"))
+        assert fresh.get("b") is None
+        assert fresh.get("a") == "x" * 6
+
+    def test_async_api(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+
+        async def run():
+            await TieredCache("ocr", max_entries=1, disk_path=path).aset("a", "text")
+            cache = TieredCache("ocr", max_entries=1, disk_path=path)
+            return await cache.aget("a"), await cache.aget("missing"), cache.stats()
+
+        value, missing, stats = asyncio.run(run())
+        assert (value, missing) == ("text", None)
+        assert stats["disk_hits"] == 1 and stats["misses"] == 1
+
+    def test_shared_between_open_instances(self, tmp_path):
+        # gunicorn の各ワーカーが同じファイルを開いている状態
+        path = str(tmp_path / "cache.db")
+        first = TieredCache("ocr", max_entries=4, disk_path=path)
+        second = TieredCache("ocr", max_entries=4, disk_path=path)
+        assert second.get("a") is None
+        first.set("a", "text")
+        assert second.get("a") == "text"
+        journal_mode = first._get_conn().execute("PRAGMA journal_mode").fetchone()[0]
+        assert journal_mode == "wal"
+
+    def test_private_file_mode(self, tmp_path, monkeypatch):
+        path = tmp_path / "secrets.db"
+        (tmp_path / "secrets.db-wal").touch(mode=0o644)  # 権限の広い既存ファイルも揃える
+        modes = []
+        connect = sqlite3.connect
+
+        def checked_connect(database, *args, **kwargs):
+            # 接続する時点ですでに 0600 になっている
+            modes.append(os.stat(database).st_mode & 0o777)
+            return connect(database, *args, **kwargs)
+
+        monkeypatch.setattr(sqlite3, "connect", checked_connect)
+        cache = TieredCache("secrets", max_entries=1, disk_path=str(path), private=True)
+        cache.set("a", "key")
+        assert modes == [0o600]
+        for name in ("secrets.db", "secrets.db-wal", "secrets.db-shm"):
+            assert (tmp_path / name).stat().st_mode & 0o777 == 0o600
+
+
+class TestOcrCacheKey:
+    def test_same_content_same_key(self):
+        assert make_ocr_cache_key([("a.pdf", b"1")]) == make_ocr_cache_key([("b.pdf", b"1")])
+
+    def test_content_changes_key(self):
+        assert make_ocr_cache_key([("a.pdf", b"1")]) != make_ocr_cache_key([("a.pdf", b"2")])
+
+    def test_order_changes_key(self):
+        files = [("a.pdf", b"1"), ("b.pdf", b"2")]
+        assert make_ocr_cache_key(files) != make_ocr_cache_key(list(reversed(files)))
+
+    @pytest.mark.parametrize(
+        "name, value",
+        [
+            ("ocr_split_mode", True),
+            ("image_preprocess_enabled", False),
+            ("image_max_side", 1024),
+            ("image_jpeg_quality", 60),
+        ],
+    )
+    def test_ocr_settings_change_key(self, monkeypatch, name, value):
+        before = make_ocr_cache_key([("a.pdf", b"1")])
+        monkeypatch.setattr(settings, name, value)
+        assert make_ocr_cache_key([("a.pdf", b"1")]) != before
+
+    def test_pages_per_chunk_changes_key_in_split_mode(self, monkeypatch):
+        monkeypatch.setattr(settings, "ocr_split_mode", True)
+        before = make_ocr_cache_key([("a.pdf", b"1")])
+        monkeypatch.setattr(settings, "ocr_pdf_pages_per_chunk", settings.ocr_pdf_pages_per_chunk + 1)
+        assert make_ocr_cache_key([("a.pdf", b"1")]) != before
+
+
+class TestTtl:
+    def test_expired_entry_is_miss(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(store.time, "time", lambda: now[0])
+        cache = TieredCache("test", max_entries=2, ttl_seconds=60)
+        cache.set("a", "text")
+        now[0] += 30
+        assert cache.get("a") == "text"
+        now[0] += 31
+        assert cache.get("a") is None
+
+    def test_expired_disk_entry_is_miss(self, tmp_path, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(store.time, "time", lambda: now[0])
+        path = str(tmp_path / "cache.db")
+        TieredCache("test", max_entries=1, disk_path=path, ttl_seconds=60).set("a", "text")
+        now[0] += 61
+        assert TieredCache("test", max_entries=1, disk_path=path, ttl_seconds=60).get("a") is None
+
+
+class TestAnalysisCacheKey:
+    def test_prompt_edit_invalidates_only_that_company(self, monkeypatch):
+        ntt_key = make_analysis_cache_key("text", CompanyType.NTT)
+        softbank_key = make_analysis_cache_key("text", CompanyType.SOFTBANK)
+        monkeypatch.setitem(PROMPT_MAP, CompanyType.NTT, PROMPT_MAP[CompanyType.NTT] + "\n追記")
+        assert make_analysis_cache_key("text", CompanyType.NTT) != ntt_key
+        assert make_analysis_cache_key("text", CompanyType.SOFTBANK) == softbank_key
+
+    def test_text_changes_key(self):
+        assert make_analysis_cache_key("a", CompanyType.NTT) != make_analysis_cache_key("b", CompanyType.NTT)
@@ -0,0 +1,161 @@
+import json
+
+import pytest
+from openpyxl import load_workbook
+
+from src import cli
+from src.config import settings
+from src.cli import CHECKPOINT_NAME, GROUP_BY_DIR, Checkpoint, iter_units
+from src.secrets.manager import secret_manager
+from src.workflow import pipeline as pipeline_module
+from src.workflow.pipeline import PipelineResult
+
+
+@pytest.fixture
+def bills(tmp_path):
+    root = tmp_path / "bills"
+    (root / "2025-08").mkdir(parents=True)
+    (root / "2025-09").mkdir()
+    (root / "2025-08" / "a.pdf").write_bytes(b"a")
+    (root / "2025-08" / "b.png").write_bytes(b"b")
+    (root / "2025-09" / "c.pdf").write_bytes(b"c")
+    (root / "2025-09" / "notes.txt").write_text("skip")
+    (root / "top.pdf").write_bytes(b"t")
+    return root
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    calls: list[list[str]] = []
+
+    async def fake_process_bill(files, google, openai, drive, **kwargs):
+        assert kwargs["collect_rows"] is True
+        calls.append([name for name, _ in files])
+        if any(content == b"bad" for _, content in files):
+            return PipelineResult(success=False, error_message="抽出できませんでした")
+        return PipelineResult(success=True, rows=[
+            "| 番号 | サービス | 金額(円) | 備考 |",
+            "| --- | --- | --- | --- |",
+            f"| {files[0][0]} | 基本料 | 100 |  |",
+        ])
+
+    async def fake_credentials():
+        return "g", "o", ""
+
+    monkeypatch.setattr(cli, "process_bill", fake_process_bill)
+    monkeypatch.setattr(secret_manager, "get_pipeline_credentials", fake_credentials)
+    return calls
+
+
+class TestIterUnits:
+    def test_group_by_file_mirrors_tree(self, bills, tmp_path):
+        out = tmp_path / "out"
+        units = {u.key: u.output.relative_to(out).as_posix() for u in iter_units(bills, out, "file")}
+        assert units == {
+            "top.pdf": "top.xlsx",
+            "2025-08/a.pdf": "2025-08/a.xlsx",
+            "2025-08/b.png": "2025-08/b.xlsx",
+            "2025-09/c.pdf": "2025-09/c.xlsx",
+        }
+
+    def test_group_by_dir(self, bills, tmp_path):
+        out = tmp_path / "out"
+        units = {u.key: [p.name for p in u.paths] for u in iter_units(bills, out, GROUP_BY_DIR)}
+        assert units == {"bills": ["top.pdf"], "2025-08": ["a.pdf", "b.png"], "2025-09": ["c.pdf"]}
+
+    def test_output_inside_input_is_skipped(self, bills):
+        (bills / "out").mkdir()
+        (bills / "out" / "old.pdf").write_bytes(b"x")
+        keys = [u.key for u in iter_units(bills, bills / "out", "file")]
+        assert "out/old.pdf" not in keys
+
+
+class TestCli:
+    def test_writes_xlsx_and_resumes(self, bills, tmp_path, pipeline):
+        out = tmp_path / "out"
+        assert cli.main([str(bills), str(out), "--workers", "2"]) == 0
+        assert len(pipeline) == 4
+        ws = load_workbook(out / "2025-08" / "a.xlsx").active
+        assert list(ws.values)[1] == ("a.pdf", "基本料", 100, None)
+
+        # 2回目は処理済みをスキップし、変更されたファイルだけ再処理する
+        (bills / "2025-09" / "c.pdf").write_bytes(b"changed")
+        assert cli.main([str(bills), str(out)]) == 0
+        assert pipeline[4:] == [["c.pdf"]]
+
+    def test_failures_are_recorded_and_retried(self, bills, tmp_path, pipeline):
+        out = tmp_path / "out"
+        (bills / "top.pdf").write_bytes(b"bad")
+        assert cli.main([str(bills), str(out)]) == 1
+        assert not (out / "top.xlsx").exists()
+        records = [json.loads(line) for line in (out / CHECKPOINT_NAME).read_text().splitlines()]
+        failed = [r for r in records if r["status"] == "failed"]
+        assert [r["key"] for r in failed] == ["top.pdf"]
+
+        (bills / "top.pdf").write_bytes(b"good")
+        assert cli.main([str(bills), str(out)]) == 0
+        assert pipeline[-1] == ["top.pdf"]
+        assert (out / "top.xlsx").exists()
+
+    def test_restart_ignores_checkpoint(self, bills, tmp_path, pipeline):
+        out = tmp_path / "out"
+        cli.main([str(bills), str(out)])
+        cli.main([str(bills), str(out), "--restart"])
+        assert len(pipeline) == 8
+
+
+class TestCliEndToEnd:
+    """OCR と明細分析の呼び出しだけを差し替え、パイプラインを通して書き出したXLSXを確認する。"""
+
+    @pytest.fixture
+    def stub_calls(self, monkeypatch):
+        rows = ["| 03-1234-5678 | 基本料 | 1800 |  |", "| 03-1234-5678 | 通話料 | 10 |  |"]
+
+        async def fake_ocr(files, api_key):
+            return "NTT東日本 ご利用料金明細"
+
+        async def fake_analyze(ocr_text, company, api_key, prompt):
+            return "\n".join(rows)
+
+        async def fake_analyze_stream(ocr_text, company, api_key, prompt):
+            for row in rows:
+                yield row
+
+        async def fake_credentials():
+            return "g", "o", ""
+
+        monkeypatch.setattr(settings, "ocr_cache_enabled", False)
+        monkeypatch.setattr(settings, "analysis_cache_enabled", False)
+        monkeypatch.setattr(settings, "image_preprocess_enabled", False)
+        monkeypatch.setattr(pipeline_module, "ocr_extract", fake_ocr)
+        monkeypatch.setattr(pipeline_module, "analyze_bill", fake_analyze)
+        monkeypatch.setattr(pipeline_module, "analyze_bill_stream", fake_analyze_stream)
+        monkeypatch.setattr(secret_manager, "get_pipeline_credentials", fake_credentials)
+
+    @pytest.mark.parametrize("streaming", [True, False])
+    def test_cells_match_analysis(self, bills, tmp_path, monkeypatch, stub_calls, streaming):
+        monkeypatch.setattr(settings, "analysis_streaming", streaming)
+        out = tmp_path / "out"
+        assert cli.main([str(bills), str(out)]) == 0
+        ws = load_workbook(out / "2025-09" / "c.xlsx").active
+        values = list(ws.values)
+        assert values[0] == ("番号", "サービス", "金額(円)", "備考")
+        assert values[1:3] == [
+            ("03-1234-5678", "基本料", 1800, None),
+            ("03-1234-5678", "通話料", 10, None),
+        ]
+        records = [json.loads(line) for line in (out / CHECKPOINT_NAME).read_text().splitlines()]
+        assert {r["status"] for r in records} == {"succeeded"}
+
+
+class TestCheckpoint:
+    def test_truncated_line_is_ignored(self, tmp_path):
+        path = tmp_path / "cp.jsonl"
+        path.write_text(
+            json.dumps({"key": "a.pdf", "status": "succeeded", "fingerprint": []}) + "\n"
+            + '{"key": "b.pdf", "sta',
+            encoding="utf-8",
+        )
+        checkpoint = Checkpoint(path)
+        checkpoint.load()
+        assert list(checkpoint.records) == ["a.pdf"]
@@ -0,0 +1,37 @@
+import asyncio
+
+from src.workflow.clients import ClientRegistry
+
+
+class TestClientRegistry:
+    def test_same_key_reuses_client(self):
+        registry = ClientRegistry()
+        assert registry.get_genai_client("key-a") is registry.get_genai_client("key-a")
+        assert registry.get_openai_client("key-a") is registry.get_openai_client("key-a")
+
+    def test_key_rotation_rebuilds_client(self):
+        registry = ClientRegistry()
+        old = registry.get_openai_client("key-a")
+        new = registry.get_openai_client("key-b")
+        assert new is not old
+        assert new.api_key == "key-b"
+        assert registry.get_openai_client("key-b") is new
+
+    def test_invalidate(self):
+        registry = ClientRegistry()
+        old_genai = registry.get_genai_client("key-a")
+        old_openai = registry.get_openai_client("key-a")
+        registry.invalidate()
+        assert registry.get_genai_client("key-a") is not old_genai
+        assert registry.get_openai_client("key-a") is not old_openai
+
+    def test_aclose(self):
+        registry = ClientRegistry()
+        client = registry.get_openai_client("key-a")
+        asyncio.run(registry.aclose())
+        assert client.is_closed()
+        assert registry.get_openai_client("key-a") is not client
+
+    def test_openai_sdk_retries_disabled(self):
+        # 再試行は ratelimit.call_with_retry が行う
+        assert ClientRegistry().get_openai_client("key-a").max_retries == 0
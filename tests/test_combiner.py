@@ -4,6 +4,7 @@ from src.combiner.markdown_combiner import (
     HEADER,
     SEPARATOR,
     EmptyResultError,
+    IncrementalCombiner,
     combine_markdown_rows,
 )
 from src.workflow.router import CompanyType
@@ -48,3 +49,38 @@ class TestCombineMarkdownRows:
     def test_all_whitespace_raises(self):
         with pytest.raises(EmptyResultError):
             combine_markdown_rows({CompanyType.NTT: "  ", CompanyType.OTHER: ""})
+
+
+class TestIncrementalCombiner:
+    def test_rows_combined_in_dsl_order(self):
+        combiner = IncrementalCombiner()
+        combiner.add_row(CompanyType.SOFTBANK, "| 090-1111-2222 | 通話料 | 500 |  |")
+        combiner.add_row(CompanyType.NTT, "| 03-1234-5678 | 基本料 | 1800 |  |")
+        combiner.add_row(CompanyType.SOFTBANK, "| 090-1111-2222 | 基本料 | 980 |  |")
+        assert combiner.row_count == 3
+        lines = combiner.markdown().strip().splitlines()
+        assert lines[:2] == [HEADER, SEPARATOR]
+        assert "03-1234-5678" in lines[2]
+        assert "500" in lines[3]
+        assert "980" in lines[4]
+
+    def test_same_output_as_combine_markdown_rows(self):
+        combiner = IncrementalCombiner()
+        combiner.add_row(CompanyType.NTT, "| a | b | 1 |  |")
+        combiner.add_row(CompanyType.NTT, "| c | d | 2 |  |")
+        expected = combine_markdown_rows({CompanyType.NTT: "| a | b | 1 |  |\n| c | d | 2 |  |"})
+        assert combiner.markdown() == expected
+
+    def test_empty_raises(self):
+        with pytest.raises(EmptyResultError):
+            IncrementalCombiner().markdown()
+
+    def test_lines_match_markdown(self):
+        combiner = IncrementalCombiner()
+        combiner.add_row(CompanyType.SOFTBANK, "| x | y | 3 |  |")
+        combiner.add_row(CompanyType.NTT, "| a | b | 1 |  |")
+        assert list(combiner.lines()) == combiner.markdown().strip().splitlines()
+
+    def test_lines_empty_raises(self):
+        with pytest.raises(EmptyResultError):
+            IncrementalCombiner().lines()
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from src.config import settings
+from src.drive import uploader
+from src.drive.uploader import upload_to_drive, upload_to_drive_async
+
+
+class _Status:
+    def __init__(self, progress: float):
+        self._progress = progress
+
+    def progress(self) -> float:
+        return self._progress
+
+
+class _FakeRequest:
+    def __init__(self, media):
+        self.media = media
+        self.chunks = 0
+
+    def execute(self):
+        return {"id": "file-1", "webViewLink": "https://drive/file-1"}
+
+    def next_chunk(self):
+        self.chunks += 1
+        if self.chunks < 3:
+            return _Status(self.chunks / 3), None
+        return None, self.execute()
+
+
+class _FakeFiles:
+    def __init__(self, service):
+        self.service = service
+
+    def create(self, body, media_body, fields):
+        self.service.request = _FakeRequest(media_body)
+        return self.service.request
+
+
+class _FakeService:
+    request = None
+
+    def files(self):
+        return _FakeFiles(self)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    fake = _FakeService()
+    monkeypatch.setattr(uploader, "_get_drive_service", lambda: fake)
+    return fake
+
+
+class TestUploadToDrive:
+    def test_small_file_single_request(self, service, monkeypatch):
+        monkeypatch.setattr(settings, "drive_resumable_threshold_bytes", 100)
+        assert upload_to_drive(b"x" * 10, "folder", "a.xlsx") == "https://drive/file-1"
+        assert not service.request.media.resumable()
+        assert service.request.chunks == 0
+
+    def test_large_file_resumable_chunks(self, service, monkeypatch):
+        monkeypatch.setattr(settings, "drive_resumable_threshold_bytes", 100)
+        assert upload_to_drive(b"x" * 1000, "folder", "a.xlsx") == "https://drive/file-1"
+        assert service.request.media.resumable()
+        assert service.request.chunks == 3
+
+    def test_async_runs_in_thread(self, service):
+        assert asyncio.run(upload_to_drive_async(b"x", "folder", "a.xlsx")) == "https://drive/file-1"
+
+
+class TestCredentialsCache:
+    def test_default_called_once(self, monkeypatch):
+        calls = []
+
+        def fake_default(scopes):
+            calls.append(scopes)
+            return object(), "project"
+
+        monkeypatch.setattr(uploader, "_credentials", None)
+        monkeypatch.setattr(uploader.google.auth, "default", fake_default)
+        first = uploader._get_credentials()
+        assert uploader._get_credentials() is first
+        assert len(calls) == 1
@@ -0,0 +1,403 @@
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from benchmarks.pipeline import (
+    TARGET_PROCESS_BILL,
+    BackendProfile,
+    BenchConfig,
+    StepRecorder,
+    run_benchmark,
+)
+from src.config import settings
+from src.jobs import queue as queue_module
+from src.jobs import routes as routes_module
+from src.jobs.events import JobEventBroker
+from src.jobs.queue import JobQueue, JobQueueFullError
+from src.jobs.store import (
+    JOB_STATUS_FAILED,
+    JOB_STATUS_QUEUED,
+    JOB_STATUS_RUNNING,
+    JOB_STATUS_SUCCEEDED,
+    InMemoryJobStore,
+    Job,
+    SQLiteJobStore,
+)
+from src.workflow.pipeline import PipelineEvent, PipelineResult
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / "jobs.db"))
+
+
+class TestJobStore:
+    def test_create_and_get(self, store):
+        store.create(Job(id="a"))
+        job = store.get("a")
+        assert job.status == JOB_STATUS_QUEUED
+        assert job.result is None
+
+    def test_update(self, store):
+        job = Job(id="a")
+        store.create(job)
+        job.status = JOB_STATUS_SUCCEEDED
+        job.step = 6
+        job.step_name = "upload"
+        job.result = {"success": True, "drive_url": "https://drive"}
+        store.update(job)
+        saved = store.get("a")
+        assert saved.finished
+        assert saved.step_name == "upload"
+        assert saved.result == {"success": True, "drive_url": "https://drive"}
+
+    def test_get_unknown(self, store):
+        assert store.get("missing") is None
+
+    def test_fail_unfinished(self, store):
+        store.create(Job(id="a"))
+        done = Job(id="b", status=JOB_STATUS_SUCCEEDED)
+        store.create(done)
+        assert store.fail_unfinished({"success": False}) == 1
+        assert store.get("a").status == JOB_STATUS_FAILED
+        assert store.get("b").status == JOB_STATUS_SUCCEEDED
+
+    def test_fail_unfinished_before_server_start(self, store):
+        store.create(Job(id="old", created_at=100.0))
+        store.create(Job(id="live", created_at=200.0))
+        assert store.fail_unfinished({"success": False}, created_before=150.0) == 1
+        assert store.get("old").status == JOB_STATUS_FAILED
+        assert store.get("live").status == JOB_STATUS_QUEUED
+
+
+    def test_fail_unfinished_by_owner(self, store):
+        store.create(Job(id="dead", owner_pid=111))
+        store.create(Job(id="alive", owner_pid=222))
+        store.create(Job(id="done", owner_pid=111, status=JOB_STATUS_SUCCEEDED))
+        assert store.unfinished_owners() == {111, 222}
+        assert store.fail_unfinished({"success": False}, owners=[111]) == 1
+        assert store.get("dead").status == JOB_STATUS_FAILED
+        assert store.get("alive").status == JOB_STATUS_QUEUED
+        assert store.get("alive").owner_pid == 222
+        assert store.fail_unfinished({"success": False}, owners=[]) == 0
+
+
+class TestSQLiteJobStoreMigration:
+    def test_adds_owner_column_to_existing_table(self, tmp_path):
+        path = str(tmp_path / "jobs.db")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, step INTEGER NOT NULL,"
+            " step_name TEXT NOT NULL, result TEXT, created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO jobs VALUES ('old', 'running', 1, 'ocr', NULL, 1.0, 1.0)")
+        conn.commit()
+        conn.close()
+
+        store = SQLiteJobStore(path)
+        assert store.get("old").owner_pid == 0
+        store.create(Job(id="new", owner_pid=123))
+        assert store.get("new").owner_pid == 123
+
+
+class TestJobQueue:
+    def test_start_fails_jobs_of_dead_worker(self, monkeypatch):
+        # 異常終了したワーカーの代わりに起動したワーカーを想定し、起動時刻より後のジョブを置く
+        monkeypatch.setattr(settings, "server_started_at", 1.0)
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        store = InMemoryJobStore()
+        store.create(Job(id="orphan", status=JOB_STATUS_RUNNING, owner_pid=dead.pid))
+        store.create(Job(id="sibling", status=JOB_STATUS_RUNNING, owner_pid=os.getppid()))
+        store.create(Job(id="legacy", status=JOB_STATUS_RUNNING, owner_pid=0))
+        queue = JobQueue(store, workers=1, max_size=10)
+
+        async def run():
+            await queue.start()
+            await queue.stop()
+
+        asyncio.run(run())
+        assert store.get("orphan").status == JOB_STATUS_FAILED
+        assert store.get("orphan").result["success"] is False
+        assert store.get("sibling").status == JOB_STATUS_RUNNING
+        assert store.get("legacy").status == JOB_STATUS_RUNNING
+
+    def test_job_runs_and_records_steps(self, monkeypatch):
+        queue = JobQueue(InMemoryJobStore(), workers=1, max_size=10)
+        recorded: list[tuple[int, str]] = []
+
+        async def fake_process_bill(files, google, openai, drive, on_progress=None):
+            for step in range(1, 7):
+                on_progress(PipelineEvent(step=step, status="started"))
+                job = queue.store.get(submitted[0].id)
+                recorded.append((job.step, job.step_name))
+            return PipelineResult(success=True, drive_url="https://drive", filename="a.xlsx")
+
+        monkeypatch.setattr(queue_module, "process_bill", fake_process_bill)
+        submitted: list[Job] = []
+
+        async def run():
+            await queue.start()
+            submitted.append(queue.submit([("a.pdf", b"1")], "g", "o", "folder"))
+            while not queue.store.get(submitted[0].id).finished:
+                await asyncio.sleep(0.01)
+            await queue.stop()
+
+        asyncio.run(run())
+        saved = queue.store.get(submitted[0].id)
+        assert [step for step, _ in recorded] == [1, 2, 3, 4, 5, 6]
+        assert recorded[0][1] == "ocr"
+        assert saved.status == JOB_STATUS_SUCCEEDED
+        assert saved.result["drive_url"] == "https://drive"
+
+    def test_pipeline_exception_marks_failed(self, monkeypatch):
+        async def fake_process_bill(*args, **kwargs):
+            raise RuntimeError("boom")
+
+        monkeypatch.setattr(queue_module, "process_bill", fake_process_bill)
+        queue = JobQueue(InMemoryJobStore(), workers=1, max_size=10)
+
+        async def run():
+            await queue.start()
+            job = queue.submit([("a.pdf", b"1")], "g", "o", "folder")
+            while not queue.store.get(job.id).finished:
+                await asyncio.sleep(0.01)
+            await queue.stop()
+            return job
+
+        job = asyncio.run(run())
+        saved = queue.store.get(job.id)
+        assert saved.status == JOB_STATUS_FAILED
+        assert saved.result["success"] is False
+
+    def test_queue_full(self):
+        queue = JobQueue(InMemoryJobStore(), workers=1, max_size=1)
+
+        async def run():
+            await queue.start()
+            await queue.stop()  # ワーカーを止めてキューに溜まったままにする
+            queue.submit([("a.pdf", b"1")], "g", "o", "folder")
+            with pytest.raises(JobQueueFullError):
+                queue.submit([("b.pdf", b"2")], "g", "o", "folder")
+
+        asyncio.run(run())
+
+
+class TestJobEventBroker:
+    def test_late_subscriber_gets_history_then_live_events(self):
+        broker = JobEventBroker()
+
+        async def run():
+            broker.open("a")
+            broker.publish("a", {"n": 1})
+            received = []
+
+            async def consume():
+                async for event in broker.subscribe("a"):
+                    received.append(event)
+
+            task = asyncio.create_task(consume())
+            await asyncio.sleep(0)
+            broker.publish("a", {"n": 2})
+            broker.close("a")
+            await task
+            return received
+
+        assert asyncio.run(run()) == [{"n": 1}, {"n": 2}]
+
+    def test_subscribe_after_close_replays_history(self):
+        broker = JobEventBroker()
+
+        async def run():
+            broker.open("a")
+            broker.publish("a", {"n": 1})
+            broker.close("a")
+            broker.publish("a", {"n": 2})  # 終了後のイベントは無視される
+            return [event async for event in broker.subscribe("a")]
+
+        assert asyncio.run(run()) == [{"n": 1}]
+
+    def test_full_history_keeps_result_and_latest_progress(self, monkeypatch):
+        monkeypatch.setattr(settings, "job_event_history_max", 3)
+        broker = JobEventBroker()
+
+        async def run():
+            broker.open("a")
+            for step in range(10):
+                broker.publish("a", {"event": "progress", "step": step})
+            broker.publish("a", {"event": "result", "status": JOB_STATUS_SUCCEEDED})
+            broker.close("a")
+            return [event async for event in broker.subscribe("a")]
+
+        assert asyncio.run(run()) == [
+            {"event": "progress", "step": 7},
+            {"event": "progress", "step": 8},
+            {"event": "progress", "step": 9},
+            {"event": "result", "status": JOB_STATUS_SUCCEEDED},
+        ]
+
+    def test_heartbeat_when_idle(self, monkeypatch):
+        monkeypatch.setattr(settings, "sse_heartbeat_seconds", 0.01)
+        broker = JobEventBroker()
+
+        async def run():
+            broker.open("a")
+            stream = broker.subscribe("a")
+            return await stream.__anext__()
+
+        assert asyncio.run(run()) is None
+
+
+class TestJobStatusPolling:
+    def test_streams_status_changes_from_store(self, monkeypatch):
+        # 別のワーカーで実行中のジョブ（このプロセスにイベント履歴がない）
+        store = InMemoryJobStore()
+        monkeypatch.setattr(routes_module.job_queue, "store", store)
+        monkeypatch.setattr(settings, "job_status_poll_seconds", 0.01)
+        job = Job(id="a", status=JOB_STATUS_RUNNING, step=1, step_name="ocr")
+        store.create(job)
+
+        async def run():
+            chunks = []
+            async for chunk in routes_module._poll_job_status(store.get("a")):
+                chunks.append(chunk)
+                if len(chunks) == 1:
+                    store.update(Job(id="a", status=JOB_STATUS_RUNNING, step=3, step_name="analyze"))
+                elif len(chunks) == 2:
+                    store.update(Job(id="a", status=JOB_STATUS_SUCCEEDED, step=6, result={"success": True}))
+            return chunks
+
+        chunks = asyncio.run(run())
+        assert [c.split("\n", 1)[0] for c in chunks] == [
+            "event: status", "event: status", "event: status", "event: result",
+        ]
+        assert '"step_name": "analyze"' in chunks[1]
+        assert '"success": true' in chunks[3]
+
+
+def _parse_sse(chunk: str) -> tuple[str, dict]:
+    name, data = chunk.split("\n")[:2]
+    return name.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+async def _read_events(response, count=None) -> list[tuple[str, dict]]:
+    """SSE レスポンスを読む。count 件読んだら接続を切る（キープアライブは数えない）。"""
+    events = []
+    async for chunk in response.body_iterator:
+        if chunk.startswith(":"):
+            continue
+        events.append(_parse_sse(chunk))
+        if len(events) == count:
+            await response.body_iterator.aclose()
+            break
+    return events
+
+
+class TestJobEventsStream:
+    @pytest.fixture
+    def broker(self, monkeypatch):
+        store = InMemoryJobStore()
+        store.create(Job(id="a", status=JOB_STATUS_RUNNING))
+        broker = JobEventBroker()
+        monkeypatch.setattr(routes_module.job_queue, "store", store)
+        monkeypatch.setattr(routes_module, "job_events", broker)
+        return broker
+
+    def test_reconnect_replays_history(self, broker):
+        async def run():
+            broker.open("a")
+            broker.publish("a", {"event": "progress", "step": 1, "status": "started"})
+            broker.publish("a", {"event": "progress", "step": 1, "status": "completed"})
+            first = await _read_events(await routes_module.stream_job_events("a"), count=1)
+
+            # 切断中に進んだ分も、再接続時に最初から再送される
+            broker.publish("a", {"event": "progress", "step": 2, "status": "started"})
+            second = await _read_events(await routes_module.stream_job_events("a"), count=3)
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert first == [("progress", {"event": "progress", "step": 1, "status": "started"})]
+        assert [(e["step"], e["status"]) for _, e in second] == [
+            (1, "started"), (1, "completed"), (2, "started"),
+        ]
+
+    def test_result_event_ends_stream(self, broker):
+        async def run():
+            broker.open("a")
+            response = await routes_module.stream_job_events("a")
+            reader = asyncio.create_task(_read_events(response))
+            await asyncio.sleep(0.01)
+            broker.publish("a", {"event": "progress", "step": 6, "status": "completed"})
+            broker.publish(
+                "a", {"event": "result", "status": JOB_STATUS_SUCCEEDED, "result": {"success": True}}
+            )
+            broker.close("a")
+            return await asyncio.wait_for(reader, timeout=1)
+
+        events = asyncio.run(run())
+        assert [name for name, _ in events] == ["progress", "result"]
+        assert events[-1][1]["result"] == {"success": True}
+
+    def test_unknown_job_falls_back_to_result_polling(self, broker):
+        # イベントを取れない場合（404 で EventSource が閉じる）、画面は /jobs/{id}/result をポーリングする
+        app = FastAPI()
+        app.include_router(routes_module.jobs_router)
+        client = TestClient(app)
+        response = client.get("/jobs/missing/events")
+        assert response.status_code == 404
+        assert response.headers["content-type"].startswith("application/json")
+
+        store = routes_module.job_queue.store
+        store.update(Job(id="a", status=JOB_STATUS_RUNNING, step=3, step_name="analysis"))
+        pending = client.get("/jobs/a/result")
+        assert pending.status_code == 202
+        assert pending.json()["step"] == 3
+
+        result = {"success": True, "drive_url": "https://drive", "filename": "a.xlsx"}
+        store.update(Job(id="a", status=JOB_STATUS_SUCCEEDED, step=6, result=result))
+        done = client.get("/jobs/a/result")
+        assert done.status_code == 200
+        assert done.json() == result
+
+
+class TestProgressEvents:
+    def test_progress_events_describe_each_stage(self, monkeypatch):
+        # アップロード画面の進捗表示に使うイベント
+        events = []
+        original = StepRecorder.callback
+
+        def recording_callback(self):
+            callback = original(self)
+
+            def on_progress(event):
+                events.append(event)
+                callback(event)
+
+            return on_progress
+
+        monkeypatch.setattr(StepRecorder, "callback", recording_callback)
+        config = BenchConfig(
+            target=TARGET_PROCESS_BILL,
+            requests=1,
+            concurrency=1,
+            ocr=BackendProfile(),
+            analysis=BackendProfile(),
+            drive=BackendProfile(),
+            rows=3,
+        )
+        asyncio.run(run_benchmark(config))
+
+        completed = {e.name: e.detail for e in events if e.status == "completed"}
+        assert completed["route"]["companies"]
+        assert completed["xlsx"]["row_count"] == 3
+        assert completed["upload"]["drive_url"]
@@ -0,0 +1,85 @@
+from src.combiner.markdown_combiner import HEADER, SEPARATOR
+from src.export.markdown_table import (
+    CONTRACT_COLUMNS,
+    ISSUE_EXTRA_COLUMNS,
+    ISSUE_MISSING_COLUMNS,
+    ISSUE_NOT_TABLE_ROW,
+    MarkdownTableParser,
+    ParseReport,
+    parse_markdown_table,
+)
+
+
+def _table(*rows: str) -> str:
+    return "\n".join([HEADER, SEPARATOR, *rows])
+
+
+class TestParseMarkdownTable:
+    def test_contract_columns_from_header(self):
+        assert CONTRACT_COLUMNS == 4
+
+    def test_basic(self):
+        rows, report = parse_markdown_table(_table("| 03-1234-5678 | 基本料 | 1800 | 7月分 |"))
+        assert rows == [
+            ["番号", "サービス", "金額(円)", "備考"],
+            ["03-1234-5678", "基本料", "1800", "7月分"],
+        ]
+        assert report.ok
+        assert report.rows == 2
+
+    def test_escaped_pipe_in_cell(self):
+        rows, _ = parse_markdown_table(_table(r"| 03-1234-5678 | A\|B割引 | -100 |  |"))
+        assert rows[1] == ["03-1234-5678", "A|B割引", "-100", ""]
+
+    def test_fullwidth_pipes_and_spaces(self):
+        rows, report = parse_markdown_table(_table("｜03-1234-5678｜基本料｜１８００｜　備考　｜"))
+        assert rows[1] == ["03-1234-5678", "基本料", "１８００", "備考"]
+        assert report.ok
+
+    def test_fullwidth_separator_is_skipped(self):
+        rows, report = parse_markdown_table(HEADER + "\n| ーー | ーー | ーー | ーー |")
+        assert len(rows) == 1
+        assert report.ok
+
+    def test_dash_only_cell_is_not_separator(self):
+        rows, _ = parse_markdown_table(_table("| - | 基本料 | 100 | - |"))
+        assert rows[1] == ["-", "基本料", "100", "-"]
+
+    def test_missing_trailing_pipe(self):
+        rows, report = parse_markdown_table(_table("| 03 | 基本料 | 100 | 備考"))
+        assert rows[1] == ["03", "基本料", "100", "備考"]
+        assert report.ok
+
+    def test_short_row_is_padded_and_reported(self):
+        rows, report = parse_markdown_table(_table("| 03 | 基本料 |"))
+        assert rows[1] == ["03", "基本料", "", ""]
+        assert [i.reason for i in report.malformed] == [ISSUE_MISSING_COLUMNS]
+        assert report.malformed[0].line_no == 3
+
+    def test_long_row_is_dropped_and_reported(self):
+        rows, report = parse_markdown_table(_table("| 03 | 基本料 | 100 | 備考 | 余分 |"))
+        assert len(rows) == 1
+        assert [i.reason for i in report.dropped] == [ISSUE_EXTRA_COLUMNS]
+
+    def test_trailing_empty_cells_are_trimmed(self):
+        rows, report = parse_markdown_table(_table("| 03 | 基本料 | 100 | 備考 |  |"))
+        assert rows[1] == ["03", "基本料", "100", "備考"]
+        assert report.ok
+
+    def test_non_table_lines_are_reported(self):
+        rows, report = parse_markdown_table("以下が明細です\n" + _table("| 03 | a | 1 | b |"))
+        assert len(rows) == 2
+        assert report.dropped[0].reason == ISSUE_NOT_TABLE_ROW
+        assert report.dropped[0].line_no == 1
+
+    def test_streaming_report(self):
+        report = ParseReport()
+        rows = MarkdownTableParser().iter_rows(iter(_table("| 1 | 2 |").splitlines()), report)
+        assert next(rows) == ["番号", "サービス", "金額(円)", "備考"]
+        assert list(rows) == [["1", "2", "", ""]]
+        assert report.summary() == "rows=2, dropped=0, malformed=1"
+
+    def test_columns_none_keeps_row_width(self):
+        rows, report = parse_markdown_table("| a | b |\n| 1 | 2 | 3 |", columns=None)
+        assert rows == [["a", "b"], ["1", "2", "3"]]
+        assert report.ok
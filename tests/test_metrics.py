@@ -0,0 +1,115 @@
+import asyncio
+import json
+import subprocess
+import sys
+
+from benchmarks.pipeline import BackendProfile, BenchConfig, run_benchmark
+from src.cache.store import TieredCache
+from src.metrics.pipeline_metrics import (
+    StageRecorder,
+    cache_families,
+    llm_tokens,
+    pipeline_failures,
+    record_tokens,
+    stage_duration,
+)
+from src.metrics.multiprocess import read_snapshots, render_all, write_snapshot
+from src.metrics.registry import MetricsRegistry
+from src.workflow.pipeline import PipelineEvent
+
+
+class TestMetricsRegistry:
+    def test_counter_render(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("test_total", "説明", ("kind",))
+        counter.inc(kind="a")
+        counter.inc(2, kind='b"q')
+        text = registry.render()
+        assert "# TYPE test_total counter" in text
+        assert 'test_total{kind="a"} 1' in text
+        assert 'test_total{kind="b\\"q"} 2' in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "説明", (0.1, 1))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value)
+        lines = registry.render().splitlines()
+        assert 'test_seconds_bucket{le="0.1"} 1' in lines
+        assert 'test_seconds_bucket{le="1"} 3' in lines
+        assert 'test_seconds_bucket{le="+Inf"} 4' in lines
+        assert "test_seconds_sum 4.05" in lines
+        assert "test_seconds_count 4" in lines
+
+    def test_collector(self):
+        registry = MetricsRegistry()
+        cache = TieredCache("unit", max_entries=2)
+        cache.set("a", "1")
+        cache.get("a")
+        cache.get("b")
+        registry.add_collector(lambda: cache_families([cache]))
+        text = registry.render()
+        assert 'meisaisyo_cache_requests_total{cache="unit",result="memory_hit"} 1' in text
+        assert 'meisaisyo_cache_requests_total{cache="unit",result="miss"} 1' in text
+        assert 'meisaisyo_cache_memory_entries{cache="unit"} 1' in text
+
+
+class TestMultiprocess:
+    def _registry(self, in_flight: int) -> MetricsRegistry:
+        registry = MetricsRegistry()
+        registry.counter("test_total", "説明", ("kind",)).inc(kind="a")
+        registry.histogram("test_seconds", "説明", (1,)).observe(0.5)
+        registry.add_collector(lambda: [("test_in_flight", "gauge", "説明", [({"p": "x"}, in_flight)])])
+        return registry
+
+    def test_values_of_all_workers_are_summed(self, tmp_path):
+        other = self._registry(in_flight=2)
+        (tmp_path / f"{_dead_pid()}.json").write_text(json.dumps(other.snapshot()), encoding="utf-8")
+        live = self._registry(in_flight=3)
+        (tmp_path / "1.json").write_text(json.dumps(live.snapshot()), encoding="utf-8")  # init は常に生きている
+        lines = render_all(self._registry(in_flight=1), str(tmp_path)).splitlines()
+        assert 'test_total{kind="a"} 3' in lines
+        assert 'test_seconds_bucket{le="1"} 3' in lines
+        assert "test_seconds_count 3" in lines
+        # 終了したワーカーのゲージは合算しない
+        assert 'test_in_flight{p="x"} 4' in lines
+
+    def test_unreadable_file_is_skipped(self, tmp_path):
+        write_snapshot(self._registry(in_flight=1), str(tmp_path))
+        (tmp_path / "2.json").write_text("{broken", encoding="utf-8")
+        assert len(read_snapshots(str(tmp_path))) == 1
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+class TestStageRecorder:
+    def test_records_duration_and_failed_stage(self):
+        before = stage_duration.count(stage="route")
+        failures = pipeline_failures.value(stage="analysis", category="network")
+        recorder = StageRecorder()
+        recorder(PipelineEvent(step=2, status="started"))
+        recorder(PipelineEvent(step=2, status="completed"))
+        recorder(PipelineEvent(step=3, status="started"))
+        recorder.failed("network")
+        assert stage_duration.count(stage="route") == before + 1
+        assert pipeline_failures.value(stage="analysis", category="network") == failures + 1
+
+    def test_record_tokens_ignores_missing_usage(self):
+        before = llm_tokens.value(provider="openai", model="m", kind="prompt")
+        record_tokens("openai", "m", None, None)
+        record_tokens("openai", "m", 12, 3)
+        assert llm_tokens.value(provider="openai", model="m", kind="prompt") == before + 12
+        assert llm_tokens.value(provider="openai", model="m", kind="completion") == 3
+
+    def test_pipeline_run_records_every_stage(self):
+        before = {name: stage_duration.count(stage=name) for name in ("ocr", "xlsx", "upload")}
+        config = BenchConfig(
+            requests=2, ocr=BackendProfile(), analysis=BackendProfile(), drive=BackendProfile(), rows=2
+        )
+        asyncio.run(run_benchmark(config))
+        for name, count in before.items():
+            assert stage_duration.count(stage=name) == count + 2
@@ -0,0 +1,190 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors as genai_errors
+from google.genai import types
+from pypdf import PdfReader, PdfWriter
+
+from src.cache.store import TieredCache
+from src.config import settings
+from src.workflow import ocr, pipeline, ratelimit
+from src.workflow.ocr import FILE_BREAK, PAGE_BREAK, OCRError, ocr_extract, split_into_chunks
+from src.workflow.pipeline import process_bill
+
+
+def _make_pdf(page_count: int) -> bytes:
+    writer = PdfWriter()
+    for _ in range(page_count):
+        writer.add_blank_page(width=72, height=72)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+class TestSplitIntoChunks:
+    def test_image_is_single_chunk(self):
+        chunks = split_into_chunks([("a.jpg", b"jpeg-bytes")], pages_per_chunk=5)
+        assert len(chunks) == 1
+        assert chunks[0].mime_type == "image/jpeg"
+        assert chunks[0].content == b"jpeg-bytes"
+
+    def test_small_pdf_not_split(self):
+        pdf = _make_pdf(3)
+        chunks = split_into_chunks([("a.pdf", pdf)], pages_per_chunk=5)
+        assert len(chunks) == 1
+        assert chunks[0].content == pdf
+
+    def test_pdf_split_by_page_range(self):
+        chunks = split_into_chunks([("a.pdf", _make_pdf(7))], pages_per_chunk=3)
+        assert [c.label for c in chunks] == ["a.pdf p.1-3", "a.pdf p.4-6", "a.pdf p.7-7"]
+        assert [len(PdfReader(io.BytesIO(c.content)).pages) for c in chunks] == [3, 3, 1]
+
+    def test_broken_pdf_kept_whole(self):
+        chunks = split_into_chunks([("a.pdf", b"not a pdf")], pages_per_chunk=1)
+        assert len(chunks) == 1
+        assert chunks[0].content == b"not a pdf"
+
+    def test_upload_order_preserved(self):
+        files = [("b.png", b"1"), ("a.pdf", _make_pdf(2)), ("c.jpg", b"3")]
+        chunks = split_into_chunks(files, pages_per_chunk=1)
+        assert [c.label for c in chunks] == ["b.png", "a.pdf p.1-1", "a.pdf p.2-2", "c.jpg"]
+
+
+class TestSplitMode:
+    @pytest.fixture(autouse=True)
+    def split_mode(self, monkeypatch):
+        monkeypatch.setattr(settings, "ocr_split_mode", True)
+        monkeypatch.setattr(settings, "ocr_fanout", 4)
+
+    def test_reassembled_in_upload_order(self, monkeypatch):
+        delays = {b"1": 0.03, b"2": 0.0, b"3": 0.01}
+
+        async def fake_generate(client, parts, api_key):
+            data = parts[0].inline_data.data
+            await asyncio.sleep(delays[data])
+            return f"text-{data.decode()}"
+
+        monkeypatch.setattr(ocr, "_generate_text", fake_generate)
+        files = [("1.png", b"1"), ("2.png", b"2"), ("3.png", b"3")]
+        text = asyncio.run(ocr_extract(files, "dummy-key"))
+        assert text == FILE_BREAK.join(["text-1", "text-2", "text-3"])
+
+    def test_pages_of_same_file_use_page_break(self, monkeypatch):
+        async def fake_generate(client, parts, api_key):
+            return "page"
+
+        monkeypatch.setattr(ocr, "_generate_text", fake_generate)
+        monkeypatch.setattr(settings, "ocr_pdf_pages_per_chunk", 1)
+        files = [("a.pdf", _make_pdf(2)), ("b.png", b"1")]
+        text = asyncio.run(ocr_extract(files, "dummy-key"))
+        assert text == "page" + PAGE_BREAK + "page" + FILE_BREAK + "page"
+
+    def test_failed_chunk_fails_whole_ocr(self, monkeypatch):
+        async def fake_generate(client, parts, api_key):
+            if parts[0].inline_data.data == b"bad":
+                raise RuntimeError("too large")
+            return "ok"
+
+        monkeypatch.setattr(ocr, "_generate_text", fake_generate)
+        with pytest.raises(OCRError) as excinfo:
+            asyncio.run(ocr_extract([("a.png", b"good"), ("b.png", b"bad")], "dummy-key"))
+        assert excinfo.value.failed_chunks == ["b.png"]
+
+    def test_failed_chunk_is_not_cached(self, monkeypatch):
+        async def fake_generate(client, parts, api_key):
+            if parts[0].inline_data.data == b"bad":
+                raise RuntimeError("too large")
+            return "ok"
+
+        cache = TieredCache("ocr", max_entries=4)
+        monkeypatch.setattr(ocr, "_generate_text", fake_generate)
+        monkeypatch.setattr(pipeline, "ocr_cache", cache)
+        monkeypatch.setattr(settings, "ocr_cache_enabled", True)
+        files = [("a.png", b"good"), ("b.png", b"bad")]
+        result = asyncio.run(process_bill(files, "g", "o", "folder"))
+        assert not result.success
+        assert cache.stats()["memory_entries"] == 0
+
+    def test_pipeline_reports_missing_ranges(self, monkeypatch):
+        async def fake_generate(client, parts, api_key):
+            if len(PdfReader(io.BytesIO(parts[0].inline_data.data)).pages) == 1:
+                raise RuntimeError("too large")
+            return "page"
+
+        monkeypatch.setattr(ocr, "_generate_text", fake_generate)
+        monkeypatch.setattr(settings, "ocr_pdf_pages_per_chunk", 2)
+        monkeypatch.setattr(settings, "ocr_cache_enabled", False)
+        result = asyncio.run(process_bill([("a.pdf", _make_pdf(5))], "g", "o", "folder"))
+        assert not result.success
+        assert "a.pdf p.5-5" in result.error_message
+
+    def test_all_chunks_failed_raises(self, monkeypatch):
+        async def fake_generate(client, parts, api_key):
+            raise RuntimeError("too large")
+
+        monkeypatch.setattr(ocr, "_generate_text", fake_generate)
+        with pytest.raises(OCRError):
+            asyncio.run(ocr_extract([("a.png", b"x")], "dummy-key"))
+
+
+class TestConcurrencyLimit:
+    def test_concurrent_calls_are_limited(self, monkeypatch):
+        monkeypatch.setattr(settings, "ocr_max_concurrency", 2)
+        monkeypatch.setattr(ocr, "_ocr_semaphore", None)
+        active = 0
+        peak = 0
+
+        async def generate_content(**kwargs):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return SimpleNamespace(text="ok")
+
+        client = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+        monkeypatch.setattr(ocr.client_registry, "get_genai_client", lambda api_key: client)
+
+        async def run():
+            return await asyncio.gather(
+                *(ocr_extract([("a.png", b"x")], "dummy-key") for _ in range(5))
+            )
+
+        assert asyncio.run(run()) == ["ok"] * 5
+        assert peak == 2
+
+    def test_backoff_does_not_hold_ocr_slot(self, monkeypatch):
+        monkeypatch.setattr(settings, "ocr_max_concurrency", 1)
+        monkeypatch.setattr(ocr, "_ocr_semaphore", None)
+        monkeypatch.setattr(ratelimit, "backoff_delay", lambda attempt, throttle: 0.2)
+        ratelimit.governor_registry.clear()
+        finished: list[bytes] = []
+        calls: dict[bytes, int] = {}
+
+        async def generate_content(model, contents, config):
+            data = contents[0].parts[0].inline_data.data
+            calls[data] = calls.get(data, 0) + 1
+            if data == b"throttled" and calls[data] == 1:
+                raise genai_errors.ClientError(429, {"error": {"code": 429}})
+            return SimpleNamespace(text=data.decode(), usage_metadata=None)
+
+        client = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+
+        async def run(data: bytes):
+            part = types.Part.from_bytes(data=data, mime_type="image/png")
+            await ocr._generate_text(client, [part], "key")
+            finished.append(data)
+
+        async def main():
+            first = asyncio.create_task(run(b"throttled"))
+            await asyncio.sleep(0.05)  # 1件目が 429 を受けてバックオフ中
+            await run(b"healthy")
+            await first
+
+        try:
+            asyncio.run(main())
+        finally:
+            ratelimit.governor_registry.clear()
+        assert finished == [b"healthy", b"throttled"]
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from src.combiner.markdown_combiner import HEADER, SEPARATOR
+from src.config import settings
+from src.workflow import pipeline
+from src.workflow.pipeline import process_bill
+
+ROWS = [
+    "| 03-1234-5678 | 基本料 | 1800 |  |",
+    "| 03-1234-5678 | 通話料 | 10 |  |",
+]
+
+
+@pytest.fixture
+def stub_calls(monkeypatch):
+    """OCR と明細分析の外部呼び出しだけを差し替える。"""
+    monkeypatch.setattr(settings, "ocr_cache_enabled", False)
+    monkeypatch.setattr(settings, "analysis_cache_enabled", False)
+    monkeypatch.setattr(settings, "image_preprocess_enabled", False)
+
+    async def fake_ocr(files, api_key):
+        return "NTT東日本 ご利用料金明細"
+
+    async def fake_analyze(ocr_text, company, api_key, prompt):
+        return "\n".join(ROWS)
+
+    async def fake_analyze_stream(ocr_text, company, api_key, prompt):
+        for row in ROWS:
+            yield row
+
+    monkeypatch.setattr(pipeline, "ocr_extract", fake_ocr)
+    monkeypatch.setattr(pipeline, "analyze_bill", fake_analyze)
+    monkeypatch.setattr(pipeline, "analyze_bill_stream", fake_analyze_stream)
+
+
+class TestCollectRows:
+    @pytest.mark.parametrize("streaming", [True, False])
+    def test_rows_are_table_lines(self, monkeypatch, stub_calls, streaming):
+        monkeypatch.setattr(settings, "analysis_streaming", streaming)
+        result = asyncio.run(process_bill([("a.png", b"x")], "g", "o", "", collect_rows=True))
+        assert result.success
+        assert result.rows == [HEADER, SEPARATOR, *ROWS]
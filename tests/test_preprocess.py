@@ -0,0 +1,107 @@
+import asyncio
+import io
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from PIL import Image
+
+from src.config import settings
+from src.workflow import preprocess
+from src.workflow.preprocess import downscale_image, preprocess_images, shutdown_preprocess_pool
+
+
+def _make_jpeg(width: int, height: int, exif: bool = False, quality: int = 100) -> bytes:
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    buf = io.BytesIO()
+    kwargs = {}
+    if exif:
+        data = Image.Exif()
+        data[0x010F] = "Apple"  # Make
+        data[0x0112] = 6  # Orientation: 90度回転
+        kwargs["exif"] = data.tobytes()
+    image.save(buf, format="JPEG", quality=quality, **kwargs)
+    return buf.getvalue()
+
+
+class TestDownscaleImage:
+    def test_downscales_long_side(self):
+        result, had_exif = downscale_image(_make_jpeg(400, 200), "JPEG", max_side=100, quality=85)
+        assert not had_exif
+        with Image.open(io.BytesIO(result)) as image:
+            assert image.size == (100, 50)
+
+    def test_small_image_keeps_size(self):
+        result, _ = downscale_image(_make_jpeg(80, 40), "JPEG", max_side=100, quality=85)
+        with Image.open(io.BytesIO(result)) as image:
+            assert image.size == (80, 40)
+
+    def test_exif_removed_and_orientation_applied(self):
+        jpeg = _make_jpeg(80, 40, exif=True)
+        result, had_exif = downscale_image(jpeg, "JPEG", max_side=100, quality=85)
+        assert had_exif
+        with Image.open(io.BytesIO(result)) as image:
+            assert image.size == (40, 80)
+            assert not image.getexif()
+
+    def test_png_stays_png(self):
+        buf = io.BytesIO()
+        Image.new("RGBA", (300, 300), (255, 0, 0, 128)).save(buf, format="PNG")
+        result, _ = downscale_image(buf.getvalue(), "PNG", max_side=100, quality=85)
+        with Image.open(io.BytesIO(result)) as image:
+            assert image.format == "PNG"
+            assert image.size == (100, 100)
+
+
+class TestPreprocessImages:
+    @pytest.fixture(autouse=True)
+    def preprocess_settings(self, monkeypatch):
+        monkeypatch.setattr(settings, "image_preprocess_enabled", True)
+        monkeypatch.setattr(settings, "image_preprocess_min_bytes", 1)
+        monkeypatch.setattr(settings, "image_max_side", 100)
+        monkeypatch.setattr(settings, "image_preprocess_workers", 1)
+        yield
+        shutdown_preprocess_pool()
+
+    def test_large_image_replaced_others_untouched(self):
+        jpeg = _make_jpeg(800, 600)
+        files = [("a.pdf", b"%PDF-1.4"), ("b.jpg", jpeg), ("c.png", b"broken")]
+        result = asyncio.run(preprocess_images(files))
+        assert [name for name, _ in result] == ["a.pdf", "b.jpg", "c.png"]
+        assert result[0][1] == b"%PDF-1.4"
+        assert len(result[1][1]) < len(jpeg)
+        assert result[2][1] == b"broken"
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "image_preprocess_enabled", False)
+        files = [("b.jpg", _make_jpeg(800, 600))]
+        assert asyncio.run(preprocess_images(files)) is files
+
+    def test_exif_stripped_even_if_not_smaller(self, monkeypatch):
+        monkeypatch.setattr(settings, "image_max_side", 1000)
+        monkeypatch.setattr(settings, "image_jpeg_quality", 100)
+        jpeg = _make_jpeg(80, 40, exif=True, quality=5)
+        plain = _make_jpeg(80, 40, quality=5)
+        result = asyncio.run(preprocess_images([("a.jpg", jpeg), ("b.jpg", plain)]))
+        assert len(result[0][1]) >= len(jpeg)
+        with Image.open(io.BytesIO(result[0][1])) as image:
+            assert not image.getexif()
+        assert result[1][1] == plain
+
+    def test_exif_stripped_from_small_images(self, monkeypatch):
+        monkeypatch.setattr(settings, "image_preprocess_min_bytes", 10 * 1024 * 1024)
+        jpeg = _make_jpeg(80, 40, exif=True)
+        plain = _make_jpeg(80, 40)
+        result = asyncio.run(preprocess_images([("a.jpg", jpeg), ("b.jpg", plain)]))
+        with Image.open(io.BytesIO(result[0][1])) as image:
+            assert not image.getexif()
+        assert result[1][1] == plain
+
+    def test_broken_pool_is_rebuilt(self):
+        broken = preprocess._get_pool()
+        with pytest.raises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+        jpeg = _make_jpeg(800, 600)
+        result = asyncio.run(preprocess_images([("b.jpg", jpeg)]))
+        assert len(result[0][1]) < len(jpeg)
+        assert preprocess._pool is not broken
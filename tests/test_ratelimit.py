@@ -0,0 +1,189 @@
+import asyncio
+import random
+
+import httpx
+import openai
+import pytest
+from google.genai import errors as genai_errors
+
+from src.config import settings
+from src.workflow import ratelimit
+from src.workflow.ratelimit import (
+    REASON_RATE_LIMITED,
+    REASON_TRANSIENT,
+    RateGovernor,
+    Throttle,
+    backoff_delay,
+    call_with_retry,
+    classify_retry,
+)
+
+
+def _openai_429(headers=None, body=None):
+    request = httpx.Request("POST", "https://api.openai.invalid/v1/chat/completions")
+    response = httpx.Response(429, headers=headers or {}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=body)
+
+
+def _gemini_429(retry_delay=None):
+    details = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": retry_delay}]
+    return genai_errors.ClientError(
+        429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "details": details if retry_delay else []}}
+    )
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def fast_retry(monkeypatch):
+    monkeypatch.setattr(settings, "api_retry_base_delay", 0.001)
+    monkeypatch.setattr(settings, "api_retry_max_attempts", 4)
+    monkeypatch.setattr(settings, "api_retry_after_max", 1.0)
+
+
+class TestClassifyRetry:
+    def test_openai_retry_after_header(self):
+        assert classify_retry(_openai_429({"retry-after": "3"})) == Throttle(REASON_RATE_LIMITED, 3.0)
+        assert classify_retry(_openai_429({"retry-after-ms": "1500"})).retry_after == 1.5
+        assert classify_retry(_openai_429()).retry_after is None
+
+    def test_insufficient_quota_is_not_retried(self):
+        error = _openai_429(body={"code": "insufficient_quota", "type": "insufficient_quota"})
+        assert classify_retry(error) is None
+
+    def test_gemini_retry_info(self):
+        assert classify_retry(_gemini_429("12s")) == Throttle(REASON_RATE_LIMITED, 12.0)
+        assert classify_retry(_gemini_429()).retry_after is None
+
+    def test_gemini_client_errors_other_than_429_are_not_retried(self):
+        assert classify_retry(genai_errors.ClientError(400, {"error": {"code": 400}})) is None
+
+    def test_transient_errors(self):
+        assert classify_retry(genai_errors.ServerError(503, {"error": {"code": 503}})).reason == REASON_TRANSIENT
+        assert classify_retry(ConnectionError()).reason == REASON_TRANSIENT
+        assert classify_retry(ValueError()) is None
+
+
+class TestBackoff:
+    def test_jitter_is_capped(self, monkeypatch):
+        monkeypatch.setattr(settings, "api_retry_base_delay", 1.0)
+        monkeypatch.setattr(settings, "api_retry_max_delay", 5.0)
+        rng = random.Random(0)
+        delays = [backoff_delay(10, Throttle(REASON_TRANSIENT), rng) for _ in range(100)]
+        assert all(0 <= d <= 5.0 for d in delays)
+
+    def test_retry_after_is_a_floor(self):
+        assert backoff_delay(0, Throttle(REASON_RATE_LIMITED, 7.0)) >= 7.0
+
+
+class TestRateGovernor:
+    def test_token_bucket(self):
+        clock = _Clock()
+        governor = RateGovernor(60, burst=2, max_concurrency=10, clock=clock)
+        assert governor._try_acquire() == 0
+        assert governor._try_acquire() == 0
+        assert governor._try_acquire() == pytest.approx(1.0)
+        clock.now += 1.0
+        assert governor._try_acquire() == 0
+
+    def test_concurrency_limit_halves_and_recovers(self):
+        clock = _Clock()
+        governor = RateGovernor(0, burst=1, max_concurrency=8, clock=clock)
+        governor.on_throttled()
+        assert governor.limit == 4
+        # 同じ時点の 429 では重ねて減らさない
+        governor.on_throttled()
+        assert governor.limit == 4
+        clock.now += 2
+        governor.on_throttled()
+        assert governor.limit == 2
+        for _ in range(50):
+            governor.on_success()
+        assert governor.limit == 8
+
+    def test_retry_after_pauses_all_callers(self):
+        clock = _Clock()
+        governor = RateGovernor(0, burst=1, max_concurrency=8, clock=clock)
+        governor.on_throttled(retry_after=5)
+        assert governor._try_acquire() == pytest.approx(5)
+        clock.now += 5
+        assert governor._try_acquire() == 0
+
+    def test_waiters_resume_in_order(self):
+        governor = RateGovernor(0, burst=1, max_concurrency=1)
+        order = []
+
+        async def worker(name):
+            await governor.acquire()
+            order.append(name)
+            await asyncio.sleep(0.001)
+            governor.release()
+
+        async def run():
+            await asyncio.gather(*(worker(i) for i in range(5)))
+
+        asyncio.run(run())
+        assert order == [0, 1, 2, 3, 4]
+        assert governor.in_flight == 0
+
+
+class TestCallWithRetry:
+    def test_recovers_after_429(self, fast_retry):
+        governor = RateGovernor(0, burst=1, max_concurrency=4)
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise _openai_429({"retry-after": "0.01"})
+            return "ok"
+
+        assert asyncio.run(call_with_retry(governor, "openai", call)) == "ok"
+        assert len(attempts) == 3
+        assert governor.throttled == 2
+        assert governor.in_flight == 0
+
+    def test_gives_up_after_max_attempts(self, fast_retry):
+        governor = RateGovernor(0, burst=1, max_concurrency=4)
+
+        async def call():
+            raise ConnectionError("down")
+
+        with pytest.raises(ConnectionError):
+            asyncio.run(call_with_retry(governor, "gemini", call))
+        assert governor.in_flight == 0
+
+    def test_non_retryable_raises_immediately(self, fast_retry):
+        governor = RateGovernor(0, burst=1, max_concurrency=4)
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            asyncio.run(call_with_retry(governor, "openai", call))
+        assert len(attempts) == 1
+
+    def test_long_retry_after_is_not_waited(self, fast_retry):
+        governor = RateGovernor(0, burst=1, max_concurrency=4)
+
+        async def call():
+            raise _gemini_429("60s")
+
+        with pytest.raises(genai_errors.ClientError):
+            asyncio.run(call_with_retry(governor, "gemini", call))
+
+
+class TestGovernorRegistry:
+    def test_governor_per_provider_and_key(self):
+        registry = ratelimit.GovernorRegistry()
+        assert registry.get("openai", "a") is registry.get("openai", "a")
+        assert registry.get("openai", "a") is not registry.get("openai", "b")
+        assert registry.get("gemini", "a") is not registry.get("openai", "a")
@@ -1,4 +1,12 @@
-from src.workflow.router import CompanyType, detect_company
+from src.workflow.ocr import FILE_BREAK, PAGE_BREAK
+from src.workflow.router import (
+    STRATEGY_SCORE,
+    CompanyType,
+    RouterEngine,
+    detect_company,
+    match_vendor,
+    segment_by_company,
+)
 
 
 class TestDetectCompany:
@@ -59,3 +67,100 @@ class TestDetectCompany:
         # NTTとSoftBank両方含む場合、NTT（Case 1）が優先
         text = "NTT西日本 SoftBank回線"
         assert detect_company(text) == CompanyType.NTT
+
+
+    def test_fullwidth_text_is_normalized(self):
+        assert detect_company("ＮＴＴ東日本 御請求書") == CompanyType.NTT
+
+    def test_score_strategy_ignores_single_ad_mention(self):
+        text = "ソフトバンク 請求書\nSoftBank 基本料\n広告: OCN光のご案内"
+        assert detect_company(text) == CompanyType.NTT_DOCOMO_BIZ
+        assert detect_company(text, strategy=STRATEGY_SCORE) == CompanyType.SOFTBANK
+
+    def test_score_tie_falls_back_to_dsl_order(self):
+        assert detect_company("SoftBank OCN", strategy=STRATEGY_SCORE) == CompanyType.NTT_DOCOMO_BIZ
+
+
+class TestRouterEngine:
+    def test_scan_reports_counts_and_positions(self):
+        engine = RouterEngine([(CompanyType.SOFTBANK, ["SoftBank"]), (CompanyType.FORVAL, ["FORVAL"])])
+        result = engine.scan("SoftBank / FORVAL / SoftBank")
+        assert list(result.hits) == [CompanyType.SOFTBANK, CompanyType.FORVAL]
+        assert result.hits[CompanyType.SOFTBANK].count == 2
+        assert result.hits[CompanyType.SOFTBANK].positions == [(0, "SoftBank"), (20, "SoftBank")]
+        assert result.hits[CompanyType.FORVAL].positions == [(11, "FORVAL")]
+
+    def test_fullwidth_keywords_are_deduplicated(self):
+        engine = RouterEngine([(CompanyType.NTT_DOCOMO_BIZ, ["OCN", "ＯＣＮ"])])
+        assert engine.scan("ＯＣＮ OCN").hits[CompanyType.NTT_DOCOMO_BIZ].count == 2
+
+    def test_rebuild_replaces_rules(self):
+        engine = RouterEngine([(CompanyType.NTT, ["NTT東日本"])])
+        assert engine.detect("KDDI 請求書") == CompanyType.OTHER
+        engine.rebuild([(CompanyType.FORVAL, ["KDDI"])])
+        assert engine.detect("KDDI 請求書") == CompanyType.FORVAL
+        assert engine.detect("NTT東日本") == CompanyType.OTHER
+
+    def test_nested_keywords_are_counted(self):
+        engine = RouterEngine([
+            (CompanyType.NTT_DOCOMO_BIZ, ["NTTドコモビジネス"]),
+            (CompanyType.OTSUKA, ["ドコモ"]),
+            (CompanyType.NTT, ["NTT"]),
+        ])
+        result = engine.scan("NTTドコモビジネス")
+        assert list(result.hits) == [CompanyType.NTT_DOCOMO_BIZ, CompanyType.OTSUKA, CompanyType.NTT]
+        assert result.hits[CompanyType.NTT].positions == [(0, "NTT")]
+        assert result.hits[CompanyType.OTSUKA].positions == [(3, "ドコモ")]
+
+    def test_nested_keyword_counts_toward_score(self):
+        engine = RouterEngine([
+            (CompanyType.SOFTBANK, ["SoftBank光"]),
+            (CompanyType.FORVAL, ["SoftBank"]),
+        ])
+        result = engine.scan("SoftBank光 / SoftBank")
+        assert result.hits[CompanyType.SOFTBANK].count == 1
+        assert result.hits[CompanyType.FORVAL].count == 2
+        assert result.pick(STRATEGY_SCORE) == CompanyType.FORVAL
+
+    def test_vendor_of_first_matching_rule(self):
+        engine = RouterEngine(
+            [
+                (CompanyType.OTHER, ["KDDI"]),
+                (CompanyType.OTHER, ["楽天"]),
+                (CompanyType.FORVAL, ["FORVAL"]),
+            ],
+            vendors=["KDDI", "楽天", None],
+        )
+        assert match_vendor("楽天 / KDDI", CompanyType.OTHER, engine) == "KDDI"
+        assert match_vendor("楽天モバイル", CompanyType.OTHER, engine) == "楽天"
+        assert match_vendor("FORVAL", CompanyType.FORVAL, engine) is None
+        assert match_vendor("請求書", CompanyType.OTHER, engine) is None
+
+    def test_empty_rules(self):
+        assert RouterEngine([]).detect("NTT東日本") == CompanyType.OTHER
+
+
+class TestSegmentByCompany:
+    def test_unsegmented_text_is_single_company(self):
+        assert segment_by_company("NTT東日本 基本料") == {CompanyType.NTT: "NTT東日本 基本料"}
+
+    def test_files_routed_separately(self):
+        text = "NTT東日本 基本料" + FILE_BREAK + "大塚商会 保守料"
+        sections = segment_by_company(text)
+        assert sections == {
+            CompanyType.NTT: "NTT東日本 基本料",
+            CompanyType.OTSUKA: "大塚商会 保守料",
+        }
+
+    def test_continuation_page_inherits_company(self):
+        text = "ソフトバンク 1ページ目" + PAGE_BREAK + "通話料 500円" + FILE_BREAK + "不明な会社"
+        sections = segment_by_company(text)
+        assert sections[CompanyType.SOFTBANK] == "ソフトバンク 1ページ目\n\n通話料 500円"
+        # 別ファイルには引き継がない
+        assert sections[CompanyType.OTHER] == "不明な会社"
+
+    def test_same_company_pages_merged(self):
+        text = "NTT西日本 A" + FILE_BREAK + "SoftBank B" + FILE_BREAK + "NTT東日本 C"
+        sections = segment_by_company(text)
+        assert list(sections) == [CompanyType.NTT, CompanyType.SOFTBANK]
+        assert sections[CompanyType.NTT] == "NTT西日本 A\n\nNTT東日本 C"
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from src.config import settings
+from src.rules.registry import RuleLoadError, RuleRegistry, load_ruleset
+from src.workflow import pipeline
+from src.workflow.analyzer import PROMPT_MAP
+from src.workflow.router import CompanyType, detect_company, match_vendor
+
+
+def _write_json(path, data):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+
+def _touch_later(path):
+    # mtime の分解能に依存しないよう、更新日時を明示的に進める
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class TestLoadRuleset:
+    def test_json_rules_and_builtin_prompts(self, tmp_path):
+        path = tmp_path / "rules.json"
+        _write_json(path, {
+            "version": "v1",
+            "vendors": [
+                {"company": "ntt", "keywords": ["NTT東日本"]},
+                {"name": "KDDI", "company": "other", "keywords": ["KDDI"]},
+            ],
+        })
+        ruleset, watched = load_ruleset(str(path))
+        assert ruleset.version.startswith("v1@")
+        assert watched == [path]
+        assert detect_company("KDDI 請求書", engine=ruleset.engine) == CompanyType.OTHER
+        assert ruleset.engine.scan("KDDI").hits[CompanyType.OTHER].count == 1
+        assert ruleset.prompt_for(CompanyType.NTT) == PROMPT_MAP[CompanyType.NTT]
+
+    def test_yaml_with_prompt_file(self, tmp_path):
+        (tmp_path / "kddi.md").write_text("KDDI用プロンプト", encoding="utf-8")
+        path = tmp_path / "rules.yaml"
+        path.write_text(
+            "vendors:\n"
+            "  - name: KDDI\n"
+            "    company: other\n"
+            "    keywords: [KDDI, ａｕ]\n"
+            "    prompt_file: kddi.md\n",
+            encoding="utf-8",
+        )
+        ruleset, watched = load_ruleset(str(path))
+        assert ruleset.prompt_for(CompanyType.OTHER, "KDDI") == "KDDI用プロンプト"
+        assert tmp_path / "kddi.md" in watched
+        assert ruleset.version.startswith("rules@")
+
+    def test_directory_files_concatenated_in_name_order(self, tmp_path):
+        _write_json(tmp_path / "20_softbank.json", {"vendors": [{"company": "softbank", "keywords": ["OCN"]}]})
+        _write_json(tmp_path / "10_ntt.json", {"vendors": [{"company": "ntt", "keywords": ["OCN"]}]})
+        ruleset, _ = load_ruleset(str(tmp_path))
+        assert [c for c, _ in ruleset.rules] == [CompanyType.NTT, CompanyType.SOFTBANK]
+        assert ruleset.engine.detect("OCN") == CompanyType.NTT
+
+    def test_version_depends_on_content(self, tmp_path):
+        path = tmp_path / "rules.json"
+        _write_json(path, {"vendors": [{"company": "ntt", "keywords": ["A"]}]})
+        first = load_ruleset(str(path))[0].version
+        assert load_ruleset(str(path))[0].version == first
+        _write_json(path, {"vendors": [{"company": "ntt", "keywords": ["B"]}]})
+        assert load_ruleset(str(path))[0].version != first
+
+    @pytest.mark.parametrize(
+        "vendor",
+        [
+            {"company": "kddi", "keywords": ["KDDI"]},
+            {"company": "ntt"},
+            {"company": "ntt", "keywords": []},
+            {"company": "ntt", "keywords": [""]},
+            {"company": "ntt", "keywords": "NTT"},
+            {"company": "ntt", "keywords": ["NTT"], "keyword": ["typo"]},
+            {"company": "ntt", "keywords": ["NTT"], "prompt": "a", "prompt_file": "b.md"},
+            {"company": "ntt", "keywords": ["NTT"], "prompt_file": "missing.md"},
+            {"company": "ntt", "keywords": ["NTT"], "prompt": "名前のないベンダー"},
+            {"name": "", "company": "ntt", "keywords": ["NTT"]},
+        ],
+    )
+    def test_invalid_vendor_rejected(self, tmp_path, vendor):
+        path = tmp_path / "rules.json"
+        _write_json(path, {"vendors": [vendor]})
+        with pytest.raises(RuleLoadError):
+            load_ruleset(str(path))
+
+    def test_prompts_are_keyed_by_vendor(self, tmp_path):
+        path = tmp_path / "rules.json"
+        _write_json(path, {"vendors": [
+            {"name": "KDDI", "company": "other", "keywords": ["KDDI"], "prompt": "p1"},
+            {"name": "楽天", "company": "other", "keywords": ["楽天"], "prompt": "p2"},
+            {"name": "ケイ・オプティコム", "company": "other", "keywords": ["オプティコム"]},
+        ]})
+        ruleset, _ = load_ruleset(str(path))
+        engine = ruleset.engine
+        assert ruleset.prompt_for(CompanyType.OTHER, match_vendor("KDDI", CompanyType.OTHER, engine)) == "p1"
+        assert ruleset.prompt_for(CompanyType.OTHER, match_vendor("楽天", CompanyType.OTHER, engine)) == "p2"
+        # プロンプトのないベンダーやマッチしない文書は会社種別の既定プロンプト
+        default = PROMPT_MAP[CompanyType.OTHER]
+        assert ruleset.prompt_for(CompanyType.OTHER, match_vendor("オプティコム", CompanyType.OTHER, engine)) == default
+        assert ruleset.prompt_for(CompanyType.OTHER, match_vendor("請求書", CompanyType.OTHER, engine)) == default
+
+    def test_conflicting_prompts_for_same_vendor_rejected(self, tmp_path):
+        path = tmp_path / "rules.json"
+        _write_json(path, {"vendors": [
+            {"name": "KDDI", "company": "other", "keywords": ["A"], "prompt": "p1"},
+            {"name": "KDDI", "company": "other", "keywords": ["B"], "prompt": "p2"},
+        ]})
+        with pytest.raises(RuleLoadError):
+            load_ruleset(str(path))
+
+    def test_pipeline_uses_matched_vendor_prompt(self, tmp_path, monkeypatch):
+        path = tmp_path / "rules.json"
+        _write_json(path, {"vendors": [
+            {"name": "KDDI", "company": "other", "keywords": ["KDDI"], "prompt": "KDDI用"},
+            {"name": "楽天", "company": "other", "keywords": ["楽天"], "prompt": "楽天用"},
+        ]})
+        monkeypatch.setattr(pipeline, "rule_registry", RuleRegistry(str(path)))
+        monkeypatch.setattr(settings, "analysis_cache_enabled", False)
+        monkeypatch.setattr(settings, "analysis_streaming", False)
+        used: list[str] = []
+
+        async def fake_ocr(files, google_api_key):
+            return "楽天モバイル ご請求書"
+
+        async def fake_analyze(ocr_text, company, openai_api_key, prompt):
+            used.append(prompt)
+            return "| a |"
+
+        async def fake_upload(xlsx_file, folder_id, filename):
+            return "https://drive"
+
+        monkeypatch.setattr(pipeline, "_ocr_with_cache", fake_ocr)
+        monkeypatch.setattr(pipeline, "analyze_bill", fake_analyze)
+        monkeypatch.setattr(pipeline, "upload_to_drive_async", fake_upload)
+        result = asyncio.run(pipeline.process_bill([("a.png", b"x")], "g", "o", "folder"))
+        assert result.success
+        assert used == ["楽天用"]
+
+    def test_missing_source(self, tmp_path):
+        with pytest.raises(RuleLoadError):
+            load_ruleset(str(tmp_path / "none.json"))
+
+
+class TestRuleRegistry:
+    def test_builtin_rules_when_source_empty(self):
+        ruleset = RuleRegistry().current()
+        assert ruleset.version.startswith("builtin@")
+        assert ruleset.engine.detect("大塚商会") == CompanyType.OTSUKA
+
+    def test_hot_reload_bumps_generation(self, tmp_path):
+        path = tmp_path / "rules.json"
+        _write_json(path, {"vendors": [{"company": "ntt", "keywords": ["A"]}]})
+        registry = RuleRegistry(str(path), reload_interval=0)
+        first = registry.current()
+
+        _write_json(path, {"vendors": [{"company": "forval", "keywords": ["A"]}]})
+        _touch_later(path)
+        second = registry.current()
+        assert second.generation == first.generation + 1
+        assert second.version != first.version
+        assert second.engine.detect("A") == CompanyType.FORVAL
+        # 取得済みのスナップショットは変わらない
+        assert first.engine.detect("A") == CompanyType.NTT
+
+    def test_unchanged_source_is_not_reloaded(self, tmp_path):
+        path = tmp_path / "rules.json"
+        _write_json(path, {"vendors": [{"company": "ntt", "keywords": ["A"]}]})
+        registry = RuleRegistry(str(path), reload_interval=0)
+        assert registry.current() is registry.current()
+
+    def test_invalid_reload_keeps_previous_rules(self, tmp_path):
+        path = tmp_path / "rules.json"
+        _write_json(path, {"vendors": [{"company": "ntt", "keywords": ["A"]}]})
+        registry = RuleRegistry(str(path), reload_interval=0)
+        first = registry.current()
+
+        path.write_text("{broken", encoding="utf-8")
+        _touch_later(path)
+        assert registry.current() is first
+
+    def test_undecodable_reload_keeps_previous_rules(self, tmp_path):
+        path = tmp_path / "rules.json"
+        _write_json(path, {"vendors": [{"company": "ntt", "keywords": ["A"]}]})
+        registry = RuleRegistry(str(path), reload_interval=0)
+        first = registry.current()
+
+        path.write_bytes("{\"vendors\": []}".encode("utf-16"))
+        _touch_later(path)
+        assert registry.current() is first
+
+    def test_initial_load_failure_raises(self, tmp_path):
+        with pytest.raises(RuleLoadError):
+            RuleRegistry(str(tmp_path / "none.json")).current()
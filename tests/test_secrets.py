@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.config import settings
+from src.secrets.manager import SecretManagerClient
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Secret Manager の代わりに呼び出し回数と同時実行数を記録するクライアント。"""
+    monkeypatch.setattr(settings, "use_local_env", False)
+    client = SecretManagerClient()
+    client.calls = []
+    client.active = 0
+    client.max_active = 0
+    lock = threading.Lock()
+
+    def fake_access(secret_id):
+        with lock:
+            client.calls.append(secret_id)
+            client.active += 1
+            client.max_active = max(client.max_active, client.active)
+        time.sleep(0.05)
+        with lock:
+            client.active -= 1
+        return f"value-{secret_id}-{len(client.calls)}"
+
+    monkeypatch.setattr(client, "_access_secret", fake_access)
+    return client
+
+
+class TestSecretManagerClient:
+    def test_concurrent_misses_share_one_call(self, client):
+        async def run():
+            return await asyncio.gather(*(client.get_secret("a") for _ in range(10)))
+
+        values = asyncio.run(run())
+        assert client.calls == ["a"]
+        assert set(values) == {"value-a-1"}
+
+    def test_cached_value_is_served(self, client):
+        async def run():
+            await client.get_secret("a")
+            return await client.get_secret("a")
+
+        assert asyncio.run(run()) == "value-a-1"
+        assert client.calls == ["a"]
+
+    def test_refreshes_in_background_before_expiry(self, client, monkeypatch):
+        monkeypatch.setattr(settings, "secret_refresh_ahead_seconds", client._cache_ttl)
+
+        async def run():
+            await client.get_secret("a")
+            # 期限切れが近いエントリはキャッシュの値をすぐに返す
+            stale = await client.get_secret("a")
+            await asyncio.gather(*client._inflight.values())
+            return stale
+
+        assert asyncio.run(run()) == "value-a-1"
+        assert client.calls == ["a", "a"]
+        assert client._get_from_cache("a") == "value-a-2"
+
+    def test_pipeline_credentials_are_fetched_in_parallel(self, client):
+        google_key, openai_key, drive_folder_id = asyncio.run(client.get_pipeline_credentials())
+        assert google_key.startswith(f"value-{settings.secret_id_google_key}")
+        assert len(client.calls) == 3
+        assert client.max_active == 3
+
+    def test_failed_fetch_returns_none(self, client, monkeypatch):
+        def broken(secret_id):
+            raise RuntimeError("unavailable")
+
+        monkeypatch.setattr(client, "_access_secret", broken)
+        assert asyncio.run(client.get_secret("a")) is None
+        assert client._inflight == {}
+
+    def test_set_secret_wins_over_inflight_fetch(self, client, monkeypatch):
+        monkeypatch.setattr(client, "_add_secret_version", lambda secret_id, value: None)
+
+        async def run():
+            fetch = asyncio.create_task(client.get_secret("a"))
+            await asyncio.sleep(0.01)
+            assert await client.set_secret("a", "new")
+            await fetch
+            return await client.get_secret("a")
+
+        assert asyncio.run(run()) == "new"
@@ -0,0 +1,166 @@
+import asyncio
+import json
+
+from benchmarks.pipeline import TARGET_PROCESS_BILL, BackendProfile, BenchConfig, run_benchmark
+
+from src.tracing.tracer import (
+    STATUS_ERROR,
+    STATUS_OK,
+    BatchSpanProcessor,
+    JsonFileExporter,
+    Span,
+    SpanExporter,
+    Tracer,
+    current_span,
+    to_otlp,
+    tracer,
+)
+
+
+class _ListExporter(SpanExporter):
+    def __init__(self):
+        self.spans: list[Span] = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+class _SyncProcessor:
+    def __init__(self):
+        self.spans: list[Span] = []
+
+    def on_end(self, span):
+        self.spans.append(span)
+
+    def shutdown(self):
+        pass
+
+
+class TestTracer:
+    def test_children_share_trace_and_link_to_parent(self):
+        processor = _SyncProcessor()
+        tracer = Tracer(processor)
+        with tracer.span("root", file_count=2) as root:
+            with tracer.span("child", model="m"):
+                pass
+        child, recorded_root = processor.spans
+        assert recorded_root is root
+        assert child.trace_id == root.trace_id and len(root.trace_id) == 32
+        assert child.parent_id == root.span_id
+        assert root.parent_id is None
+        assert child.attributes == {"model": "m"}
+        assert root.status == STATUS_OK
+        assert root.end_ns >= root.start_ns
+
+    def test_context_propagates_into_gathered_tasks(self):
+        processor = _SyncProcessor()
+        tracer = Tracer(processor)
+
+        async def call(name):
+            with tracer.span(name):
+                await asyncio.sleep(0)
+
+        async def run():
+            with tracer.span("root") as root:
+                await asyncio.gather(call("a"), call("b"))
+            return root
+
+        root = asyncio.run(run())
+        children = [s for s in processor.spans if s.name in ("a", "b")]
+        assert {s.parent_id for s in children} == {root.span_id}
+        assert current_span() is None
+
+    def test_exception_marks_error(self):
+        processor = _SyncProcessor()
+        tracer = Tracer(processor)
+        try:
+            with tracer.span("fail"):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+        assert processor.spans[0].status == STATUS_ERROR
+        assert "boom" in processor.spans[0].status_message
+
+    def test_sampling_is_decided_at_root(self):
+        processor = _SyncProcessor()
+        tracer = Tracer(processor, sample_rate=0.0)
+        with tracer.span("root"):
+            with tracer.span("child") as child:
+                child.set_attribute("ignored", 1)
+        assert processor.spans == []
+        assert child.attributes == {}
+
+    def test_disabled_tracer_records_nothing(self):
+        with Tracer(None).span("root") as span:
+            span.set_attribute("a", 1)
+        assert not span.sampled
+
+
+class TestExport:
+    def test_batch_processor_flushes_on_shutdown(self):
+        exporter = _ListExporter()
+        processor = BatchSpanProcessor(exporter, interval=60)
+        tracer = Tracer(processor)
+        for i in range(3):
+            with tracer.span(f"s{i}"):
+                pass
+        processor.shutdown()
+        assert [s.name for s in exporter.spans] == ["s0", "s1", "s2"]
+
+    def test_json_file_exporter(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        processor = _SyncProcessor()
+        with Tracer(processor).span("root", company="ntt"):
+            pass
+        JsonFileExporter(str(path)).export(processor.spans)
+        record = json.loads(path.read_text(encoding="utf-8").splitlines()[0])
+        assert record["name"] == "root"
+        assert record["attributes"] == {"company": "ntt"}
+
+    def test_otlp_payload(self):
+        processor = _SyncProcessor()
+        with Tracer(processor).span("root", bytes=10, ratio=0.5, streaming=True, companies=["ntt"]):
+            pass
+        span = to_otlp(processor.spans)["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        values = {a["key"]: a["value"] for a in span["attributes"]}
+        assert values["bytes"] == {"intValue": "10"}
+        assert values["ratio"] == {"doubleValue": 0.5}
+        assert values["streaming"] == {"boolValue": True}
+        assert values["companies"] == {"arrayValue": {"values": [{"stringValue": "ntt"}]}}
+        assert span["status"]["code"] == 1
+        assert span["parentSpanId"] == ""
+
+
+class TestPipelineSpans:
+    def test_process_bill_produces_one_trace(self, monkeypatch):
+        processor = _SyncProcessor()
+        monkeypatch.setattr(tracer, "processor", processor)
+        monkeypatch.setattr(tracer, "sample_rate", 1.0)
+        config = BenchConfig(
+            target=TARGET_PROCESS_BILL,
+            requests=1,
+            concurrency=1,
+            ocr=BackendProfile(),
+            analysis=BackendProfile(),
+            drive=BackendProfile(),
+            rows=3,
+        )
+        result = asyncio.run(run_benchmark(config))
+        assert result["summary"]["succeeded"] == 1
+
+        names = {s.name for s in processor.spans}
+        assert {
+            "process_bill",
+            "ocr_extract",
+            "gemini.generate_content",
+            "route",
+            "openai.chat.completions",
+            "xlsx.write",
+            "drive.upload",
+        } <= names
+        assert len({s.trace_id for s in processor.spans}) == 1
+        root = next(s for s in processor.spans if s.name == "process_bill")
+        assert root.parent_id is None
+        by_id = {s.span_id: s for s in processor.spans}
+        upload = next(s for s in processor.spans if s.name == "drive.upload")
+        assert by_id[upload.parent_id] is root
@@ -0,0 +1,85 @@
+import mmap
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from src.config import settings
+from src.workflow.uploads import UploadRejectedError, close_uploads, receive_uploads
+
+app = FastAPI()
+
+
+@app.post("/upload")
+async def upload(request: Request):
+    try:
+        uploads = await receive_uploads(request)
+    except UploadRejectedError as e:
+        return {"error": str(e)}
+    try:
+        return {
+            "files": [
+                {
+                    "filename": u.filename,
+                    "size": u.size,
+                    "mmap": isinstance(u.content(), mmap.mmap),
+                    "head": bytes(u.content()[:4]).hex(),
+                }
+                for u in uploads
+            ]
+        }
+    finally:
+        close_uploads(uploads)
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "max_upload_file_bytes", 1000)
+    monkeypatch.setattr(settings, "max_upload_request_bytes", 1500)
+    monkeypatch.setattr(settings, "upload_spool_max_memory", 100)
+
+
+class TestReceiveUploads:
+    def test_small_and_spooled_files(self):
+        files = [
+            ("files", ("明細.pdf", b"%PDF" + b"0" * 10, "application/pdf")),
+            ("files", ("b.png", b"\x89PNG" + b"0" * 500, "image/png")),
+        ]
+        data = client.post("/upload", files=files).json()
+        assert data["files"] == [
+            {"filename": "明細.pdf", "size": 14, "mmap": False, "head": b"%PDF".hex()},
+            {"filename": "b.png", "size": 504, "mmap": True, "head": b"\x89PNG".hex()},
+        ]
+
+    def test_file_too_large(self):
+        files = [("files", ("a.pdf", b"0" * 1001, "application/pdf"))]
+        assert "1ファイルあたり" in client.post("/upload", files=files).json()["error"]
+
+    def test_request_too_large(self):
+        files = [
+            ("files", ("a.pdf", b"0" * 800, "application/pdf")),
+            ("files", ("b.pdf", b"0" * 800, "application/pdf")),
+        ]
+        assert "合計サイズ" in client.post("/upload", files=files).json()["error"]
+
+    def test_unsupported_extension(self):
+        files = [("files", ("a.exe", b"0", "application/octet-stream"))]
+        assert "a.exe" in client.post("/upload", files=files).json()["error"]
+
+    def test_too_many_files(self, monkeypatch):
+        monkeypatch.setattr(settings, "max_file_count", 1)
+        files = [
+            ("files", ("a.pdf", b"0", "application/pdf")),
+            ("files", ("b.pdf", b"0", "application/pdf")),
+        ]
+        assert "1枚まで" in client.post("/upload", files=files).json()["error"]
+
+    def test_no_files(self):
+        response = client.post("/upload", files={"comment": (None, "1")})
+        assert "選択されていません" in response.json()["error"]
+
+    def test_not_multipart(self):
+        assert "読み込めません" in client.post("/upload", data={"x": "1"}).json()["error"]
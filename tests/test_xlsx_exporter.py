@@ -3,7 +3,14 @@ import io
 import pytest
 from openpyxl import load_workbook
 
-from src.export.xlsx_exporter import markdown_to_xlsx
+from src.export.xlsx_exporter import (
+    markdown_to_xlsx,
+    markdown_to_xlsx_file,
+    parse_amount,
+    sheet_title,
+    write_xlsx,
+    write_xlsx_sheets,
+)
 
 
 class TestMarkdownToXlsx:
@@ -21,12 +28,13 @@ class TestMarkdownToXlsx:
         wb = load_workbook(io.BytesIO(xlsx_bytes))
         ws = wb.active
         rows = list(ws.iter_rows(values_only=True))
-        # ヘッダー行 + 2データ行 = 3行
-        assert len(rows) == 3
+        # ヘッダー行 + 2データ行 + 合計行 = 4行
+        assert len(rows) == 4
         assert rows[0] == ("番号", "サービス", "金額(円)", "備考")
         assert rows[1][0] == "03-1234-5678"
         assert rows[1][1] == "基本料"
-        assert rows[1][2] == "1800"
+        assert rows[1][2] == 1800
+        assert rows[3] == ("合計", None, 2200, None)
 
     def test_empty_raises(self):
         with pytest.raises(ValueError):
@@ -36,3 +44,103 @@ class TestMarkdownToXlsx:
         md = "| --- | --- | --- | --- |"
         with pytest.raises(ValueError):
             markdown_to_xlsx(md)
+
+
+class TestWriteXlsx:
+    def test_streams_line_iterator(self):
+        def lines():
+            yield "| 番号 | サービス | 金額(円) | 備考 |"
+            yield "| --- | --- | --- | --- |"
+            for i in range(5000):
+                yield f"| 03-0000-{i:04d} | 基本料 | {i} |  |"
+
+        buf = io.BytesIO()
+        assert write_xlsx(lines(), buf) == 5001
+
+        ws = load_workbook(io.BytesIO(buf.getvalue())).active
+        # データ行 + 合計行
+        assert ws.max_row == 5002
+        assert ws.cell(row=5002, column=3).value == sum(range(5000))
+        assert ws.cell(row=5001, column=1).value == "03-0000-4999"
+
+    def test_empty_raises(self):
+        with pytest.raises(ValueError):
+            write_xlsx(iter(["| --- | --- |"]), io.BytesIO())
+
+
+class TestMarkdownToXlsxFile:
+    def test_returns_rewound_file(self):
+        md = "| a | b | c | d |\n| --- | --- | --- | --- |\n| 1 | 2 | 3 | 4 |\n"
+        with markdown_to_xlsx_file(md) as f:
+            assert f.tell() == 0
+            rows = list(load_workbook(f).active.iter_rows(values_only=True))
+        assert rows == [("a", "b", "c", "d"), ("1", "2", "3", "4")]
+
+
+class TestColumnSchema:
+    MD = """\
+| 番号 | サービス | 金額(円) | 備考 |
+| --- | --- | --- | --- |
+| 03-1234-5678 | 基本料 | 1,800 |  |
+| 03-1234-5678 | 割引 | -1234 |  |
+| 03-1234-5678 | 調整額 | △500 |  |
+| 03-1234-5678 | 通話料 | 別途 |  |
+"""
+
+    def test_amounts_are_integers_with_format(self):
+        ws = load_workbook(io.BytesIO(markdown_to_xlsx(self.MD))).active
+        assert [ws.cell(row=r, column=3).value for r in range(2, 6)] == [1800, -1234, -500, "別途"]
+        assert ws.cell(row=2, column=3).number_format == "#,##0;-#,##0"
+        # 番号列は文字列のまま
+        assert ws.cell(row=2, column=1).value == "03-1234-5678"
+
+    def test_totals_row_sums_numeric_cells(self):
+        ws = load_workbook(io.BytesIO(markdown_to_xlsx(self.MD))).active
+        assert ws.cell(row=6, column=1).value == "合計"
+        assert ws.cell(row=6, column=3).value == 1800 - 1234 - 500
+        assert ws.cell(row=6, column=1).font.bold
+
+    def test_column_widths_and_frozen_header(self):
+        ws = load_workbook(io.BytesIO(markdown_to_xlsx(self.MD))).active
+        assert ws.column_dimensions["B"].width == 36
+        assert ws.freeze_panes == "A2"
+
+
+class TestParseAmount:
+    @pytest.mark.parametrize(
+        "value, expected",
+        [
+            ("1800", 1800),
+            ("-1234", -1234),
+            ("1,234円", 1234),
+            ("１，８００", 1800),
+            ("¥500", 500),
+            ("△1,234", -1234),
+            ("▲20", -20),
+            ("(300)", -300),
+            ("−12", -12),
+        ],
+    )
+    def test_parses(self, value, expected):
+        assert parse_amount(value) == expected
+
+    @pytest.mark.parametrize("value", ["", "無料", "1.5", "-"])
+    def test_unparseable_returns_none(self, value):
+        assert parse_amount(value) is None
+
+
+class TestSheets:
+    def test_sheet_title(self):
+        used: set[str] = set()
+        assert sheet_title("顧客A/2025:09", used) == "顧客A_2025_09"
+        assert sheet_title("顧客a/2025:09", used) == "顧客a_2025_09 (2)"
+        assert len(sheet_title("x" * 40, used)) == 31
+
+    def test_write_xlsx_sheets(self):
+        md = "| 番号 | サービス | 金額(円) | 備考 |\n| --- | --- | --- | --- |\n| 1 | 基本料 | 100 |  |"
+        buf = io.BytesIO()
+        counts = write_xlsx_sheets([("A", md.splitlines()), ("A", md.splitlines())], buf)
+        assert counts == {"A": 2, "A (2)": 2}
+        wb = load_workbook(io.BytesIO(buf.getvalue()))
+        assert wb.sheetnames == ["A", "A (2)"]
+        assert list(wb["A (2)"].values)[-1] == ("合計", None, 100, None)